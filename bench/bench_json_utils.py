@@ -0,0 +1,70 @@
+# bench_json_utils.py
+#
+# Benchmarks json_utils.normalize_json on synthetic sing-box configs.
+# Usage: python bench/bench_json_utils.py [outbound counts...]
+# Prints one JSON object per run, e.g. {"bench": "normalize_json", "outbounds": 20000, ...}
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from json_utils import normalize_json
+
+DEFAULT_COUNTS = [100, 1000, 10000, 50000]
+
+
+def make_config(outbound_count: int) -> str:
+    """Builds a JSONC config with comments, trailing commas and tricky strings."""
+    parts = [
+        '{\n',
+        '  // generated by bench_json_utils.py\n',
+        '  "log": {"level": "info", },\n',
+        '  "inbounds": [{"type": "mixed", "listen": "127.0.0.1", "listen_port": 2080, }],\n',
+        '  "outbounds": [\n',
+    ]
+    tags = []
+    for index in range(outbound_count):
+        tag = f'node-{index:06d}'
+        tags.append(tag)
+        parts.append(
+            f'    /* node {index} */ {{"type": "vless", "tag": "{tag}", "server": "n{index}.example.com", '
+            f'"server_port": 443, "uuid": "00000000-0000-0000-0000-{index:012d}", '
+            f'"tls": {{"enabled": true, "server_name": "https://cdn.example.com/a//b,c", }}, }}, // {tag}\n'
+        )
+    parts.append('    {"type": "selector", "tag": "proxy", "outbounds": ' + json.dumps(tags) + ', },\n')
+    parts.append('  ],\n')
+    parts.append('  "experimental": {"clash_api": {"external_controller": "127.0.0.1:9090", }, },\n')
+    parts.append('}\n')
+    return ''.join(parts)
+
+
+def bench(outbound_count: int, repeat: int = 3) -> dict:
+    text = make_config(outbound_count)
+    best_normalize = best_loads = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        normalized = normalize_json(text)
+        best_normalize = min(best_normalize, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        json.loads(normalized)
+        best_loads = min(best_loads, time.perf_counter() - started)
+
+    size_mb = len(text.encode('utf-8')) / (1024 * 1024)
+    return {
+        'bench': 'normalize_json',
+        'outbounds': outbound_count,
+        'size_mb': round(size_mb, 3),
+        'normalize_ms': round(best_normalize * 1000, 2),
+        'normalize_mb_per_s': round(size_mb / best_normalize, 1),
+        'json_loads_ms': round(best_loads * 1000, 2),
+    }
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or DEFAULT_COUNTS
+    for count in counts:
+        print(json.dumps(bench(count)))
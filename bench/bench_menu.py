@@ -0,0 +1,98 @@
+# bench_menu.py
+#
+# Measures tray menu construction for large selectors: the time and memory
+# needed to build the menu and to walk it once the way a pystray backend does.
+# Usage: python bench/bench_menu.py [outbound counts...]
+# Prints one JSON object per run and layout.
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from pystray import Menu
+
+from config_types import ConfigSelector, SingBoxConfig
+from drover import DroverOptions
+from main import MainApp
+
+DEFAULT_COUNTS = [1000, 10000]
+
+
+class BenchDrover:
+    """The parts of Drover the menu builders use, without sing-box behind them."""
+    def __init__(self, outbound_count: int, page_size: int):
+        names = [f'{("US", "DE", "JP", "SG", "NL")[index % 5]}-{index:05d}' for index in range(outbound_count)]
+        selectors = [ConfigSelector('proxy', names, 0, names[0]),
+                     ConfigSelector('streaming', names[:outbound_count // 2], 0, names[0])]
+        self.sb_config = SingBoxConfig('127.0.0.1:9090', '', selectors, '127.0.0.1', 2080)
+        self.options = DroverOptions('', '', selector_menu_layout='nested', menu_page_size=page_size)
+        self.connection_monitor = None
+        self.delays = {name: 50 + index % 400 for index, name in enumerate(names[::7])}
+
+    def get_selected(self, name: str) -> str:
+        return self.sb_config.get_selector(name).default_name
+
+    def get_outbound_delay(self, name: str):
+        return self.delays.get(name)
+
+    def is_auto_select(self, name: str) -> bool:
+        return False
+
+
+class BenchIcon:
+    def update_menu(self):
+        pass
+
+
+def walk(items) -> int:
+    """Evaluates every visible item like a backend building the native menu."""
+    count = 0
+    for item in items:
+        if item is Menu.SEPARATOR:
+            continue
+        count += 1
+        item.text
+        item.checked
+        if item.submenu:
+            count += walk(item.submenu.items)
+    return count
+
+
+def bench(outbound_count: int, layout: str, page_size: int) -> dict:
+    app = MainApp.__new__(MainApp)
+    app.drover = BenchDrover(outbound_count, page_size)
+    app.is_system_proxy_enabled = False
+    app.selector_sections = {}
+    app.tray_icon = BenchIcon()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    items = app.create_menu_items()
+    built = time.perf_counter()
+    native_items = walk(items)
+    walked = time.perf_counter()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'bench': 'menu',
+        'layout': layout,
+        'outbounds': outbound_count,
+        'build_ms': round((built - started) * 1000, 2),
+        'walk_ms': round((walked - built) * 1000, 2),
+        'native_items': native_items,
+        'retained_kb': round(current / 1024, 1),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or DEFAULT_COUNTS
+    for count in counts:
+        # 'eager' puts every outbound in the menu, like the original implementation
+        print(json.dumps(bench(count, 'eager', page_size=count)))
+        print(json.dumps(bench(count, 'lazy', page_size=50)))
@@ -0,0 +1,99 @@
+# fake_singbox.py
+#
+# Stand-in for the sing-box executable, for benchmarks and manual testing.
+# `fake_singbox.py run -c config.json` serves the mock Clash API on the
+# config's external_controller until terminated; `check -c config.json`
+# and `version` behave like the real commands. Behaviour is tuned with
+# MOCK_CLASH_* environment variables (see mock_clash_api.MockSettings) plus
+# MOCK_SINGBOX_STARTUP_MS, a delay before the controller starts listening.
+#
+# install_fake_singbox() writes a `sing-box` launcher into a directory, which
+# Drover then finds through its `sb_dir` option or PATH (POSIX only).
+
+import os
+import signal
+import stat
+import sys
+import time
+from typing import List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from mock_clash_api import MockSettings, selectors_from_config, serve
+
+
+def read_config(path: str) -> dict:
+    from json_utils import loads_jsonc
+    with open(path, 'r', encoding='utf-8') as f:
+        return loads_jsonc(f.read())
+
+
+def config_path(args: List[str]) -> str:
+    for flag in ('-c', '--config'):
+        if flag in args and args.index(flag) + 1 < len(args):
+            return args[args.index(flag) + 1]
+    return 'config.json'
+
+
+def main(args: List[str]) -> int:
+    command = args[0] if args else ''
+    if command == 'version':
+        print('sing-box version 0.0.0-fake')
+        return 0
+
+    if command not in ('run', 'check'):
+        print(f'FATAL unknown command: {command}', file=sys.stderr)
+        return 1
+
+    try:
+        config = read_config(config_path(args))
+    except (OSError, ValueError) as e:
+        print(f'FATAL[0000] decode config: {e}', file=sys.stderr)
+        return 1
+    if command == 'check':
+        return 0
+
+    startup_ms = float(os.environ.get('MOCK_SINGBOX_STARTUP_MS', '0'))
+    if startup_ms > 0:
+        time.sleep(startup_ms / 1000)
+
+    controller = (config.get('experimental') or {}).get('clash_api', {}).get('external_controller', '')
+    server = None
+    if controller:
+        try:
+            server = serve(controller, selectors_from_config(config), MockSettings.from_env(os.environ))
+        except OSError as e:
+            print(f'FATAL[0000] start clash api: {e}', file=sys.stderr)
+            return 1
+    print(f'INFO[0000] sing-box started (fake, controller {controller or "disabled"})', flush=True)
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    try:
+        while not stopping:
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    if server is not None:
+        server.stop()
+    return 0
+
+
+def install_fake_singbox(directory: str, python: str = sys.executable) -> str:
+    """Writes an executable `sing-box` launcher for this script into `directory`."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'sing-box')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'#!{python}\n'
+                f'import sys\n'
+                f'sys.path.insert(0, {BENCH_DIR!r})\n'
+                f'from fake_singbox import main\n'
+                f'sys.exit(main(sys.argv[1:]))\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,228 @@
+# mock_clash_api.py
+#
+# A local stand-in for the sing-box Clash API, used by the benchmarks.
+# Serves /version, /proxies, /proxies/{name} (PUT), /proxies/{name}/delay,
+# /connections (GET/DELETE) and a /traffic stream, with configurable latency,
+# failure rate and payload sizes. Standard library only.
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlsplit
+
+
+class MockSettings:
+    """Knobs of the stand-in; every field can also be set from MOCK_CLASH_* environment variables."""
+    def __init__(self, latency_ms: float = 0.0, failure_rate: float = 0.0, connections: int = 100,
+                 delay_ms: int = 80, delay_jitter_ms: int = 40, traffic_interval: float = 1.0, seed: int = 1):
+        self.latency_ms: float = latency_ms # added before every response
+        self.failure_rate: float = failure_rate # share of requests answered with 503
+        self.connections: int = connections # entries in GET /connections
+        self.delay_ms: int = delay_ms # reported outbound delay ...
+        self.delay_jitter_ms: int = delay_jitter_ms # ... plus up to this much
+        self.traffic_interval: float = traffic_interval # seconds between /traffic samples
+        self.seed: int = seed
+
+    @classmethod
+    def from_env(cls, env: Dict[str, str]) -> 'MockSettings':
+        settings = cls()
+        for name, value in vars(settings).items():
+            raw = env.get(f'MOCK_CLASH_{name.upper()}')
+            if raw is not None:
+                setattr(settings, name, type(value)(raw))
+        return settings
+
+    def to_env(self) -> Dict[str, str]:
+        return {f'MOCK_CLASH_{name.upper()}': str(value) for name, value in vars(self).items()}
+
+
+class MockClashState:
+    """Groups and counters shared by all request handlers."""
+    def __init__(self, selectors: Dict[str, List[str]], settings: MockSettings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.random = random.Random(settings.seed)
+        self.selectors: Dict[str, List[str]] = selectors
+        self.now: Dict[str, str] = {name: outbounds[0] for name, outbounds in selectors.items() if outbounds}
+        self.outbounds: List[str] = sorted({name for outbounds in selectors.values() for name in outbounds})
+        self.requests: Dict[str, int] = {}
+        # Set whenever a selector changes, for benchmarks waiting on PUTs
+        self.changed = threading.Condition(self.lock)
+        self.puts: int = 0
+
+    def count(self, key: str):
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def wait_for_puts(self, count: int, timeout: float) -> bool:
+        """Waits until at least `count` selector PUTs were received in total."""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.puts >= count, timeout)
+
+    def proxies(self) -> dict:
+        proxies = {name: {'type': 'Selector', 'name': name, 'now': self.now.get(name, ''),
+                          'all': outbounds, 'history': []}
+                   for name, outbounds in self.selectors.items()}
+        for name in self.outbounds:
+            proxies.setdefault(name, {'type': 'VLESS', 'name': name, 'history': []})
+        return {'proxies': proxies}
+
+    def connections(self) -> dict:
+        count = self.settings.connections
+        outbounds = self.outbounds or ['direct']
+        groups = list(self.selectors) or ['proxy']
+        started = int(time.time())
+        connections = [{
+            'id': f'00000000-0000-0000-0000-{index:012d}',
+            'metadata': {'network': 'tcp', 'type': 'mixed', 'sourceIP': '127.0.0.1', 'sourcePort': str(40000 + index),
+                         'destinationIP': f'10.0.{index // 256 % 256}.{index % 256}', 'destinationPort': '443',
+                         'host': f'host{index % 50}.example.com'},
+            'upload': (started + index) * 3 % 1000000,
+            'download': (started + index) * 17 % 10000000,
+            'start': '2024-01-01T00:00:00Z',
+            'chains': [outbounds[index % len(outbounds)], groups[index % len(groups)]],
+            'rule': 'final',
+            'rulePayload': ''
+        } for index in range(count)]
+        return {'downloadTotal': 0, 'uploadTotal': 0, 'connections': connections}
+
+
+class MockClashHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'MockClashServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: Optional[object] = None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _prepare(self) -> bool:
+        """Applies the configured latency and failures; returns False if the request was failed."""
+        settings = self.server.state.settings
+        if settings.latency_ms > 0:
+            time.sleep(settings.latency_ms / 1000)
+        if settings.failure_rate > 0 and self.server.state.random.random() < settings.failure_rate:
+            self._send(503, {'message': 'mock failure'})
+            return False
+        return True
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def do_GET(self):
+        state = self.server.state
+        path = urlsplit(self.path).path
+        state.count(f'GET {path.split("/")[1] if "/" in path else path}')
+        if path == '/traffic':
+            self._stream_traffic()
+            return
+        if not self._prepare():
+            return
+
+        if path == '/version':
+            self._send(200, {'version': 'mock', 'premium': False, 'meta': True})
+        elif path == '/proxies':
+            with state.lock:
+                self._send(200, state.proxies())
+        elif path == '/connections':
+            self._send(200, state.connections())
+        elif path.startswith('/proxies/') and path.endswith('/delay'):
+            settings = state.settings
+            delay = settings.delay_ms + state.random.randint(0, max(0, settings.delay_jitter_ms))
+            self._send(200, {'delay': delay})
+        else:
+            self._send(404, {'message': 'not found'})
+
+    def do_PUT(self):
+        state = self.server.state
+        path = urlsplit(self.path).path
+        body = self._read_body()
+        state.count('PUT proxies')
+        if not self._prepare():
+            return
+        if not path.startswith('/proxies/'):
+            self._send(404, {'message': 'not found'})
+            return
+
+        name = unquote(path[len('/proxies/'):])
+        try:
+            value = json.loads(body or b'{}').get('name', '')
+        except ValueError:
+            self._send(400, {'message': 'bad body'})
+            return
+        with state.changed:
+            if name not in state.selectors or value not in state.selectors[name]:
+                self._send(400, {'message': 'unknown selector or outbound'})
+                return
+            state.now[name] = value
+            state.puts += 1
+            state.changed.notify_all()
+        self._send(204)
+
+    def do_DELETE(self):
+        self._read_body()
+        self.server.state.count('DELETE connections')
+        if self._prepare():
+            self._send(204)
+
+    def _stream_traffic(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        interval = self.server.state.settings.traffic_interval
+        rng = random.Random()
+        try:
+            while not self.server.stopping.is_set():
+                line = json.dumps({'up': rng.randint(0, 200000), 'down': rng.randint(0, 5000000)}) + '\n'
+                data = line.encode('utf-8')
+                self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+                self.wfile.flush()
+                if self.server.stopping.wait(interval):
+                    break
+        except OSError:
+            pass
+        self.close_connection = True
+
+
+class MockClashServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, state: MockClashState):
+        super().__init__(address, MockClashHandler)
+        self.state = state
+        self.stopping = threading.Event()
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name='mock-clash-api', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopping.set()
+        self.shutdown()
+        self.server_close()
+
+
+def selectors_from_config(config: dict) -> Dict[str, List[str]]:
+    return {item.get('tag', ''): list(item.get('outbounds') or [])
+            for item in config.get('outbounds') or [] if item.get('type') == 'selector'}
+
+
+def serve(controller: str, selectors: Dict[str, List[str]], settings: MockSettings) -> MockClashServer:
+    """Starts a stand-in on `controller` ("host:port") in a background thread."""
+    host, _, port = controller.rpartition(':')
+    server = MockClashServer((host or '127.0.0.1', int(port)), MockClashState(selectors, settings))
+    server.start()
+    return server
@@ -0,0 +1,349 @@
+# run_benchmarks.py
+#
+# End-to-end benchmarks against the fake sing-box (fake_singbox.py) and the
+# mock Clash API (mock_clash_api.py):
+#   cold_start       Drover() until the Clash API answers
+#   read_config      load_singbox_config() on 1 KB .. 10 MB configs, cold and cached
+#   selector_switch  edit_selector() until the change is confirmed
+#   reset_selectors  reset_selectors() with 100 selectors until all are applied
+#   menu             tray menu construction with 10k outbounds (see bench_menu.py)
+#   subscriptions    merging a 20k-node share link list: cold, unchanged and 50 changed
+#
+# Usage: python bench/run_benchmarks.py [--only NAME ...] [--output results.json]
+#                                        [--compare baseline.json] [--threshold 1.2]
+# Prints one JSON object per result to stdout; anything else, including what
+# the code under test prints, goes to stderr. --output writes all results plus
+# the environment to a file; --compare exits with 1 if any result's "ms" got
+# slower than the baseline's by more than the threshold factor. POSIX only (the
+# fake sing-box is a script launcher).
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from bench_json_utils import make_config
+from fake_singbox import install_fake_singbox
+from mock_clash_api import MockSettings
+
+CONFIG_SIZES = [1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def summary(name: str, samples: List[float], **params) -> dict:
+    """Result record: median, min and max in milliseconds plus the parameters of the run."""
+    samples_ms = [sample * 1000 for sample in samples]
+    return {
+        'bench': name,
+        'params': params,
+        'ms': round(statistics.median(samples_ms), 3),
+        'min_ms': round(min(samples_ms), 3),
+        'max_ms': round(max(samples_ms), 3),
+        'runs': len(samples_ms),
+    }
+
+
+class FakeSingBox:
+    """A temporary directory with a fake sing-box, a config for it and Drover options pointing there."""
+    def __init__(self, selector_count: int = 4, outbounds_per_selector: int = 20,
+                 settings: Optional[MockSettings] = None):
+        self.directory = tempfile.mkdtemp(prefix='singdrover-bench-')
+        install_fake_singbox(self.directory)
+        self.settings = settings or MockSettings()
+        self.config_path = os.path.join(self.directory, 'config.json')
+        self.selectors: Dict[str, List[str]] = {
+            f'group-{index:03d}': [f'node-{index:03d}-{node:03d}' for node in range(outbounds_per_selector)]
+            for index in range(selector_count)
+        }
+
+        outbounds = [{'type': 'selector', 'tag': name, 'outbounds': nodes, 'default': nodes[0]}
+                     for name, nodes in self.selectors.items()]
+        outbounds += [{'type': 'direct', 'tag': node} for nodes in self.selectors.values() for node in nodes]
+        config = {
+            'inbounds': [{'type': 'mixed', 'listen': '127.0.0.1', 'listen_port': free_port()}],
+            'outbounds': outbounds,
+            'experimental': {'clash_api': {'external_controller': f'127.0.0.1:{free_port()}'}},
+        }
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+
+    def options(self):
+        from drover import DroverOptions
+        return DroverOptions(
+            self.config_path, self.directory, system_proxy_auto=False,
+            config_cache_dir=os.path.join(self.directory, 'cache'), config_watch=False,
+            traffic_icon=False, connection_monitor=False, state_sync_max_interval=5.0
+        )
+
+    def start(self):
+        from drover import Drover
+        os.environ.update(self.settings.to_env())
+        drover = Drover(self.options())
+        if drover.singbox_start_error:
+            drover.stop_singbox()
+            raise RuntimeError(drover.singbox_start_error)
+        return drover
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ChangeWaiter:
+    """Collects state_sync change notifications so a benchmark can wait for specific values."""
+    def __init__(self, drover):
+        self.condition = threading.Condition()
+        self.seen: Dict[str, str] = {}
+        drover.state_sync.on_change = self.on_change
+
+    def on_change(self, diff: Dict[str, str]):
+        with self.condition:
+            self.seen.update(diff)
+            self.condition.notify_all()
+
+    def wait(self, wanted: Dict[str, str], timeout: float = 10.0) -> bool:
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: all(self.seen.get(name) == value for name, value in wanted.items()), timeout)
+
+
+def bench_cold_start(repeat: int = 5) -> List[dict]:
+    samples, ready = [], []
+    for _ in range(repeat):
+        fake = FakeSingBox()
+        try:
+            started = time.perf_counter()
+            drover = fake.start()
+            samples.append(time.perf_counter() - started)
+            ready.append(drover.ready_time or 0.0)
+            drover.stop_singbox()
+        finally:
+            fake.remove()
+    result = summary('cold_start', samples)
+    result['ready_ms'] = round(statistics.median(ready) * 1000, 3)
+    return [result]
+
+
+def bench_read_config(sizes: List[int] = CONFIG_SIZES, repeat: int = 3) -> List[dict]:
+    from config_loader import ConfigCache, load_singbox_config
+
+    results = []
+    directory = tempfile.mkdtemp(prefix='singdrover-bench-')
+    try:
+        for size in sizes:
+            # make_config() produces roughly 270 bytes per outbound
+            text = make_config(max(1, (size - 400) // 270))
+            path = os.path.join(directory, f'config-{size}.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            actual = os.path.getsize(path)
+
+            cold = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                load_singbox_config(path, None)
+                cold.append(time.perf_counter() - started)
+            results.append(summary('read_config', cold, size=size, bytes=actual, cache=False))
+
+            # A config edited within the mtime granularity is hashed on every load;
+            # age it the way a config looks when the app is restarted later
+            aged_ns = time.time_ns() - 60 * 1_000_000_000
+            os.utime(path, ns=(aged_ns, aged_ns))
+            cache = ConfigCache(os.path.join(directory, 'cache'))
+            load_singbox_config(path, cache)
+            warm = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                load_singbox_config(path, cache)
+                warm.append(time.perf_counter() - started)
+            results.append(summary('read_config', warm, size=size, bytes=actual, cache=True))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def bench_selector_switch(repeat: int = 50, latency_ms: float = 0.0) -> List[dict]:
+    fake = FakeSingBox(selector_count=1, settings=MockSettings(latency_ms=latency_ms))
+    drover = fake.start()
+    try:
+        waiter = ChangeWaiter(drover)
+        name, nodes = next(iter(fake.selectors.items()))
+        samples = []
+        for index in range(repeat):
+            value = nodes[(index + 1) % len(nodes)]
+            started = time.perf_counter()
+            drover.edit_selector(name, value)
+            if not waiter.wait({name: value}):
+                raise RuntimeError(f'selector switch to {value} was not confirmed')
+            samples.append(time.perf_counter() - started)
+    finally:
+        drover.stop_singbox()
+        fake.remove()
+    return [summary('selector_switch', samples, latency_ms=latency_ms)]
+
+
+def bench_reset_selectors(selector_count: int = 100, repeat: int = 5) -> List[dict]:
+    from drover import SelectorThreadTask
+
+    fake = FakeSingBox(selector_count=selector_count)
+    drover = fake.start()
+    try:
+        waiter = ChangeWaiter(drover)
+        defaults = {name: nodes[0] for name, nodes in fake.selectors.items()}
+        others = {name: nodes[1] for name, nodes in fake.selectors.items()}
+        samples = []
+        for _ in range(repeat):
+            # Move everything off the defaults first, so the reset has something to do
+            drover.submit_selector_tasks([SelectorThreadTask(name, value) for name, value in others.items()])
+            if not waiter.wait(others):
+                raise RuntimeError('selectors were not moved off their defaults')
+
+            started = time.perf_counter()
+            drover.reset_selectors()
+            if not waiter.wait(defaults):
+                raise RuntimeError('reset_selectors was not confirmed')
+            samples.append(time.perf_counter() - started)
+    finally:
+        drover.stop_singbox()
+        fake.remove()
+    return [summary('reset_selectors', samples, selectors=selector_count)]
+
+
+def bench_menu(outbound_count: int = 10000, repeat: int = 3) -> List[dict]:
+    import bench_menu
+
+    results = []
+    for layout, page_size in (('eager', outbound_count), ('lazy', 50)):
+        runs = [bench_menu.bench(outbound_count, layout, page_size) for _ in range(repeat)]
+        result = summary('menu', [(run['build_ms'] + run['walk_ms']) / 1000 for run in runs],
+                         outbounds=outbound_count, layout=layout)
+        result['native_items'] = runs[0]['native_items']
+        result['retained_kb'] = runs[0]['retained_kb']
+        results.append(result)
+    return results
+
+
+def make_links(node_count: int, changed: int = 0, generation: int = 0) -> str:
+    """Share link list; the first `changed` nodes get a password of the given generation."""
+    lines = []
+    for index in range(node_count):
+        password = f'pw{index}-{generation}' if index < changed else f'pw{index}'
+        lines.append(f'trojan://{password}@n{index}.example.com:443?sni=n{index}.example.com&type=ws&path=%2Fws'
+                     f'#node-{index:06d}')
+    return '\n'.join(lines) + '\n'
+
+
+def bench_subscriptions(node_count: int = 20000, changed: int = 50, repeat: int = 3) -> List[dict]:
+    from subscriptions import SubscriptionManager
+
+    directory = tempfile.mkdtemp(prefix='singdrover-bench-')
+    try:
+        config_path = os.path.join(directory, 'config.json')
+        links_path = os.path.join(directory, 'nodes.txt')
+
+        def refresh(manager: SubscriptionManager, text: str) -> float:
+            with open(links_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            started = time.perf_counter()
+            manager.refresh()
+            return time.perf_counter() - started
+
+        spec = [{'path': links_path, 'selectors': ['proxy']}]
+        cold, unchanged, incremental = [], [], []
+        for run in range(repeat):
+            with open(config_path, 'w', encoding='utf-8') as f:
+                f.write(make_config(10))
+            shutil.rmtree(os.path.join(directory, 'state'), ignore_errors=True)
+            manager = SubscriptionManager(spec, config_path, os.path.join(directory, 'state'))
+            cold.append(refresh(manager, make_links(node_count)))
+            unchanged.append(refresh(manager, make_links(node_count)))
+            incremental.append(refresh(manager, make_links(node_count, changed, generation=run + 1)))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return [summary('subscriptions', cold, nodes=node_count, changed='all'),
+            summary('subscriptions', unchanged, nodes=node_count, changed=0),
+            summary('subscriptions', incremental, nodes=node_count, changed=changed)]
+
+
+BENCHMARKS: Dict[str, Callable[[], List[dict]]] = {
+    'cold_start': bench_cold_start,
+    'read_config': bench_read_config,
+    'selector_switch': bench_selector_switch,
+    'reset_selectors': bench_reset_selectors,
+    'menu': bench_menu,
+    'subscriptions': bench_subscriptions,
+}
+
+
+def result_key(result: dict) -> str:
+    return json.dumps([result['bench'], result['params']], sort_keys=True)
+
+
+def compare(results: List[dict], baseline_path: str, threshold: float) -> List[str]:
+    """Results slower than the baseline by more than `threshold` times."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result_key(result): result for result in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if previous and previous['ms'] > 0 and result['ms'] > previous['ms'] * threshold:
+            regressions.append(f"{result['bench']} {result['params']}: "
+                               f"{previous['ms']} ms -> {result['ms']} ms")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='SingDrover benchmarks')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--output', help='write all results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file written by --output')
+    parser.add_argument('--threshold', type=float, default=1.2, help='allowed slowdown factor')
+    args = parser.parse_args()
+
+    # stdout carries only the JSON lines; what Drover and friends print goes to stderr
+    records = sys.stdout
+    results: List[dict] = []
+    for name in args.only or BENCHMARKS:
+        with contextlib.redirect_stdout(sys.stderr):
+            bench_results = BENCHMARKS[name]()
+        for result in bench_results:
+            print(json.dumps(result), file=records, flush=True)
+            results.append(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'results': results,
+            }, f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
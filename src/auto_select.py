@@ -0,0 +1,153 @@
+# auto_select.py
+
+import heapq
+import random
+import time
+from threading import Thread, Condition
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from latency import LATENCY_FAILED
+
+if TYPE_CHECKING:
+    from drover import Drover
+
+
+class AutoSelectState:
+    """Per-selector bookkeeping of the auto mode."""
+    __slots__ = ('name', 'generation', 'last_switch')
+
+    def __init__(self, name: str, generation: int):
+        self.name: str = name
+        self.generation: int = generation
+        self.last_switch: float = 0.0
+
+
+class AutoSelector(Thread):
+    """
+    Keeps selectors in "auto" mode on their fastest outbound.
+    All selectors share this one scheduler thread: checks are kept in a heap
+    ordered by due time, each rescheduled with `interval` +/- `jitter` so that
+    the probes of different selectors do not line up.
+    A switch only happens when the best outbound beats the current one by the
+    hysteresis margin and the current choice was held for `min_hold` seconds,
+    unless the current outbound is dead, in which case it fails over at once.
+    """
+    def __init__(self, drover: 'Drover', interval: float = 60.0, jitter: float = 0.2,
+                 hysteresis_ms: int = 50, hysteresis_ratio: float = 0.2, min_hold: float = 120.0):
+        super().__init__(name='auto-select', daemon=True)
+        self.drover = drover
+        self.interval: float = interval
+        self.jitter: float = jitter
+        self.hysteresis_ms: int = hysteresis_ms
+        self.hysteresis_ratio: float = hysteresis_ratio
+        self.min_hold: float = min_hold
+
+        self.states: Dict[str, AutoSelectState] = {}
+        self._queue: List[Tuple[float, int, str]] = []
+        self._generation: int = 0
+        self._condition = Condition()
+        self._stopping: bool = False
+
+    def is_enabled(self, name: str) -> bool:
+        return name in self.states
+
+    def enable(self, name: str):
+        """Puts a selector in auto mode; its first check runs right away."""
+        with self._condition:
+            if name in self.states:
+                return
+            self._generation += 1
+            self.states[name] = AutoSelectState(name, self._generation)
+            heapq.heappush(self._queue, (time.monotonic(), self._generation, name))
+            self._condition.notify()
+
+    def disable(self, name: str):
+        """Leaves auto mode; a queued check of the selector is dropped when it comes due."""
+        with self._condition:
+            self.states.pop(name, None)
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                name = self._next_due()
+                if name is None:
+                    return
+
+            try:
+                self.check(name)
+            except Exception as e:
+                # A transient API or probe failure must not end the only scheduler thread
+                print(f"Auto-select check of '{name}' failed: {e}")
+
+            with self._condition:
+                state = self.states.get(name)
+                if state is not None:
+                    delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+                    heapq.heappush(self._queue, (time.monotonic() + delay, state.generation, name))
+
+    def _next_due(self) -> Optional[str]:
+        """Waits (with the condition held) for the next live check. Returns None when stopping."""
+        while not self._stopping:
+            if not self._queue:
+                self._condition.wait()
+                continue
+
+            due, generation, name = self._queue[0]
+            state = self.states.get(name)
+            if state is None or state.generation != generation:
+                # Disabled (or disabled and re-enabled) since it was queued
+                heapq.heappop(self._queue)
+                continue
+
+            timeout = due - time.monotonic()
+            if timeout > 0:
+                self._condition.wait(timeout)
+                continue
+
+            heapq.heappop(self._queue)
+            return name
+
+        return None
+
+    def check(self, name: str):
+        """Measures the outbounds of one selector and switches to the best one if worthwhile."""
+        selector = self.drover.get_selector(name)
+        if selector is None:
+            self.disable(name)
+            return
+
+        delays = self.drover.latency.probe_all(selector.outbounds, force=True)
+        alive = {outbound: delay for outbound, delay in delays.items() if delay != LATENCY_FAILED}
+        if not alive:
+            return
+
+        best = min(alive, key=alive.get)
+        current = self.drover.get_selected(name)
+        if best == current:
+            return
+
+        current_delay = alive.get(current) if current else None
+        if current_delay is not None:
+            state = self.states.get(name)
+            if state is None:
+                return
+            if time.monotonic() - state.last_switch < self.min_hold:
+                return
+            margin = max(self.hysteresis_ms, current_delay * self.hysteresis_ratio)
+            if alive[best] + margin > current_delay:
+                return
+
+        with self._condition:
+            state = self.states.get(name)
+            if state is None:
+                # The user picked an outbound by hand while we were probing
+                return
+            state.last_switch = time.monotonic()
+
+        print(f"Auto-select: switching '{name}' from '{current}' to '{best}' ({alive[best]} ms)")
+        self.drover.edit_selector(name, best, manual=False)
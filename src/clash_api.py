@@ -0,0 +1,208 @@
+# clash_api.py
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+# Methods the client knows how to send. All of them are idempotent on the
+# Clash API, so they are safe to retry.
+SUPPORTED_METHODS = ('GET', 'PUT', 'PATCH', 'DELETE')
+
+# Status codes that mean "try again later" rather than "you sent garbage".
+RETRY_STATUS_CODES = (502, 503, 504)
+
+
+def proxy_path(name: str) -> str:
+    """Returns the /proxies path of a proxy or group, with the tag safely quoted."""
+    return f'/proxies/{quote(name, safe="")}'
+
+
+def api_endpoint(path: str) -> str:
+    """Path without names or query, e.g. /proxies/a%20b/delay -> proxies/delay (a bounded metrics label)."""
+    parts = path.split('?', 1)[0].strip('/').split('/')
+    return f'{parts[0]}/{parts[-1]}' if len(parts) > 2 else parts[0]
+
+
+def selector_body(value: str) -> str:
+    """Encodes the {"name": value} body used by selector PUTs."""
+    return json.dumps({"name": value})
+
+
+class ClashApiClient:
+    """
+    Keep-alive client for the sing-box Clash API.
+    A single requests.Session is reused for every call, so selector changes go
+    over an already open connection instead of a fresh TCP handshake each time.
+    """
+    def __init__(self, controller: str, secret: str = '', timeout: float = 5,
+                 retries: int = 2, backoff: float = 0.1, max_workers: int = 4):
+        self.timeout: float = timeout
+        self.retries: int = retries
+        self.backoff: float = backoff
+        self.max_workers: int = max_workers
+
+        self.session = requests.Session()
+        self.configure(controller, secret)
+        # One host only, but allow as many pooled connections as fan-out workers
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_workers))
+        self.session.mount('http://', adapter)
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = Lock()
+
+    def configure(self, controller: str, secret: str = ''):
+        """Points the client at a (possibly different) controller, e.g. after a config reload."""
+        self.base_url: str = f'http://{controller}' if controller else ''
+        self.session.headers.update({
+            'Authorization': f'Bearer {secret}',
+            'Content-Type': 'application/json'
+        })
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.base_url)
+
+    def request(self, method: str, path: str, data: str = '',
+                timeout: Optional[float] = None, retries: Optional[int] = None,
+                quiet: bool = False) -> Optional[requests.Response]:
+        """
+        Sends a request and returns the response, or None if it failed.
+        Connection errors, timeouts and 5xx gateway errors are retried with
+        exponential backoff; other HTTP errors are returned to the caller as is.
+        With quiet=True transport failures are not printed (used by polling probes).
+        """
+        method = method.upper()
+        if not self.enabled or method not in SUPPORTED_METHODS:
+            return None
+        if not METRICS.enabled:
+            return self._request(method, path, data, timeout, retries, quiet)
+
+        started = time.perf_counter()
+        response = self._request(method, path, data, timeout, retries, quiet)
+        endpoint = api_endpoint(path)
+        METRICS.observe('singdrover_api_request_seconds', time.perf_counter() - started,
+                        method=method, endpoint=endpoint)
+        outcome = 'failed' if response is None else 'ok' if response.status_code < 400 else 'http_error'
+        METRICS.inc('singdrover_api_requests_total', method=method, endpoint=endpoint, outcome=outcome)
+        return response
+
+    def _request(self, method: str, path: str, data: str, timeout: Optional[float],
+                 retries: Optional[int], quiet: bool) -> Optional[requests.Response]:
+        url = f'{self.base_url}{path}'
+        attempts = 1 + (self.retries if retries is None else retries)
+        delay = self.backoff
+
+        for attempt in range(attempts):
+            try:
+                response = self.session.request(
+                    method, url,
+                    data=data if data else None,
+                    timeout=self.timeout if timeout is None else timeout
+                )
+                if response.status_code not in RETRY_STATUS_CODES or attempt == attempts - 1:
+                    return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == attempts - 1:
+                    if not quiet:
+                        print(f"API Request Failed ({method} {url}): {e}")
+                    return None
+            except requests.exceptions.RequestException as e:
+                if not quiet:
+                    print(f"API Request Failed ({method} {url}): {e}")
+                return None
+
+            time.sleep(delay)
+            delay *= 2
+
+        return None
+
+    def send(self, method: str, path: str, data: str = '',
+             retries: Optional[int] = None, quiet: bool = False) -> bool:
+        """Sends a request and returns True on a 2xx response."""
+        response = self.request(method, path, data, retries=retries, quiet=quiet)
+        if response is None:
+            return False
+
+        try:
+            response.raise_for_status()
+            return True
+        except requests.exceptions.HTTPError as e:
+            if not quiet:
+                print(f"API Request Failed ({method.upper()} {response.url}): {e}")
+            return False
+
+    def get_json(self, path: str, timeout: Optional[float] = None,
+                 retries: Optional[int] = None, quiet: bool = False) -> Optional[Any]:
+        """Sends a GET request and returns the decoded JSON body, or None on failure."""
+        response = self.request('GET', path, timeout=timeout, retries=retries, quiet=quiet)
+        if response is None or not response.ok:
+            return None
+
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def stream(self, path: str, read_timeout: Optional[float] = None) -> Optional[requests.Response]:
+        """
+        Opens a streaming GET (e.g. /traffic, which sends one JSON line per second).
+        Returns the open response, or None if it couldn't be opened; the caller
+        closes it. `read_timeout` bounds the wait for the next chunk.
+        """
+        if not self.enabled:
+            return None
+        try:
+            response = self.session.get(f'{self.base_url}{path}', stream=True,
+                                        timeout=(self.timeout, read_timeout))
+        except requests.exceptions.RequestException:
+            return None
+        if not response.ok:
+            response.close()
+            return None
+        return response
+
+    def put_selector(self, name: str, value: str) -> bool:
+        """Switches the selector `name` to the outbound `value`."""
+        return self.send('PUT', proxy_path(name), selector_body(value))
+
+    def put_selectors(self, choices: Sequence[Tuple[str, str]]) -> List[bool]:
+        """
+        Applies a batch of (selector, outbound) choices.
+        The PUTs are fanned out over a small bounded pool sharing the keep-alive
+        connections, so a batch costs about one round-trip instead of N.
+        """
+        return self.send_many([('PUT', proxy_path(name), selector_body(value))
+                               for name, value in choices])
+
+    def send_many(self, calls: Sequence[Tuple[str, str, str]],
+                  retries: Optional[int] = None, quiet: bool = False) -> List[bool]:
+        """Sends a batch of (method, path, data) requests concurrently, preserving result order."""
+        if not calls:
+            return []
+        if len(calls) == 1 or self.max_workers <= 1:
+            return [self.send(*call, retries=retries, quiet=quiet) for call in calls]
+
+        return list(self._get_executor().map(lambda call: self.send(*call, retries=retries, quiet=quiet), calls))
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='clash-api')
+            return self._executor
+
+    def close(self):
+        """Releases pooled connections and fan-out workers."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        self.session.close()
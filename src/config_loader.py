@@ -0,0 +1,321 @@
+# config_loader.py
+
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config_types import SingBoxConfig, ConfigSelector, OutboundTable
+from json_utils import normalize_json
+
+# The only top-level sections the drover needs; everything else (route, dns,
+# rule sets, ...) is decoded and dropped immediately.
+NEEDED_SECTIONS = ('inbounds', 'outbounds', 'experimental')
+
+# Bump when the cached representation of SingBoxConfig changes
+CACHE_VERSION = 4
+
+# Coarsest mtime resolution expected (FAT has 2 s). A config modified less than
+# this long before it was hashed could be rewritten with the same size and mtime.
+MTIME_GRANULARITY_NS = 2_000_000_000
+
+_WHITESPACE_RE = re.compile(r'\s*')
+_DECODER = json.JSONDecoder()
+
+
+def default_cache_dir() -> str:
+    """Per-user cache directory for parsed configs."""
+    if sys.platform == "win32":
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'SingDrover')
+
+
+def _canonical_section(key: str, value: Any) -> bytes:
+    """
+    Stable encoding of a top-level section for the config fingerprint.
+    Selector defaults are left out: they are applied through the Clash API and
+    never require restarting sing-box.
+    """
+    if key == 'outbounds' and isinstance(value, list):
+        value = [{k: v for k, v in item.items() if k != 'default'}
+                 if isinstance(item, dict) and item.get('type') == 'selector' else item
+                 for item in value]
+    return json.dumps([key, value], sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def extract_sections(json_text: str, keys: Iterable[str], digest: Optional[Any] = None,
+                     spans: Optional[Dict[str, Tuple[int, int]]] = None,
+                     items: Optional[Dict[str, List[Tuple[int, int, int]]]] = None) -> Dict[str, Any]:
+    """
+    Decodes only the given top-level keys of a JSON object.
+    Other values are run through the C scanner and dropped right away, so large
+    sections (route rules, DNS, rule sets) never live alongside the ones we keep.
+    A pure-Python bracket scanner that avoids building them was measured to be
+    slower than the C decoder, so this is the cheapest way to get past them.
+    If a hashlib `digest` is given, every section is fed to it in canonical form
+    (independent of formatting, comments and key order). If `spans` is given, it
+    receives the (start, end) offsets of every wanted value in json_text, and
+    `items` the element offsets of every wanted array (see decode_array()).
+    """
+    wanted = set(keys)
+    result: Dict[str, Any] = {}
+
+    pos = _WHITESPACE_RE.match(json_text, 0).end()
+    if json_text[pos:pos + 1] != '{':
+        raise json.JSONDecodeError('Expecting object', json_text, pos)
+    pos = _WHITESPACE_RE.match(json_text, pos + 1).end()
+    if json_text[pos:pos + 1] == '}':
+        _expect_end(json_text, pos + 1)
+        return result
+
+    while True:
+        if json_text[pos:pos + 1] != '"':
+            raise json.JSONDecodeError('Expecting property name enclosed in double quotes', json_text, pos)
+        key, pos = json.decoder.scanstring(json_text, pos + 1)
+
+        pos = _WHITESPACE_RE.match(json_text, pos).end()
+        if json_text[pos:pos + 1] != ':':
+            raise json.JSONDecodeError("Expecting ':' delimiter", json_text, pos)
+        value_start = _WHITESPACE_RE.match(json_text, pos + 1).end()
+
+        if items is not None and key in wanted and json_text[value_start:value_start + 1] == '[':
+            value, pos, items[key] = decode_array(json_text, value_start)
+        else:
+            value, pos = _DECODER.raw_decode(json_text, value_start)
+        if digest is not None:
+            digest.update(_canonical_section(key, value))
+        if key in wanted:
+            result[key] = value
+            if spans is not None:
+                spans[key] = (value_start, pos)
+        del value
+
+        pos = _WHITESPACE_RE.match(json_text, pos).end()
+        char = json_text[pos:pos + 1]
+        if char == '}':
+            _expect_end(json_text, pos + 1)
+            return result
+        if char != ',':
+            raise json.JSONDecodeError("Expecting ',' delimiter", json_text, pos)
+        pos = _WHITESPACE_RE.match(json_text, pos + 1).end()
+
+
+def decode_array(json_text: str, pos: int) -> Tuple[List[Any], int, List[Tuple[int, int, int]]]:
+    """
+    Decodes the JSON array starting at `pos` element by element. Returns the
+    elements, the end offset and (lead, start, end) offsets of every element,
+    where `lead` is just after the "[" or "," before it, so json_text[lead:start]
+    is the whitespace (or, in JSONC, comments) leading up to the element.
+    """
+    values: List[Any] = []
+    offsets: List[Tuple[int, int, int]] = []
+    lead = pos + 1
+    start = _WHITESPACE_RE.match(json_text, lead).end()
+    if json_text[start:start + 1] == ']':
+        return values, start + 1, offsets
+
+    while True:
+        value, end = _DECODER.raw_decode(json_text, start)
+        values.append(value)
+        offsets.append((lead, start, end))
+        pos = _WHITESPACE_RE.match(json_text, end).end()
+        char = json_text[pos:pos + 1]
+        if char == ']':
+            return values, pos + 1, offsets
+        if char != ',':
+            raise json.JSONDecodeError("Expecting ',' delimiter", json_text, pos)
+        lead = pos + 1
+        start = _WHITESPACE_RE.match(json_text, lead).end()
+
+
+def _expect_end(json_text: str, pos: int):
+    pos = _WHITESPACE_RE.match(json_text, pos).end()
+    if pos != len(json_text):
+        raise json.JSONDecodeError('Extra data', json_text, pos)
+
+
+def build_singbox_config(root_obj: Dict[str, Any]) -> SingBoxConfig:
+    """Picks the mixed inbound, the selectors and the Clash API settings out of a parsed config."""
+    proxy_host, proxy_port = '', 0
+    inbounds = root_obj.get('inbounds', [])
+    for item in inbounds:
+        if item.get('type') == 'mixed':
+            proxy_host = item.get('listen', '')
+            proxy_port = item.get('listen_port', 0)
+            break
+
+    table = OutboundTable()
+    selectors: List[ConfigSelector] = []
+    outbounds = root_obj.get('outbounds', [])
+    for item in outbounds:
+        table.intern(item.get('tag', ''), item.get('type', ''))
+
+    for item in outbounds:
+        if item.get('type') == 'selector':
+            sel_name = item.get('tag', '')
+            sel_default_name = item.get('default', '')
+            sel_outbounds_list: List[str] = item.get('outbounds', [])
+
+            if len(sel_outbounds_list) > 0:
+                selector = ConfigSelector(
+                    name=sel_name,
+                    outbounds=sel_outbounds_list,
+                    default_index=-1,
+                    default_name=sel_default_name,
+                    table=table
+                )
+                selector.default_index = selector.index_of(sel_default_name)
+                selectors.append(selector)
+
+    clash_api = root_obj.get('experimental', {}).get('clash_api', {})
+    clash_api_controller = clash_api.get('external_controller', '')
+    clash_api_secret = clash_api.get('secret', '')
+
+    return SingBoxConfig(
+        clash_api_controller=clash_api_controller,
+        clash_api_secret=clash_api_secret,
+        selectors=selectors,
+        proxy_host=proxy_host,
+        proxy_port=proxy_port,
+        outbounds=table
+    )
+
+
+def parse_singbox_config(json_text: str) -> SingBoxConfig:
+    """Parses (JSONC) config text, decoding only the sections the drover uses."""
+    json_text = normalize_json(json_text)
+
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        root_obj = extract_sections(json_text, NEEDED_SECTIONS, digest)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Configuration file is corrupted or contains invalid JSON: {e}")
+
+    cfg = build_singbox_config(root_obj)
+    cfg.fingerprint = digest.hexdigest()
+    return cfg
+
+
+class ConfigCache:
+    """
+    On-disk cache of parsed configs, one small JSON file per config path.
+    An entry is used without reading the config if its size, mtime and inode
+    match and it was last modified well before it was hashed. Otherwise the
+    content hash has to match, so an edit is picked up even when it lands within
+    the file system's mtime granularity and keeps the size unchanged.
+    """
+    def __init__(self, cache_dir: str):
+        self.cache_dir: str = cache_dir
+
+    def entry_path(self, config_path: str) -> str:
+        key = hashlib.sha1(os.path.abspath(config_path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'config-{key}.json')
+
+    def load(self, config_path: str, stat: os.stat_result,
+             content_hash: Optional[str] = None) -> Optional[SingBoxConfig]:
+        """Cached config if `stat` alone proves the file unchanged, or if `content_hash` matches."""
+        try:
+            with open(self.entry_path(config_path), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get('version') != CACHE_VERSION:
+            return None
+        if content_hash is None:
+            if not entry.get('settled') or entry.get('stat') != stat_key(stat):
+                return None
+        elif entry.get('hash') != content_hash:
+            return None
+        try:
+            return SingBoxConfig.from_dict(entry['config'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def store(self, config_path: str, stat: os.stat_result, content_hash: str,
+              cfg: SingBoxConfig, hashed_ns: int):
+        """`hashed_ns` is the time.time_ns() taken before the content was read."""
+        entry = {
+            'version': CACHE_VERSION,
+            'path': os.path.abspath(config_path),
+            'stat': stat_key(stat),
+            'settled': is_settled(stat, hashed_ns),
+            'hash': content_hash,
+            'config': cfg.to_dict()
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temporary file first, so a crash never leaves a half-written entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.entry_path(config_path))
+        except OSError as e:
+            print(f"Failed to write config cache ({self.cache_dir}): {e}")
+
+
+def stat_key(stat: os.stat_result) -> List[int]:
+    """What identifies a version of a file without reading it: size, mtime and inode."""
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def is_settled(stat: os.stat_result, hashed_ns: int) -> bool:
+    """
+    True if a later write must change the file's mtime, i.e. it was last modified
+    more than MTIME_GRANULARITY_NS before the content was read.
+    """
+    return stat.st_mtime_ns < hashed_ns - MTIME_GRANULARITY_NS
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def load_singbox_config(config_path: str, cache: Optional[ConfigCache] = None) -> SingBoxConfig:
+    """
+    Reads a sing-box config, using the parsed-config cache when the file is unchanged.
+    A settled, unchanged file costs one stat() and reading the cache entry; it
+    is only read and hashed when its stat changed or was too recent to trust.
+    """
+    if not os.path.exists(config_path):
+        raise FileNotFoundError("Configuration file not found.")
+
+    if cache is not None:
+        try:
+            cfg = cache.load(config_path, os.stat(config_path))
+        except OSError:
+            cfg = None
+        if cfg is not None:
+            return cfg
+
+    hashed_ns = time.time_ns()
+    with open(config_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        data = f.read()
+
+    digest = content_hash(data)
+    if cache is not None:
+        cfg = cache.load(config_path, stat, digest)
+        if cfg is not None:
+            # Same content with a new stat (touched, copied back, or settled since):
+            # record it, so the next load can skip reading the file
+            if is_settled(stat, hashed_ns):
+                cache.store(config_path, stat, digest, cfg, hashed_ns)
+            return cfg
+
+    try:
+        json_text = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise ValueError(f"Configuration file is not valid UTF-8: {e}")
+
+    cfg = parse_singbox_config(json_text)
+
+    if cache is not None:
+        cache.store(config_path, stat, digest, cfg, hashed_ns)
+    return cfg
@@ -1,21 +1,234 @@
 # config_types.py
 
-from typing import List, Dict, Any, Optional
+from array import array
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Union
+
+
+class OutboundInfo:
+    """One outbound of the config, stored once no matter how many selectors list it."""
+    __slots__ = ('id', 'tag', 'type')
+
+    def __init__(self, id: int, tag: str, type: str):
+        self.id: int = id
+        self.tag: str = tag
+        self.type: str = type
+
+
+class OutboundTable:
+    """
+    Interned outbound tags of a config. Every tag is stored once and referred to by
+    its integer id, so selectors sharing the same nodes only hold arrays of ids.
+    For every outbound the table also records which selectors list it and where,
+    which answers both "selectors containing X" and "position of X in selector S"
+    without a per-selector index.
+    """
+    __slots__ = ('outbounds', 'ids', 'members', 'selectors')
+
+    def __init__(self):
+        self.outbounds: List[OutboundInfo] = []
+        self.ids: Dict[str, int] = {}
+        # outbound id -> flat (selector key, position) pairs of the selectors listing it
+        self.members: List[array] = []
+        # selector key -> selector
+        self.selectors: List['ConfigSelector'] = []
+
+    def __len__(self) -> int:
+        return len(self.outbounds)
+
+    def intern(self, tag: str, type: str = '') -> int:
+        """Id of a tag, adding it on first use. A known type is kept if `type` is empty."""
+        outbound_id = self.ids.get(tag)
+        if outbound_id is None:
+            outbound_id = len(self.outbounds)
+            self.ids[tag] = outbound_id
+            self.outbounds.append(OutboundInfo(outbound_id, tag, type))
+            self.members.append(array('i'))
+        elif type and not self.outbounds[outbound_id].type:
+            self.outbounds[outbound_id].type = type
+        return outbound_id
+
+    def get(self, tag: str) -> Optional[OutboundInfo]:
+        outbound_id = self.ids.get(tag)
+        return self.outbounds[outbound_id] if outbound_id is not None else None
+
+    def add_selector(self, selector: 'ConfigSelector', outbound_ids: array) -> int:
+        """Registers a selector's outbounds and returns its key in this table."""
+        key = len(self.selectors)
+        self.selectors.append(selector)
+        members = self.members
+        for position, outbound_id in enumerate(outbound_ids):
+            pairs = members[outbound_id]
+            # Only the first occurrence of a duplicated outbound counts
+            if not pairs or pairs[-2] != key:
+                pairs.append(key)
+                pairs.append(position)
+        return key
+
+    def position(self, key: int, tag: str) -> int:
+        outbound_id = self.ids.get(tag)
+        if outbound_id is None:
+            return -1
+        pairs = self.members[outbound_id]
+        for index in range(0, len(pairs), 2):
+            if pairs[index] == key:
+                return pairs[index + 1]
+        return -1
+
+    def containing(self, tag: str) -> List['ConfigSelector']:
+        outbound_id = self.ids.get(tag)
+        if outbound_id is None:
+            return []
+        return [self.selectors[key] for key in self.members[outbound_id][::2]]
+
+    def to_list(self) -> List[List[str]]:
+        return [[info.tag, info.type] for info in self.outbounds]
+
+    @classmethod
+    def from_list(cls, data: List[List[str]]) -> 'OutboundTable':
+        table = cls()
+        for tag, type in data:
+            table.intern(tag, type)
+        return table
+
+
+class OutboundNames(Sequence):
+    """Read-only list of a selector's outbound tags, backed by its id array."""
+    __slots__ = ('_selector',)
+
+    def __init__(self, selector: 'ConfigSelector'):
+        self._selector = selector
+
+    def __len__(self) -> int:
+        return len(self._selector.outbound_ids)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        ids = self._selector.outbound_ids[index]
+        outbounds = self._selector.table.outbounds
+        if isinstance(index, slice):
+            return [outbounds[outbound_id].tag for outbound_id in ids]
+        return outbounds[ids].tag
+
+    def __iter__(self) -> Iterator[str]:
+        outbounds = self._selector.table.outbounds
+        return (outbounds[outbound_id].tag for outbound_id in self._selector.outbound_ids)
+
+    def __contains__(self, tag: object) -> bool:
+        return isinstance(tag, str) and self._selector.index_of(tag) >= 0
+
+    def index(self, tag: Any, start: int = 0, stop: Optional[int] = None) -> int:
+        position = self._selector.index_of(tag) if isinstance(tag, str) else -1
+        if position < start or (stop is not None and position >= stop):
+            raise ValueError(f'{tag!r} is not in the outbounds of {self._selector.name!r}')
+        return position
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (OutboundNames, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
 
 class ConfigSelector:
     """Equivalent to TConfigSelector in Drover.pas"""
-    def __init__(self, name: str, outbounds: List[str], default_index: int, default_name: str):
+    __slots__ = ('name', 'table', 'key', 'outbound_ids', 'default_index', 'default_name')
+
+    def __init__(self, name: str, outbounds: Sequence[str], default_index: int, default_name: str,
+                 table: Optional[OutboundTable] = None):
         self.name: str = name
-        self.outbounds: List[str] = outbounds
         self.default_index: int = default_index
         self.default_name: str = default_name
+        table = table if table is not None else OutboundTable()
+        self._register(table, array('i', [table.intern(tag) for tag in outbounds]))
+
+    def _register(self, table: OutboundTable, outbound_ids: array):
+        self.table: OutboundTable = table
+        self.outbound_ids: array = outbound_ids
+        self.key: int = table.add_selector(self, outbound_ids)
+
+    @property
+    def outbounds(self) -> OutboundNames:
+        return OutboundNames(self)
+
+    def index_of(self, tag: str) -> int:
+        """Position of an outbound in this selector, or -1."""
+        return self.table.position(self.key, tag)
+
+    def bind(self, table: OutboundTable):
+        """Moves the selector into another table (e.g. the config's shared one)."""
+        if table is not self.table:
+            self._register(table, array('i', [table.intern(tag) for tag in self.outbounds]))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'outbound_ids': self.outbound_ids.tolist(),
+            'default_index': self.default_index,
+            'default_name': self.default_name
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], table: OutboundTable) -> 'ConfigSelector':
+        outbound_ids = array('i', data['outbound_ids'])
+        if any(not 0 <= outbound_id < len(table) for outbound_id in outbound_ids):
+            raise ValueError(f"Selector {data['name']!r} refers to an unknown outbound")
+        selector = cls.__new__(cls)
+        selector.name = data['name']
+        selector.default_index = data['default_index']
+        selector.default_name = data['default_name']
+        selector._register(table, outbound_ids)
+        return selector
 
 class SingBoxConfig:
     """Equivalent to TSingBoxConfig in Drover.pas"""
     def __init__(self, clash_api_controller: str, clash_api_secret: str,
-                 selectors: List[ConfigSelector], proxy_host: str, proxy_port: int):
+                 selectors: List[ConfigSelector], proxy_host: str, proxy_port: int,
+                 outbounds: Optional[OutboundTable] = None):
         self.clash_api_external_controller: str = clash_api_controller
         self.clash_api_secret: str = clash_api_secret
         self.selectors: List[ConfigSelector] = selectors
         self.proxy_host: str = proxy_host
         self.proxy_port: int = proxy_port
+        # Hash of everything sing-box itself uses (except selector defaults);
+        # a different fingerprint means sing-box has to be restarted
+        self.fingerprint: str = ''
+
+        # All selectors share one outbound table
+        self.outbounds: OutboundTable = outbounds if outbounds is not None else OutboundTable()
+        self._selectors_by_name: Dict[str, ConfigSelector] = {}
+        for selector in selectors:
+            selector.bind(self.outbounds)
+            self._selectors_by_name.setdefault(selector.name, selector)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'clash_api_controller': self.clash_api_external_controller,
+            'clash_api_secret': self.clash_api_secret,
+            'outbounds': self.outbounds.to_list(),
+            'selectors': [selector.to_dict() for selector in self.selectors],
+            'proxy_host': self.proxy_host,
+            'proxy_port': self.proxy_port,
+            'fingerprint': self.fingerprint
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SingBoxConfig':
+        table = OutboundTable.from_list(data['outbounds'])
+        cfg = cls(
+            clash_api_controller=data['clash_api_controller'],
+            clash_api_secret=data['clash_api_secret'],
+            selectors=[ConfigSelector.from_dict(item, table) for item in data['selectors']],
+            proxy_host=data['proxy_host'],
+            proxy_port=data['proxy_port'],
+            outbounds=table
+        )
+        cfg.fingerprint = data['fingerprint']
+        return cfg
+
+    def get_selector(self, name: str) -> Optional[ConfigSelector]:
+        return self._selectors_by_name.get(name)
+
+    def selectors_containing(self, tag: str) -> List[ConfigSelector]:
+        """Selectors that list the given outbound (or nested group)."""
+        return self.outbounds.containing(tag)
@@ -0,0 +1,181 @@
+# config_watcher.py
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from threading import Thread, Event
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config_types import ConfigSelector
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+
+
+class SelectorDiff:
+    """What changed between the selectors of two configs."""
+    def __init__(self):
+        self.added: List[str] = []
+        self.removed: List[str] = []
+        # selector -> (added outbounds, removed outbounds); also set when only the order or default changed
+        self.changed: Dict[str, Tuple[List[str], List[str]]] = {}
+
+    @property
+    def affected(self) -> List[str]:
+        """Selectors whose menu section has to be rebuilt."""
+        return self.added + list(self.changed)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __str__(self) -> str:
+        return f"added {self.added}, removed {self.removed}, changed {list(self.changed)}"
+
+
+def diff_selectors(old: List[ConfigSelector], new: List[ConfigSelector]) -> SelectorDiff:
+    """Compares two selector lists by name and outbounds."""
+    diff = SelectorDiff()
+    old_by_name = {selector.name: selector for selector in old}
+    new_names = set()
+
+    for selector in new:
+        new_names.add(selector.name)
+        previous = old_by_name.get(selector.name)
+        if previous is None:
+            diff.added.append(selector.name)
+            continue
+        if previous.outbounds == selector.outbounds and previous.default_name == selector.default_name:
+            continue
+
+        old_outbounds = set(previous.outbounds)
+        new_outbounds = set(selector.outbounds)
+        diff.changed[selector.name] = (
+            [name for name in selector.outbounds if name not in old_outbounds],
+            [name for name in previous.outbounds if name not in new_outbounds]
+        )
+
+    diff.removed = [selector.name for selector in old if selector.name not in new_names]
+    return diff
+
+
+class ConfigWatcher(Thread):
+    """
+    Calls `on_change` when the watched file was modified, once per burst of writes.
+    Editors often save through several writes or a rename, so the callback only
+    fires after `debounce` seconds without further events.
+    Uses inotify on Linux (watching the directory, which also catches atomic
+    renames over the file) and falls back to polling the file's stat otherwise.
+    """
+    def __init__(self, path: str, on_change: Callable[[], None],
+                 debounce: float = 0.5, poll_interval: float = 1.0, name: str = 'config-watcher'):
+        super().__init__(name=name, daemon=True)
+        self.path: str = os.path.abspath(path)
+        self.on_change = on_change
+        self.debounce: float = debounce
+        self.poll_interval: float = poll_interval
+        self._stopping = Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        fd = self._inotify_open() if sys.platform.startswith('linux') else -1
+        try:
+            if fd >= 0:
+                self._run_inotify(fd)
+            else:
+                self._run_polling()
+        finally:
+            if fd >= 0:
+                os.close(fd)
+
+    def _fire(self):
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"Config reload failed: {e}")
+
+    # --- inotify ---
+
+    def _inotify_open(self) -> int:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return -1
+            mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+                os.close(fd)
+                return -1
+            return fd
+        except (OSError, AttributeError):
+            return -1
+
+    def _read_events(self, fd: int) -> bool:
+        """Drains pending inotify events; returns True if one of them concerns our file."""
+        name = os.path.basename(self.path).encode()
+        relevant = False
+        while True:
+            try:
+                data = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                return relevant
+            if not data:
+                return relevant
+
+            offset = 0
+            while offset + INOTIFY_EVENT_HEADER.size <= len(data):
+                _, _, _, length = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+                offset += INOTIFY_EVENT_HEADER.size
+                if data[offset:offset + length].rstrip(b'\0') == name:
+                    relevant = True
+                offset += length
+
+    def _run_inotify(self, fd: int):
+        pending_since: Optional[float] = None
+        while not self._stopping.is_set():
+            # Wake up once a second to notice stop(), or when the debounce window closes
+            timeout = 1.0 if pending_since is None else self.debounce
+            readable, _, _ = select.select([fd], [], [], timeout)
+            if readable and self._read_events(fd):
+                pending_since = time.monotonic()
+                continue
+
+            if pending_since is not None and time.monotonic() - pending_since >= self.debounce:
+                pending_since = None
+                if os.path.exists(self.path):
+                    self._fire()
+
+    # --- polling fallback ---
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _run_polling(self):
+        last = self._stat()
+        pending_since: Optional[float] = None
+        while not self._stopping.wait(self.poll_interval if pending_since is None else self.debounce):
+            current = self._stat()
+            if current != last:
+                last = current
+                pending_since = time.monotonic()
+                continue
+
+            if pending_since is not None and current is not None:
+                pending_since = None
+                self._fire()
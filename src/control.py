@@ -0,0 +1,363 @@
+# control.py
+#
+# Control protocol of the headless daemon (daemon.py): newline-delimited JSON
+# over a Unix domain socket. Every request line is an object with a "cmd" and
+# its arguments, every response line is {"ok": true, "result": ...} or
+# {"ok": false, "error": "..."}, in request order; an "id" in the request is
+# echoed back. Clients may pipeline: send any number of requests before
+# reading, all the requests that arrived together are answered in one write.
+#
+#   {"cmd": "status"}
+#   {"cmd": "list", "names": ["proxy"]}                      names is optional
+#   {"cmd": "set", "selectors": {"proxy": "node-1"}, "wait": true}
+#   {"cmd": "proxy", "enable": true, "wait": true}
+#   {"cmd": "reload"}                                         merges changed subscriptions first
+#   {"cmd": "shutdown"}
+#
+# list and set take an optional "instance" naming one of the extra sing-box
+# instances (the `instances` option) instead of the primary one.
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Thread
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    from drover import Drover
+    from instances import SingBoxInstance
+
+# Upper bound for "wait": true, so a stuck sing-box cannot hang a client forever
+CONTROL_WAIT_TIMEOUT = 10.0
+# A request line longer than this closes the connection
+MAX_LINE_BYTES = 1024 * 1024
+
+
+class ControlError(Exception):
+    """A request that cannot be carried out; reported to the client as {"ok": false}."""
+
+
+def default_socket_path() -> str:
+    """$XDG_RUNTIME_DIR/singdrover.sock, or a per-user name in the temp directory."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, 'singdrover.sock')
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(tempfile.gettempdir(), f'singdrover-{uid}.sock')
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class ControlCommands:
+    """Carries out control requests against a running Drover."""
+    def __init__(self, drover: 'Drover', on_shutdown: Optional[Callable[[], None]] = None):
+        self.drover = drover
+        self.on_shutdown = on_shutdown
+        self.started: float = time.monotonic()
+        self.handlers: Dict[str, Callable[[dict], Any]] = {
+            'status': self.status,
+            'list': self.list_selectors,
+            'set': self.set_selectors,
+            'proxy': self.system_proxy,
+            'reload': self.reload,
+            'shutdown': self.shutdown,
+        }
+
+    def handle(self, request: Any) -> dict:
+        """Runs one request and builds its response."""
+        if not isinstance(request, dict):
+            return {'ok': False, 'error': 'request must be a JSON object'}
+        handler = self.handlers.get(request.get('cmd'))
+        if handler is None:
+            response = {'ok': False, 'error': f"unknown command: {request.get('cmd')!r}"}
+        else:
+            try:
+                response = {'ok': True, 'result': handler(request)}
+            except ControlError as e:
+                response = {'ok': False, 'error': str(e)}
+            except Exception as e:
+                print(f"Control command {request.get('cmd')} failed: {e}")
+                response = {'ok': False, 'error': f'internal error: {e}'}
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    def status(self, request: dict) -> dict:
+        drover = self.drover
+        process = getattr(drover, 'sb_process', None)
+        result = {
+            'pid': os.getpid(),
+            'uptime': round(time.monotonic() - self.started, 1),
+            'config': drover.sb_config_path,
+            'singbox': {
+                'running': process is not None and process.poll() is None,
+                'error': drover.singbox_start_error,
+                'ready_ms': round(drover.ready_time * 1000) if drover.ready_time is not None else None,
+                'restarts': drover.supervisor.restart_count if drover.supervisor is not None else 0,
+            },
+            'system_proxy': drover.proxy_worker.applied,
+            'selectors': len(drover.sb_config.selectors),
+        }
+        if drover.instances is not None:
+            result['instances'] = {name: {'status': instance.status, 'error': instance.error,
+                                          'restarts': instance.restart_count}
+                                   for name, instance in drover.instances.instances.items()}
+        if drover.traffic is not None:
+            result['traffic'] = {'up': drover.traffic.up, 'down': drover.traffic.down}
+        try:
+            import resource
+            # ru_maxrss is in KB on Linux, in bytes on macOS
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            result['max_rss_kb'] = maxrss // 1024 if sys.platform == 'darwin' else maxrss
+        except ImportError:
+            pass
+        return result
+
+    def instance(self, request: dict) -> Optional['SingBoxInstance']:
+        """The extra instance a request is about, None for the primary one."""
+        name = request.get('instance')
+        if name is None:
+            return None
+        instance = self.drover.instances.get(name) if self.drover.instances is not None else None
+        if instance is None:
+            raise ControlError(f'unknown instance: {name!r}')
+        if instance.config is None:
+            raise ControlError(f'instance {name!r} has no config loaded ({instance.status})')
+        return instance
+
+    def list_selectors(self, request: dict) -> List[dict]:
+        names = request.get('names')
+        if names is not None and not isinstance(names, list):
+            raise ControlError('"names" must be a list')
+        wanted = set(names) if names else None
+
+        drover = self.drover
+        instance = self.instance(request)
+        if instance is not None:
+            return [{
+                'name': selector.name,
+                'now': instance.get_selected(selector.name),
+                'default': selector.default_name,
+                'outbounds': list(selector.outbounds),
+            } for selector in instance.config.selectors if wanted is None or selector.name in wanted]
+
+        return [{
+            'name': selector.name,
+            'now': drover.get_selected(selector.name),
+            'default': selector.default_name,
+            'auto': drover.is_auto_select(selector.name),
+            'outbounds': list(selector.outbounds),
+        } for selector in drover.sb_config.selectors if wanted is None or selector.name in wanted]
+
+    def set_selectors(self, request: dict) -> dict:
+        """Validates all changes first, then hands them to the selector worker as one batch."""
+        from drover import SelectorThreadTask
+
+        changes = request.get('selectors')
+        if not isinstance(changes, dict) or not changes:
+            raise ControlError('"selectors" must be a non-empty {selector: outbound} object')
+
+        drover = self.drover
+        instance = self.instance(request)
+        config = instance.config if instance is not None else drover.sb_config
+        errors: Dict[str, str] = {}
+        tasks: List[SelectorThreadTask] = []
+        for name, value in changes.items():
+            selector = config.get_selector(name)
+            if selector is None:
+                errors[name] = 'unknown selector'
+            elif not isinstance(value, str) or selector.index_of(value) < 0:
+                errors[name] = f'unknown outbound: {value!r}'
+            else:
+                tasks.append(SelectorThreadTask(name, value))
+        if errors:
+            # All or nothing, a script should not end up with half of its changes applied
+            raise ControlError(f'invalid changes: {json.dumps(errors, ensure_ascii=False)}')
+
+        if instance is not None:
+            applied = drover.instances.set_selectors(instance.name, {task.name: task.value for task in tasks})
+            if not request.get('wait'):
+                return {'queued': len(tasks)}
+            try:
+                return {'queued': len(tasks), 'failed': applied.result(CONTROL_WAIT_TIMEOUT)}
+            except FutureTimeoutError:
+                raise ControlError('timed out waiting for sing-box') from None
+
+        # Picking an outbound by hand takes the selector out of auto mode
+        for task in tasks:
+            if drover.is_auto_select(task.name):
+                drover.set_auto_select(task.name, False)
+        drover.submit_selector_tasks(tasks)
+
+        result: Dict[str, Any] = {'queued': len(tasks)}
+        if request.get('wait'):
+            if not drover.selector_worker.wait_idle(CONTROL_WAIT_TIMEOUT):
+                raise ControlError('timed out waiting for sing-box')
+            result['failed'] = [task.name for task in tasks if drover.get_selected(task.name) != task.value]
+        return result
+
+    def system_proxy(self, request: dict) -> dict:
+        enable = request.get('enable')
+        if not isinstance(enable, bool):
+            raise ControlError('"enable" must be true or false')
+        self.drover.request_system_proxy(enable)
+        if not request.get('wait'):
+            return {'queued': True}
+        applied = self.drover.proxy_worker.wait_idle(CONTROL_WAIT_TIMEOUT)
+        if applied != enable:
+            raise ControlError(f"failed to {'enable' if enable else 'disable'} the system proxy")
+        return {'enabled': applied}
+
+    def reload(self, request: dict) -> dict:
+        subscriptions = self.drover.refresh_subscriptions()
+        diff = self.drover.reload_config()
+        if diff is None:
+            raise ControlError('config reload failed, the current config is kept')
+        return {'added': diff.added, 'removed': diff.removed, 'changed': list(diff.changed),
+                'subscriptions': [result.to_dict() for result in subscriptions]}
+
+    def shutdown(self, request: dict) -> dict:
+        if self.on_shutdown is not None:
+            self.on_shutdown()
+        return {'stopping': True}
+
+
+class ControlHandler(socketserver.BaseRequestHandler):
+    """
+    One client connection. Requests are read in chunks; every complete line in
+    a chunk is handled in order and the responses go out in a single send, so a
+    pipelined batch costs one round-trip rather than one per command.
+    """
+    server: 'ControlServer'
+
+    def handle(self):
+        buffer = b''
+        while True:
+            try:
+                data = self.request.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            if len(buffer) > MAX_LINE_BYTES:
+                self._send(encode({'ok': False, 'error': 'request too long'}))
+                return
+
+            output = []
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    output.append(encode({'ok': False, 'error': f'invalid JSON: {e}'}))
+                    continue
+                output.append(encode(self.server.commands.handle(request)))
+            if output and not self._send(b''.join(output)):
+                return
+
+    def _send(self, data: bytes) -> bool:
+        try:
+            self.request.sendall(data)
+            return True
+        except OSError:
+            return False
+
+
+class ControlServer(socketserver.ThreadingUnixStreamServer):
+    """Listens on a Unix domain socket only the current user can connect to."""
+    daemon_threads = True
+
+    def __init__(self, path: str, commands: ControlCommands):
+        self.path: str = path
+        self.commands = commands
+        remove_stale_socket(path)
+        super().__init__(path, ControlHandler)
+
+    def server_bind(self):
+        super().server_bind()
+        # Anyone who can connect can switch outbounds and the system proxy
+        os.chmod(self.path, 0o600)
+
+    def start(self):
+        Thread(target=self.serve_forever, name='control-server', daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def remove_stale_socket(path: str):
+    """Removes a socket left behind by a dead daemon; refuses to replace a live one."""
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            os.unlink(path)
+            return
+    raise OSError(f'another daemon is already listening on {path}')
+
+
+class ControlClient:
+    """Client side of the protocol; pipeline() sends a whole batch before reading the answers."""
+    def __init__(self, path: str, timeout: Optional[float] = 30.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.reader = self.sock.makefile('rb')
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def __enter__(self) -> 'ControlClient':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def call(self, cmd: str, **args) -> dict:
+        return self.pipeline([dict(args, cmd=cmd)])[0]
+
+    def pipeline(self, requests: Iterable[dict]) -> List[dict]:
+        return list(self.stream(requests))
+
+    def stream(self, requests: Iterable[dict]) -> Iterator[dict]:
+        """
+        Sends all requests and yields the responses as they arrive. Sending runs
+        on its own thread, so a batch larger than the socket buffers cannot
+        deadlock against the daemon writing its answers.
+        """
+        requests = list(requests)
+        errors: List[OSError] = []
+
+        def send():
+            try:
+                self.sock.sendall(b''.join(encode(request) for request in requests))
+            except OSError as e:
+                errors.append(e)
+
+        sender = Thread(target=send, name='control-client-send', daemon=True)
+        sender.start()
+        for _ in requests:
+            line = self.reader.readline()
+            if not line:
+                sender.join()
+                raise ConnectionError(str(errors[0]) if errors else 'daemon closed the connection')
+            yield json.loads(line)
+        sender.join()
@@ -0,0 +1,96 @@
+# ctl.py
+#
+# Command line client of the headless daemon (daemon.py).
+#
+#   python ctl.py status
+#   python ctl.py list [SELECTOR ...] [--instance NAME]
+#   python ctl.py set SELECTOR=OUTBOUND [...] [--wait] [--instance NAME]
+#   python ctl.py proxy on|off [--wait]
+#   python ctl.py reload
+#   python ctl.py shutdown
+#   python ctl.py batch < requests.jsonl
+#
+# `batch` sends every JSON request line from stdin over one connection before
+# reading any answer (see control.py for the protocol) and prints one response
+# line per request, so scripts can apply hundreds of changes in one round-trip.
+# The exit status is 1 if any request failed.
+
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+from control import ControlClient, default_socket_path
+
+
+def parse_assignments(values: List[str]) -> dict:
+    selectors = {}
+    for value in values:
+        name, sep, outbound = value.partition('=')
+        if not sep or not name:
+            raise ValueError(f'expected SELECTOR=OUTBOUND, got {value!r}')
+        selectors[name] = outbound
+    return selectors
+
+
+def build_requests(args: argparse.Namespace) -> List[dict]:
+    if args.command == 'batch':
+        return [json.loads(line) for line in sys.stdin if line.strip()]
+    if args.command == 'list':
+        request = {'cmd': 'list', 'names': args.names}
+    elif args.command == 'set':
+        request = {'cmd': 'set', 'selectors': parse_assignments(args.assignments), 'wait': args.wait}
+    elif args.command == 'proxy':
+        request = {'cmd': 'proxy', 'enable': args.state == 'on', 'wait': args.wait}
+    else:
+        request = {'cmd': args.command}
+    if getattr(args, 'instance', None):
+        request['instance'] = args.instance
+    return [request]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Control a running SingDrover daemon')
+    parser.add_argument('--socket', default=default_socket_path(), help='control socket path')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='sing-box, system proxy and daemon status')
+    list_parser = commands.add_parser('list', help='selectors with their current outbound')
+    list_parser.add_argument('names', nargs='*', help='only these selectors')
+    list_parser.add_argument('--instance', help='an extra sing-box instance instead of the primary one')
+    set_parser = commands.add_parser('set', help='switch selectors (all changes in one batch)')
+    set_parser.add_argument('assignments', nargs='+', metavar='SELECTOR=OUTBOUND')
+    set_parser.add_argument('--wait', action='store_true', help='wait until sing-box applied the changes')
+    set_parser.add_argument('--instance', help='an extra sing-box instance instead of the primary one')
+    proxy_parser = commands.add_parser('proxy', help='turn the system proxy on or off')
+    proxy_parser.add_argument('state', choices=['on', 'off'])
+    proxy_parser.add_argument('--wait', action='store_true', help='wait until the change was applied')
+    commands.add_parser('reload', help='merge changed subscriptions and re-read the config file')
+    commands.add_parser('shutdown', help='stop the daemon and sing-box')
+    commands.add_parser('batch', help='pipeline JSON requests read from stdin, one per line')
+    args = parser.parse_args(argv)
+
+    try:
+        requests = build_requests(args)
+    except ValueError as e:
+        print(f'ctl: {e}', file=sys.stderr)
+        return 2
+
+    failed = False
+    try:
+        with ControlClient(args.socket) as client:
+            for response in client.stream(requests):
+                failed = failed or not response.get('ok')
+                if args.command == 'batch':
+                    print(json.dumps(response, ensure_ascii=False))
+                elif response.get('ok'):
+                    print(json.dumps(response.get('result'), ensure_ascii=False, indent=2))
+                else:
+                    print(f"error: {response.get('error')}", file=sys.stderr)
+    except (OSError, ValueError) as e:
+        print(f'ctl: cannot talk to the daemon at {args.socket}: {e}', file=sys.stderr)
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# daemon.py
+#
+# Headless entry point: runs Drover without the tray (PIL and pystray are never
+# imported) and serves the control protocol from control.py on a Unix domain
+# socket. ctl.py is the matching command line client.
+#
+# Usage: python daemon.py [--options options.json] [--socket PATH]
+
+import argparse
+import os
+import signal
+import sys
+from threading import Event
+from typing import List, Optional
+
+from control import ControlCommands, ControlServer, default_socket_path
+from drover import Drover, load_options
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='SingDrover without the tray, controlled through a local socket')
+    parser.add_argument('--options', help='options file (default: options.json next to this program)')
+    parser.add_argument('--socket', default=default_socket_path(), help='control socket path')
+    args = parser.parse_args(argv)
+
+    options_path = args.options or os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), 'options.json')
+    options = load_options(options_path)
+    # Both monitors only feed the tray (icon and Traffic submenu), nobody reads them here
+    options.traffic_icon = False
+    options.connection_monitor = False
+
+    try:
+        drover = Drover(options)
+    except Exception as e:
+        print(f"Daemon initialization failed: {e}")
+        return 1
+    if drover.singbox_start_error:
+        print(f"Sing-box failed to start: {drover.singbox_start_error}")
+        drover.stop_singbox()
+        return 1
+
+    stopping = Event()
+    try:
+        server = ControlServer(args.socket, ControlCommands(drover, on_shutdown=stopping.set))
+    except OSError as e:
+        print(f"Failed to open the control socket: {e}")
+        drover.stop_singbox()
+        return 1
+    server.start()
+
+    for signum in (signal.SIGTERM, signal.SIGINT, getattr(signal, 'SIGHUP', None)):
+        if signum is not None:
+            signal.signal(signum, lambda *_: stopping.set())
+
+    if options.system_proxy_auto:
+        drover.request_system_proxy(True)
+    print(f"SingDrover daemon running, control socket: {args.socket}")
+
+    stopping.wait()
+
+    print("Stopping SingDrover daemon...")
+    server.stop()
+    if options.system_proxy_auto:
+        drover.request_system_proxy(False)
+    drover.stop_singbox()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,586 @@
+# instances.py
+#
+# Extra sing-box instances (e.g. per-team or per-region egress) run next to the
+# primary one. A Drover per config would cost a dozen threads and a requests
+# session each; here every extra instance is a handful of coroutines on one
+# asyncio event loop, sharing one thread and one pool of keep-alive controller
+# connections. Each instance keeps the primary's behaviour: readiness wait,
+# selector reset, supervision with restart backoff, adaptive /proxies polling,
+# coalesced selector changes and the connection drain policy.
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Thread
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+from clash_api import proxy_path, selector_body
+from config_loader import ConfigCache, default_cache_dir, load_singbox_config
+from config_types import SingBoxConfig
+from log_pump import ERROR_LEVELS, MAX_ERROR_LINES, MAX_LINE_BYTES, LogLine, parse_log_line
+from singbox_policy import (DRAIN_AFFECTED, DRAIN_NONE, LIVENESS_FAILURES, READY_PROBE_TIMEOUT,
+                            RESTART_BACKOFF_MAX, RESTART_BACKOFF_MIN, SINGBOX_ERROR_LINES, STABLE_UPTIME,
+                            TERMINATE_TIMEOUT, ReadyBackoff, affected_connections, drain_rounds)
+
+if TYPE_CHECKING:
+    from drover import DroverOptions
+
+# Instance states, shown in the tray and by the daemon's status command
+STARTING = 'starting'
+RUNNING = 'running'
+RESTARTING = 'restarting'
+FAILED = 'failed'
+STOPPED = 'stopped'
+
+# Idle keep-alive connections kept per controller
+POOL_IDLE_PER_HOST = 4
+
+
+class HttpError(Exception):
+    """A controller request that failed on the transport level or returned garbage."""
+
+
+def split_controller(controller: str) -> Tuple[str, int]:
+    """"127.0.0.1:9090" / "[::1]:9090" / ":9090" -> (host, port)."""
+    host, _, port = controller.rpartition(':')
+    return host.strip('[]') or '127.0.0.1', int(port)
+
+
+def use_pidfd_child_watcher(loop: asyncio.AbstractEventLoop):
+    """
+    Before 3.12 asyncio waits for every child on a thread of its own; on Linux a
+    pidfd watched by the loop does the same without one. 3.12+ does this by itself.
+    """
+    if sys.version_info >= (3, 12) or not hasattr(asyncio, 'PidfdChildWatcher'):
+        return
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except (AttributeError, OSError):
+        return
+    watcher = asyncio.PidfdChildWatcher()
+    watcher.attach_loop(loop)
+    asyncio.set_child_watcher(watcher)
+
+
+class AsyncHttpPool:
+    """
+    Minimal HTTP/1.1 client for local Clash API controllers (plain HTTP, JSON
+    bodies). Idle keep-alive connections are pooled per host:port and shared
+    by every instance, so steady polling reuses open sockets.
+    """
+    def __init__(self, timeout: float = 5.0, max_idle_per_host: int = POOL_IDLE_PER_HOST):
+        self.timeout: float = timeout
+        self.max_idle_per_host: int = max_idle_per_host
+        self._idle: Dict[Tuple[str, int], List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+
+    async def request(self, address: Tuple[str, int], method: str, path: str, body: str = '',
+                      secret: str = '', timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        """Returns (status, body); raises HttpError on transport failures and timeouts."""
+        try:
+            return await asyncio.wait_for(self._request(address, method, path, body.encode('utf-8'), secret),
+                                          self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            raise HttpError(f'{method} {path}: timed out') from None
+
+    async def _request(self, address: Tuple[str, int], method: str, path: str, body: bytes,
+                       secret: str) -> Tuple[int, bytes]:
+        head = (f'{method} {path} HTTP/1.1\r\nHost: {address[0]}:{address[1]}\r\n'
+                f'Authorization: Bearer {secret}\r\nContent-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n\r\n').encode('latin-1')
+
+        # A pooled connection may have been closed by the controller meanwhile; retry once on a fresh one
+        for attempt in range(2):
+            reader, writer, reused = await self._acquire(address)
+            try:
+                writer.write(head + body)
+                await writer.drain()
+                status, data, keep_alive = await self._read_response(reader)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                writer.close()
+                if reused and attempt == 0:
+                    continue
+                raise HttpError(f'{method} {path}: {e or type(e).__name__}') from None
+            except BaseException:
+                # Cancelled (e.g. by the timeout) mid-request: the connection is in an unknown state
+                writer.close()
+                raise
+            if keep_alive:
+                self._release(address, reader, writer)
+            else:
+                writer.close()
+            return status, data
+        raise HttpError(f'{method} {path}: connection lost')
+
+    async def _acquire(self, address: Tuple[str, int]) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        idle = self._idle.get(address)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        try:
+            reader, writer = await asyncio.open_connection(*address)
+        except OSError as e:
+            raise HttpError(f'connect {address[0]}:{address[1]}: {e}') from None
+        return reader, writer, False
+
+    def _release(self, address: Tuple[str, int], reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        idle = self._idle.setdefault(address, [])
+        if len(idle) < self.max_idle_per_host:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, bytes, bool]:
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b'HTTP/'):
+            raise ValueError(f'bad status line {status_line[:40]!r}')
+        status = int(parts[1])
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close' and parts[0] != b'HTTP/1.0'
+        if status in (204, 304) or 100 <= status < 200:
+            return status, b'', keep_alive
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # Trailers, if any, end with an empty line
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            return status, b''.join(chunks), keep_alive
+        if 'content-length' in headers:
+            return status, await reader.readexactly(int(headers['content-length'])), keep_alive
+        # No framing: the body runs until the server closes the connection
+        return status, await reader.read(), False
+
+    def close(self):
+        for idle in self._idle.values():
+            for _, writer in idle:
+                writer.close()
+        self._idle.clear()
+
+
+class SingBoxInstance:
+    """
+    One extra sing-box process and its selectors, driven by coroutines on the
+    manager's loop. Other threads only read `status`, `config` and the state
+    dicts (plain attribute and dict reads), everything else runs on the loop.
+    """
+    def __init__(self, manager: 'InstanceManager', name: str, config_path: str):
+        self.manager = manager
+        self.name: str = name
+        self.config_path: str = config_path
+        self.config: Optional[SingBoxConfig] = None
+        self.status: str = STARTING
+        self.error: str = ''
+        self.restart_count: int = 0
+
+        # Live `now` of every group and the last choice made here (re-applied after restarts)
+        self.state: Dict[str, str] = {}
+        self.selected: Dict[str, str] = {}
+
+        options = manager.options
+        self.lines: Deque[LogLine] = deque(maxlen=max(1, options.log_buffer_lines))
+        self.errors: Deque[LogLine] = deque(maxlen=MAX_ERROR_LINES)
+
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._pending: Dict[str, str] = {}
+        self._flushing: Optional[asyncio.Task] = None
+        self._flushed: Optional[asyncio.Event] = None
+        self._sync_wake: Optional[asyncio.Event] = None
+        self._sync_interval: float = options.state_sync_min_interval
+        self._sync_task: Optional[asyncio.Task] = None
+        # Output readers of the current process
+        self._pumps: List[asyncio.Task] = []
+
+    # --- Selector state (called on the loop) ---
+
+    def get_selected(self, name: str) -> str:
+        if name in self.state:
+            return self.state[name]
+        if name in self.selected:
+            return self.selected[name]
+        selector = self.config.get_selector(name) if self.config is not None else None
+        return selector.default_name if selector is not None else ''
+
+    def submit(self, changes: Dict[str, str]):
+        """Queues selector changes; changes queued while a batch is in flight are coalesced."""
+        for name, value in changes.items():
+            self._pending.pop(name, None)
+            self._pending[name] = value
+            self.selected[name] = value
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.ensure_future(self._flush())
+
+    async def wait_flushed(self, names: List[str]) -> List[str]:
+        """Waits until no change is pending; returns which of `names` did not end up applied."""
+        while self._flushing is not None and not self._flushing.done():
+            await asyncio.shield(self._flushing)
+        return [name for name in names if self.state.get(name) != self.selected.get(name)]
+
+    async def _flush(self):
+        # Like the primary's ConnectionDrainer: selectors changed meanwhile are merged
+        # into one drain, and queued changes are applied before it goes on
+        drain: Set[str] = set()
+        while (self._pending or drain) and self.status == RUNNING:
+            if not self._pending:
+                names, drain = list(drain), set()
+                if not await self._drain_connections(names):
+                    drain.update(names)
+                continue
+
+            batch = list(self._pending.items())
+            self._pending.clear()
+            results = await asyncio.gather(*(self.api('PUT', proxy_path(name), selector_body(value))
+                                             for name, value in batch))
+            changed = {}
+            for (name, value), (status, _) in zip(batch, results):
+                if 200 <= status < 300:
+                    if self.state.get(name) != value:
+                        changed[name] = value
+                    self.state[name] = value
+                else:
+                    print(f"[{self.name}] Failed to set selector '{name}' to '{value}' (status {status})")
+            drain.update(name for name, _ in batch)
+            self._kick_sync()
+            if changed:
+                self.manager.notify(self)
+
+    async def _drain_connections(self, selector_names: List[str]) -> bool:
+        """Closes connections per the drain policy; False if queued selector changes cut it short."""
+        policy = self.manager.options.connection_drain_policy
+        if policy == DRAIN_NONE or not selector_names:
+            return True
+        if policy != DRAIN_AFFECTED:
+            await self.api('DELETE', '/connections')
+            return True
+        snapshot = await self.get_json('/connections')
+        # No more DELETEs in flight than pooled connections, so they reuse them
+        # instead of opening a burst of new ones
+        limit = asyncio.Semaphore(POOL_IDLE_PER_HOST)
+
+        async def delete(conn_id: str):
+            async with limit:
+                await self.api('DELETE', f'/connections/{quote(conn_id, safe="")}')
+
+        for conn_ids in drain_rounds(affected_connections(snapshot, selector_names)):
+            if self._pending or self.status != RUNNING:
+                return False
+            await asyncio.gather(*(delete(conn_id) for conn_id in conn_ids))
+        return True
+
+    # --- Controller access ---
+
+    async def api(self, method: str, path: str, body: str = '', timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        """Sends a controller request; (0, b'') if it failed on the transport level."""
+        config = self.config
+        if config is None or not config.clash_api_external_controller:
+            return 0, b''
+        try:
+            return await self.manager.pool.request(split_controller(config.clash_api_external_controller),
+                                                   method, path, body, config.clash_api_secret, timeout)
+        except HttpError:
+            return 0, b''
+
+    async def get_json(self, path: str, timeout: Optional[float] = None) -> Any:
+        status, data = await self.api('GET', path, timeout=timeout)
+        if not 200 <= status < 300:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    # --- Lifecycle ---
+
+    async def run(self, config: SingBoxConfig):
+        """Keeps sing-box running with the parsed config until cancelled."""
+        self.config = config
+        self._sync_wake = asyncio.Event()
+        self._sync_task = asyncio.ensure_future(self._sync_loop())
+        delay = 0.0
+        while True:
+            started_at = time.monotonic()
+            error = await self._start()
+            if not error:
+                if self.status == RESTARTING:
+                    self.restart_count += 1
+                self.status = RUNNING
+                self.manager.notify(self)
+                # Defaults on the first start, the last choices after a restart
+                self.submit(self.selected or self._defaults())
+                reason = await self._watch()
+                print(f"[{self.name}] sing-box is down ({reason}), restarting...")
+                if time.monotonic() - started_at >= STABLE_UPTIME:
+                    delay = 0.0
+            else:
+                print(f"[{self.name}] sing-box start failed: {error}")
+                self.error = error
+
+            self.status = RESTARTING
+            self.manager.notify(self)
+            await self._terminate()
+            if delay:
+                await asyncio.sleep(delay)
+            delay = min(max(delay * 2, RESTART_BACKOFF_MIN), RESTART_BACKOFF_MAX)
+
+    def _defaults(self) -> Dict[str, str]:
+        return {selector.name: selector.default_name for selector in self.config.selectors
+                if 0 <= selector.default_index < len(selector.outbounds)}
+
+    def fail(self, error: str):
+        print(f"[{self.name}] {error}")
+        self.error = error
+        self.status = FAILED
+        self.manager.notify(self)
+
+    async def _start(self) -> str:
+        """Spawns sing-box and waits for its controller; returns an error string, empty on success."""
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                self.manager.sb_exe_path, 'run', '-c', self.config_path,
+                cwd=os.path.dirname(self.manager.sb_exe_path),
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                limit=MAX_LINE_BYTES,
+                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+            )
+        except OSError as e:
+            return f"Failed to execute sing-box binary ('{self.manager.sb_exe_path}'): {e}"
+        self._pumps = [asyncio.ensure_future(self._pump(stream_name, stream))
+                       for stream_name, stream in (('stdout', self.process.stdout),
+                                                   ('stderr', self.process.stderr))]
+
+        backoff = ReadyBackoff()
+        while True:
+            if self.process.returncode is not None:
+                return self._exit_error()
+            if not self.config.clash_api_external_controller:
+                return ''
+            status, _ = await self.api('GET', '/version', timeout=READY_PROBE_TIMEOUT)
+            if status:
+                self.error = ''
+                return ''
+            delay = backoff.next_delay()
+            if delay is None:
+                return backoff.timeout_error()
+            await asyncio.sleep(delay)
+
+    def _exit_error(self) -> str:
+        lines = list(self.errors)[-SINGBOX_ERROR_LINES:] or list(self.lines)[-SINGBOX_ERROR_LINES:]
+        error_msg = '\n'.join(line.text for line in lines).strip()
+        return f"Sing-box exited with code {self.process.returncode}. Error:\n{error_msg}"
+
+    async def _watch(self) -> str:
+        """Returns once the process exited or stopped answering its liveness probes."""
+        exited = asyncio.ensure_future(self.process.wait())
+        failures = 0
+        try:
+            while True:
+                done, _ = await asyncio.wait({exited}, timeout=self.manager.options.liveness_interval)
+                if done:
+                    return f"exit code {self.process.returncode}"
+                if not self.config.clash_api_external_controller:
+                    continue
+                status, _ = await self.api('GET', '/version', timeout=READY_PROBE_TIMEOUT)
+                failures = 0 if status else failures + 1
+                if failures >= LIVENESS_FAILURES:
+                    return "Clash API not responding"
+        finally:
+            exited.cancel()
+
+    async def _pump(self, stream_name: str, stream: asyncio.StreamReader):
+        """Drains one output pipe into the in-memory log, like LogPump does for the primary."""
+        while True:
+            try:
+                raw = await stream.readline()
+            except ValueError:
+                # A line over MAX_LINE_BYTES: keep what fits
+                raw = await stream.read(MAX_LINE_BYTES)
+            except OSError:
+                return
+            if not raw:
+                return
+            line = parse_log_line(stream_name, raw)
+            self.lines.append(line)
+            if line.level in ERROR_LEVELS:
+                self.errors.append(line)
+
+    async def _sync_loop(self):
+        """Adaptive /proxies polling, like SelectorStateSync."""
+        options = self.manager.options
+        while True:
+            try:
+                await asyncio.wait_for(self._sync_wake.wait(), self._sync_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._sync_wake.clear()
+            if self.status != RUNNING:
+                continue
+
+            snapshot = await self.get_json('/proxies')
+            changed = False
+            if isinstance(snapshot, dict):
+                for name, proxy in (snapshot.get('proxies') or {}).items():
+                    now = proxy.get('now') if isinstance(proxy, dict) else None
+                    if now and self.state.get(name) != now:
+                        self.state[name] = now
+                        changed = True
+            if changed:
+                self._sync_interval = options.state_sync_min_interval
+                self.manager.notify(self)
+            else:
+                self._sync_interval = min(self._sync_interval * 2, options.state_sync_max_interval)
+
+    def _kick_sync(self):
+        self._sync_interval = self.manager.options.state_sync_min_interval
+        if self._sync_wake is not None:
+            self._sync_wake.set()
+
+    async def _terminate(self):
+        process, self.process = self.process, None
+        if process is not None and process.returncode is None:
+            try:
+                process.terminate()
+                await asyncio.wait_for(process.wait(), TERMINATE_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+            except ProcessLookupError:
+                pass
+        # The pumps end on EOF once the process is gone
+        pumps, self._pumps = self._pumps, []
+        if pumps:
+            await asyncio.wait(pumps, timeout=1)
+
+    async def stop(self):
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+        await self._terminate()
+        self.status = STOPPED
+
+
+class InstanceManager:
+    """
+    Owns the extra instances and the event loop thread driving all of them.
+    Instances come from the `instances` option: [{"name": ..., "sb_config_file": ...}].
+    Calls from other threads are handed to the loop; `on_change(instance)` is
+    called from the loop thread whenever an instance's status or selection changed.
+    """
+    def __init__(self, specs: List[dict], sb_exe_path: str, options: 'DroverOptions'):
+        self.options = options
+        self.sb_exe_path: str = sb_exe_path
+        self.on_change: Optional[Callable[[SingBoxInstance], None]] = None
+        self.config_cache: Optional[ConfigCache] = None
+        if options.config_cache:
+            self.config_cache = ConfigCache(options.config_cache_dir or default_cache_dir())
+
+        self.instances: Dict[str, SingBoxInstance] = {}
+        for spec in specs:
+            path = spec.get('sb_config_file', '')
+            name = spec.get('name') or os.path.splitext(os.path.basename(path))[0]
+            if not path or name in self.instances:
+                print(f"Ignoring instance without a config file or with a duplicate name: {spec}")
+                continue
+            self.instances[name] = SingBoxInstance(self, name, path)
+
+        self.pool = AsyncHttpPool()
+        self.loop = asyncio.new_event_loop()
+        self._main: Optional['Future[None]'] = None
+        self._runners: List[asyncio.Task] = []
+        self._thread = Thread(target=self._run_loop, name='instances', daemon=True)
+
+    def start(self):
+        use_pidfd_child_watcher(self.loop)
+        self._thread.start()
+        self._main = asyncio.run_coroutine_threadsafe(self._start_instances(), self.loop)
+
+    async def _start_instances(self):
+        loop = asyncio.get_running_loop()
+        # A cold parse of a large config takes a while, keep it off the loop. One helper
+        # thread parses them in turn and each instance starts as soon as its config is ready.
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='instances-config') as executor:
+            for instance in self.instances.values():
+                try:
+                    config = await loop.run_in_executor(executor, load_singbox_config,
+                                                        instance.config_path, self.config_cache)
+                except Exception as e:
+                    instance.fail(f'config: {e}')
+                    continue
+                self._runners.append(asyncio.ensure_future(instance.run(config)))
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    def get(self, name: str) -> Optional[SingBoxInstance]:
+        return self.instances.get(name)
+
+    def set_selectors(self, name: str, changes: Dict[str, str]) -> 'Future[List[str]]':
+        """Queues selector changes of an instance; the future resolves to the names that failed once applied."""
+        instance = self.instances[name]
+
+        async def apply() -> List[str]:
+            instance.submit(changes)
+            return await instance.wait_flushed(list(changes))
+        return asyncio.run_coroutine_threadsafe(apply(), self.loop)
+
+    def notify(self, instance: SingBoxInstance):
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(instance)
+        except Exception as e:
+            print(f"Instance callback failed: {e}")
+
+    def stop(self, timeout: float = 10.0):
+        """Stops every instance's sing-box and then the loop."""
+        if not self._thread.is_alive():
+            return
+
+        async def shutdown():
+            if self._main is not None:
+                self._main.cancel()
+            for runner in self._runners:
+                runner.cancel()
+            await asyncio.gather(*self._runners, return_exceptions=True)
+            await asyncio.gather(*(instance.stop() for instance in self.instances.values()),
+                                 return_exceptions=True)
+            # Whatever is left (pumps, flushes, requests) must finish before the loop closes
+            pending = asyncio.all_tasks() - {asyncio.current_task()}
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            self.pool.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout)
+        except Exception as e:
+            print(f"Failed to stop instances cleanly: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
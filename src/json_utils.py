@@ -1,23 +1,98 @@
 # json_utils.py
 
 import json
-from typing import Any
+import re
+from typing import Any, List, Optional
+
+# One token: a run of text to copy through unchanged (plain characters and
+# complete strings, so "//" or "," inside a string is never touched), followed
+# by whatever ended it. A comma is looked at together with what follows: a
+# closing bracket makes it trailing, a comment leaves that open. Every character
+# can only be consumed one way, so the match never backtracks; the "keep" run is
+# an unrolled loop, which is what keeps the regex engine fast on multi-MB configs.
+_TOKEN_RE = re.compile(
+    r'(?P<keep>[^"/,]*(?:(?:"[^"\\]*(?:\\.[^"\\]*)*"|,(?!\s*[\]}/]))[^"/,]*)*)'
+    r'(?:(?P<line>//[^\n]*)'
+    r'|(?P<block>/\*.*?\*/)'
+    r'|,(?:(?P<trailing>\s*[\]}])|(?P<commented>\s*(?=/[/*])))?'
+    r'|(?P<bad>/\*|")'
+    r'|(?P<slash>/))?',
+    re.DOTALL
+)
+_NOT_NEWLINE_RE = re.compile(r'[^\n]')
+_SPACE_RE = re.compile(r'\s*')
+
 
 def normalize_json(json_text: str) -> str:
     """
-    A simplified version of the Delphi NormalizeJson function.
-    In Python, we typically just load and dump to handle most formatting
-    and commentary issues (if the input is valid JSON with comments).
-    A robust solution would use a JSON parser that supports comments (like 'json5' or 'hjson').
-    For this example, we assume standard JSON, or use a basic replacement for comments.
+    Turns sing-box style JSONC into plain JSON in a single linear pass.
+    Line (//) and block (/* */) comments and trailing commas are removed, strings
+    are left untouched. Removed characters are replaced by spaces (newlines are
+    kept), so every remaining character keeps its original line and column and
+    json.loads() errors point at the right place in the original file.
     """
-    # Simple attempt to remove C-style comments before parsing
-    # This is a dangerous simplification, but mirrors the need from the original code
-    lines = json_text.splitlines()
-    cleaned_lines = []
-    for line in lines:
-        if line.strip().startswith('//'):
+    if json_text.startswith('\ufeff'):
+        json_text = ' ' + json_text[1:]
+
+    # Removed parts are replaced in `chunks`; text between them is copied as one slice
+    chunks: List[str] = []
+    copied = 0
+    # A comma followed by a comment: trailing if only whitespace and comments
+    # separate it from a closing bracket. `comma_chunk` is set once it had to be
+    # copied as a chunk of its own.
+    comma: Optional[int] = None
+    comma_chunk: Optional[int] = None
+    pos, size = 0, len(json_text)
+    match = _TOKEN_RE.match
+    skip_space = _SPACE_RE.match
+    while pos < size:
+        token = match(json_text, pos)
+        if comma is not None and token.end('keep') > pos:
+            first = skip_space(json_text, pos).end()
+            if first < token.end('keep'):
+                if json_text[first] in ']}':
+                    if comma_chunk is not None:
+                        chunks[comma_chunk] = ' '
+                    else:
+                        chunks.append(json_text[copied:comma])
+                        chunks.append(' ')
+                        copied = comma + 1
+                comma = None
+        pos = token.end()
+
+        kind = token.lastgroup
+        if kind == 'keep':
+            # The end of the text, or a comma before a lone "/"
             continue
-        cleaned_lines.append(line)
+        if kind == 'trailing':
+            start = token.start(kind) - 1
+            chunks.append(json_text[copied:start])
+            chunks.append(' ')
+            copied = start + 1
+        elif kind == 'commented':
+            comma, comma_chunk = token.start(kind) - 1, None
+        elif kind == 'line' or kind == 'block':
+            start = token.start(kind)
+            if comma is not None and comma_chunk is None:
+                chunks.append(json_text[copied:comma])
+                comma_chunk = len(chunks)
+                chunks.append(',')
+                copied = comma + 1
+            chunks.append(json_text[copied:start])
+            comment = token.group(kind)
+            chunks.append(' ' * len(comment) if kind == 'line' else _NOT_NEWLINE_RE.sub(' ', comment))
+            copied = pos
+        elif kind == 'bad':
+            what = 'string' if token.group('bad') == '"' else 'block comment'
+            raise json.JSONDecodeError(f'Unterminated {what}', json_text, token.start('bad'))
+        else:
+            # A lone "/" is not JSON; json.loads() reports it at this position
+            comma = None
+
+    chunks.append(json_text[copied:])
+    return ''.join(chunks)
+
 
-    return '\n'.join(cleaned_lines)
+def loads_jsonc(json_text: str) -> Any:
+    """json.loads() for JSONC text; errors carry the line/column of the original text."""
+    return json.loads(normalize_json(json_text))
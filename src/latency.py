@@ -0,0 +1,110 @@
+# latency.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+from urllib.parse import urlencode
+
+from clash_api import ClashApiClient, proxy_path
+from config_types import ConfigSelector
+
+# Stored in the cache for outbounds that timed out or returned an error
+LATENCY_FAILED = -1
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+    """A small thread-safe dict whose entries expire `ttl` seconds after being set."""
+    def __init__(self, ttl: float):
+        self.ttl: float = ttl
+        self._items: Dict[K, Tuple[float, V]] = {}
+        self._lock = Lock()
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            return value
+
+    def set(self, key: K, value: V):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class LatencyProber:
+    """
+    Measures outbound delays through the Clash API /proxies/{name}/delay endpoint.
+    Probes run concurrently on a bounded pool, every outbound is probed once even
+    if several selectors share it, and results are cached for `ttl` seconds.
+    """
+    def __init__(self, api: ClashApiClient, test_url: str, timeout_ms: int = 5000,
+                 ttl: float = 300, max_workers: int = 16):
+        self.api = api
+        self.test_url: str = test_url
+        self.timeout_ms: int = timeout_ms
+        self.max_workers: int = max_workers
+        self.cache: TTLCache[str, int] = TTLCache(ttl)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = Lock()
+
+    def get_delay(self, name: str) -> Optional[int]:
+        """Returns the cached delay in ms (LATENCY_FAILED on failure), or None if unknown."""
+        return self.cache.get(name)
+
+    def probe(self, name: str) -> int:
+        """Measures a single outbound and caches the result."""
+        query = urlencode({'url': self.test_url, 'timeout': self.timeout_ms})
+        # Leave sing-box time to report its own timeout before giving up on the HTTP call
+        result = self.api.get_json(f'{proxy_path(name)}/delay?{query}',
+                                   timeout=self.timeout_ms / 1000 + 1)
+        delay = LATENCY_FAILED
+        if isinstance(result, dict) and isinstance(result.get('delay'), int) and result['delay'] > 0:
+            delay = result['delay']
+
+        self.cache.set(name, delay)
+        return delay
+
+    def probe_all(self, names: Iterable[str], force: bool = False) -> Dict[str, int]:
+        """
+        Probes all given outbounds, skipping duplicates and (unless forced) fresh cache entries.
+        Returns the delays of every requested outbound.
+        """
+        unique: List[str] = list(dict.fromkeys(names))
+        delays: Dict[str, int] = {}
+        pending: List[str] = []
+        for name in unique:
+            cached = None if force else self.cache.get(name)
+            if cached is None:
+                pending.append(name)
+            else:
+                delays[name] = cached
+
+        if pending:
+            for name, delay in zip(pending, self._get_executor().map(self.probe, pending)):
+                delays[name] = delay
+
+        return delays
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # One long-lived pool for all probe rounds, instead of new threads per round
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='latency-probe')
+            return self._executor
+
+    def probe_selectors(self, selectors: Iterable[ConfigSelector], force: bool = False) -> Dict[str, int]:
+        """Probes every outbound of the given selectors."""
+        return self.probe_all((name for selector in selectors for name in selector.outbounds), force)
@@ -0,0 +1,175 @@
+# log_pump.py
+
+import os
+import re
+import time
+from collections import deque
+from threading import Thread, Lock
+from typing import IO, List, Optional, Deque
+
+# sing-box log lines look like "+0800 2024-01-01 12:00:00 INFO [12 0ms] message",
+# where the zone/timestamp part is optional (log.disable_timestamp) and the
+# level may be wrapped in ANSI colour codes.
+ANSI_ESCAPE_RE = re.compile(r'\x1b\[[0-9;]*m')
+LOG_LINE_RE = re.compile(
+    r'^(?:[+-]\d{4}\s+)?'
+    r'(?P<timestamp>\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:\.\d+)?)?\s*'
+    r'(?P<level>TRACE|DEBUG|INFO|WARN|WARNING|ERROR|FATAL|PANIC)\b\s*'
+)
+ERROR_LEVELS = ('ERROR', 'FATAL', 'PANIC')
+
+# Upper bound for a single line, so a child printing without newlines cannot grow memory
+MAX_LINE_BYTES = 16 * 1024
+MAX_ERROR_LINES = 50
+
+
+class LogLine:
+    """A single parsed line of sing-box output."""
+    __slots__ = ('stream', 'level', 'timestamp', 'received', 'text')
+
+    def __init__(self, stream: str, level: str, timestamp: str, received: float, text: str):
+        self.stream: str = stream
+        self.level: str = level
+        self.timestamp: str = timestamp
+        self.received: float = received
+        self.text: str = text
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def parse_log_line(stream: str, raw: bytes) -> LogLine:
+    """Decodes a raw output line and extracts its level and timestamp (if any)."""
+    text = ANSI_ESCAPE_RE.sub('', raw.decode('utf-8', errors='replace')).rstrip('\r\n')
+    match = LOG_LINE_RE.match(text)
+    if match:
+        level = match.group('level')
+        level = 'WARN' if level == 'WARNING' else level
+        timestamp = match.group('timestamp') or ''
+    else:
+        # Unstructured output (e.g. a Go panic trace or a config error) ends up on stderr
+        level = 'ERROR' if stream == 'stderr' else 'INFO'
+        timestamp = ''
+    return LogLine(stream, level, timestamp, time.time(), text)
+
+
+class RotatingLogFile:
+    """
+    Append-only text file rotated to `path.1` ... `path.N` once it exceeds `max_bytes`.
+    The current size is tracked in memory, so a write costs no extra syscalls.
+    """
+    def __init__(self, path: str, max_bytes: int, backups: int = 1):
+        self.path: str = path
+        self.max_bytes: int = max_bytes
+        self.backups: int = backups
+        self.file: IO[str] = open(path, 'a', encoding='utf-8')
+        self.size: int = self.file.tell()
+
+    def write(self, text: str):
+        data = text + '\n'
+        if self.max_bytes > 0 and self.size + len(data) > self.max_bytes and self.size > 0:
+            self.rotate()
+        self.file.write(data)
+        self.size += len(data)
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f'{self.path}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.path}.{index + 1}')
+        if self.backups > 0:
+            os.replace(self.path, f'{self.path}.1')
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.size = 0
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class LogPump:
+    """
+    Drains the stdout/stderr pipes of the sing-box process in background threads.
+    Without it a chatty sing-box fills the OS pipe buffer and blocks on write.
+    Only the last `max_lines` lines are kept in memory; optionally everything is
+    also written to a size-rotated log file.
+    """
+    def __init__(self, stdout: Optional[IO[bytes]], stderr: Optional[IO[bytes]],
+                 max_lines: int = 1000, log_file: str = '',
+                 log_file_max_bytes: int = 1024 * 1024, log_file_backups: int = 1):
+        self.lines: Deque[LogLine] = deque(maxlen=max(1, max_lines))
+        self.errors: Deque[LogLine] = deque(maxlen=MAX_ERROR_LINES)
+        self.lock = Lock()
+
+        self.log_file: Optional[RotatingLogFile] = None
+        if log_file:
+            try:
+                self.log_file = RotatingLogFile(log_file, log_file_max_bytes, log_file_backups)
+            except OSError as e:
+                print(f"Failed to open sing-box log file ({log_file}): {e}")
+
+        self.threads: List[Thread] = []
+        for name, stream in (('stdout', stdout), ('stderr', stderr)):
+            if stream is not None:
+                self.threads.append(Thread(target=self._pump, args=(name, stream),
+                                           name=f'sing-box-{name}', daemon=True))
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def join(self, timeout: Optional[float] = None):
+        """Waits until both pipes hit EOF (i.e. the process has exited and its output is drained)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def _pump(self, name: str, stream: IO[bytes]):
+        try:
+            for raw in iter(lambda: stream.readline(MAX_LINE_BYTES), b''):
+                line = parse_log_line(name, raw)
+                with self.lock:
+                    self.lines.append(line)
+                    if line.level in ERROR_LEVELS:
+                        self.errors.append(line)
+                    # Both pumps share the file, so writes happen under the same lock
+                    if self.log_file is not None:
+                        self._write_file(line.text)
+        except (OSError, ValueError):
+            # The pipe was closed under us, nothing left to drain
+            pass
+        finally:
+            try:
+                stream.close()
+            except OSError:
+                pass
+            with self.lock:
+                if self.log_file is not None:
+                    self.log_file.flush()
+
+    def _write_file(self, text: str):
+        # A failing log file must never stop the draining itself
+        try:
+            self.log_file.write(text)
+        except OSError as e:
+            print(f"Failed to write sing-box log file, disabling it: {e}")
+            self.log_file = None
+
+    def recent_lines(self, count: Optional[int] = None) -> List[LogLine]:
+        with self.lock:
+            lines = list(self.lines)
+        return lines if count is None else lines[-count:]
+
+    def recent_errors(self, count: Optional[int] = None) -> List[LogLine]:
+        with self.lock:
+            errors = list(self.errors)
+        return errors if count is None else errors[-count:]
+
+    def close(self):
+        with self.lock:
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
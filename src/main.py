@@ -1,16 +1,27 @@
 # main.py
 
+import time
+MAIN_STARTED = time.perf_counter()
+
 import sys
 import os
 
 import shlex
+from threading import Thread, Event, Lock
 from PIL import Image, ImageDraw
 from pystray import Icon, Menu, MenuItem
 
-from drover import Drover
+# Only what the "starting" tray icon needs is imported up front. drover (and
+# with it requests) is imported by the startup thread, latency, traffic and
+# the menu model where they are first used, once sing-box is up.
 from config_types import ConfigSelector
+from metrics import install_profile_signal, instrumented
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-from typing import List
+if TYPE_CHECKING:
+    from drover import Drover
+    from instances import SingBoxInstance
 
 # =========================================================
 # CROSS-PLATFORM GUI MESSAGE FUNCTION
@@ -37,66 +48,231 @@ else:
 # END OF GUI MESSAGE FUNCTION
 # =========================================================
 
+class StartupProfile:
+    """
+    Milestones of the staged startup, in ms since main.py started running
+    (interpreter startup and onefile extraction come before that). The GUI
+    and the drover thread both mark here, so offsets rather than durations
+    are recorded; report() adds the drover's own phase durations.
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled: bool = enabled
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, name: str):
+        self.marks.append((name, (time.perf_counter() - MAIN_STARTED) * 1000))
+
+    def report(self, drover_phases: List[Tuple[str, float]]) -> str:
+        lines = ['Startup profile (ms since main.py started):']
+        for name, at in sorted(self.marks, key=lambda mark: mark[1]):
+            lines.append(f'  {name:<16}{at:8.1f}')
+            if name == 'drover':
+                lines.extend(f'    {phase:<14}{seconds * 1000:8.1f} (duration)' for phase, seconds in drover_phases)
+        return '\n'.join(lines)
+
+
 class MainApp:
     """Equivalent to TfrmMain"""
-    def __init__(self):
-        self.drover = Drover()
+    def __init__(self, startup: Optional[StartupProfile] = None):
+        self.startup = startup or StartupProfile()
+        self.startup.mark('imports')
+
+        # Set by the startup thread once sing-box and the config are up
+        self.drover: Optional['Drover'] = None
+        self.drover_error: str = ''
+        self.quitting = False
+        self.drover_lock = Lock()
+        self.tray_ready = Event()
         self.is_system_proxy_enabled = False
 
-        # Create a simple generic icon image
-        self.icon_image = self.create_icon_image()
+        # SIGUSR2 can only be hooked on the main thread, before the options are known
+        install_profile_signal()
 
-        # Initialize icon and menu
-        self.menu_items = self.create_menu_items()
+        # Create a simple generic icon image
+        self.icon_frames: Dict[Tuple[Optional[bool], int, int], Image] = {}
+        self.traffic_level: Tuple[int, int] = (0, 0)
+        self.icon_image = self.create_icon_image(None)
+
+        # The tray shows up in a "starting" state, the full menu follows in on_drover_ready
+        self.selector_sections: Dict[str, List[MenuItem]] = {}
+        # Extra instance name -> (the config its section was built from, section)
+        self.instance_sections: Dict[str, Tuple[object, List[MenuItem]]] = {}
+        self.menu_items = self.create_starting_menu_items()
         self.tray_icon = Icon(
             'SingDrover',
             self.icon_image,
-            'SingDrover',
-            self.menu_items
+            'SingDrover (Starting...)',
+            Menu(*self.menu_items)
         )
 
         # TrayIcon.OnClick behavior (toggle system proxy)
-        self.tray_icon.title = 'SingDrover (Disabled)'
-        self.tray_icon.menu = Menu(*self.menu_items)
         self.tray_icon.left_click = self.tray_icon_click
+        self.startup.mark('gui')
+
+        # sing-box launch, config parsing and the selector reset run while the tray comes up
+        self.drover_thread = Thread(target=self.start_drover, name='drover-startup', daemon=True)
+        self.drover_thread.start()
+
+    def start_drover(self):
+        """Startup thread: creates the Drover, then fills in the tray."""
+        try:
+            from drover import Drover
+            self.startup.mark('drover_import')
+            drover = Drover()
+        except Exception as e:
+            print(f"Application initialization failed: {e}")
+            show_error_message("Critical Error", f"Application failed to initialize: {e}")
+            self.drover_error = str(e)
+            self.tray_ready.wait()
+            if not self.quitting:
+                self.tray_icon.stop()
+            return
+        self.startup.mark('drover')
+
+        # Quit may have been clicked while we were starting
+        with self.drover_lock:
+            if not self.quitting:
+                self.drover = drover
+        if self.drover is None:
+            drover.stop_singbox()
+            return
+
+        # The icon and menu can only be changed once the tray is running
+        self.tray_ready.wait()
+        self.on_drover_ready()
+
+    def on_drover_ready(self):
+        """Hooks the drover up to the tray and replaces the "starting" menu with the real one."""
+        if self.drover.singbox_start_error:
+            self.show_singbox_error(self.drover.singbox_start_error)
+
+        # Hooks are set once the tray icon exists, they all end up updating it
+        self.drover.state_sync.on_change = self.on_selector_state_change
+        self.drover.on_config_reloaded = self.on_config_reloaded
+        self.drover.proxy_worker.on_result = self.on_system_proxy_result
+        if self.drover.traffic is not None:
+            self.drover.traffic.on_level = self.on_traffic_level
+        if self.drover.instances is not None:
+            self.drover.instances.on_change = self.on_instance_change
+
+        self.menu_items = self.create_menu_items()
+        self.tray_icon.menu = Menu(*self.menu_items)
 
         if self.drover.options.system_proxy_auto:
             self.toggle_system_proxy(True)
         else:
             self.toggle_system_proxy_icon(False)
+        self.startup.mark('menu')
+
+        if self.startup.enabled:
+            print(self.startup.report(getattr(self.drover, 'startup_phases', [])))
+
+        # Fill in the outbound delays in the background once the tray is up
+        if not self.drover.singbox_start_error:
+            self.start_latency_probe()
+
+    def on_tray_ready(self, icon):
+        """pystray setup callback, run once the tray icon exists."""
+        icon.visible = True
+        self.startup.mark('icon')
+        self.tray_ready.set()
+
+    def stop_drover(self):
+        """Stops sing-box, or has the startup thread do so if it is still starting."""
+        with self.drover_lock:
+            self.quitting = True
+            drover = self.drover
+        if drover is not None:
+            drover.stop_singbox()
+
+    def show_singbox_error(self, error: str):
+        """Notifies the user about a sing-box failure, including its latest logged errors."""
+        message = error
+        recent_errors = [line for line in self.drover.recent_errors() if line not in error]
+        if recent_errors:
+            message += '\n\nRecent sing-box errors:\n' + '\n'.join(recent_errors)
+        show_error_message('sing-box Error', message)
+
+    def create_icon_image(self, enabled: Optional[bool] = True, up_level: int = 0, down_level: int = 0) -> Image:
+        """
+        Returns the tray icon for a proxy state (None while starting) and (up, down) throughput levels.
+        Frames are drawn once and cached; there are only a few dozen of them.
+        """
+        key = (enabled, up_level, down_level)
+        image = self.icon_frames.get(key)
+        if image is None:
+            image = self.icon_frames[key] = self.draw_icon_image(enabled, up_level, down_level)
+        return image
 
-    def create_icon_image(self, enabled: bool = True) -> Image:
+    def draw_icon_image(self, enabled: Optional[bool], up_level: int, down_level: int) -> Image:
         """Creates a simple, generic icon for the tray."""
         # A simple colored square or circle as a placeholder
         width, height = 64, 64
         image = Image.new('RGB', (width, height), color=(255, 255, 255))
         draw = ImageDraw.Draw(image)
-        color = (0, 150, 0) if enabled else (150, 0, 0) # Green for enabled, Red for disabled
+        # Green for enabled, Red for disabled, Grey while starting
+        color = (150, 150, 150) if enabled is None else (0, 150, 0) if enabled else (150, 0, 0)
         draw.ellipse((5, 5, width - 5, height - 5), fill=color)
+
+        # Throughput bars: upload on the left, download on the right, growing with the level
+        if up_level or down_level:
+            levels = len(self.drover.traffic.thresholds)
+            for left, level in ((20, up_level), (36, down_level)):
+                if level > 0:
+                    top = 46 - 28 * min(level, levels) // levels
+                    draw.rectangle((left, top, left + 8, 46), fill=(255, 255, 255))
         return image
 
     def toggle_system_proxy_icon(self, enable: bool):
         """Updates the icon and title based on proxy status."""
-        self.icon_image = self.create_icon_image(enable)
+        self.icon_image = self.create_icon_image(enable, *self.traffic_level)
         self.tray_icon.icon = self.icon_image
         self.tray_icon.title = f'SingDrover ({"Enabled" if enable else "Disabled"})'
 
-    def toggle_system_proxy(self, enable: bool):
-        """Enables/Disables the system proxy."""
-        if enable:
-            success = self.drover.enable_system_proxy()
-        else:
-            success = self.drover.disable_system_proxy()
+    def on_traffic_level(self, up_level: int, down_level: int):
+        """Called by the traffic monitor when the quantized throughput changed (throttled)."""
+        self.traffic_level = (up_level, down_level)
+        self.icon_image = self.create_icon_image(self.is_system_proxy_enabled, up_level, down_level)
+        self.tray_icon.icon = self.icon_image
 
-        if success:
+    def toggle_system_proxy(self, enable: bool):
+        """
+        Enables/Disables the system proxy. The icon follows at once and the backend
+        write happens on the proxy worker; on_system_proxy_result reverts the icon
+        if it fails.
+        """
+        if self.drover is None:
+            # Still starting, there is no proxy to point at yet
+            return
+        if enable != self.is_system_proxy_enabled:
             self.is_system_proxy_enabled = enable
             self.toggle_system_proxy_icon(enable)
-        else:
-            print(f"Failed to {'enable' if enable else 'disable'} system proxy.")
-            # If failed to enable, ensure state remains disabled
-            if enable:
-                self.is_system_proxy_enabled = False
-                self.toggle_system_proxy_icon(False)
+        self.drover.request_system_proxy(enable)
+
+    def on_system_proxy_result(self, enabled: bool, ok: bool):
+        """
+        Called by the proxy worker with the state the system proxy actually ended up in,
+        including while Drover keeps it off during a sing-box restart.
+        """
+        if enabled != self.is_system_proxy_enabled:
+            self.is_system_proxy_enabled = enabled
+            self.toggle_system_proxy_icon(enabled)
+            self.tray_icon.update_menu()
+
+    def on_selector_state_change(self, changed):
+        """Called when the live selection changed (our own switches, other clients, urltest groups)."""
+        self.tray_icon.update_menu()
+
+    def on_instance_change(self, instance: 'SingBoxInstance'):
+        """Called from the instances' event loop when an extra instance's status or selection changed."""
+        self.tray_icon.update_menu()
+
+    def on_config_reloaded(self, diff):
+        """Called after the config file changed: rebuilds only the affected selector sections."""
+        for name in diff.removed + diff.affected:
+            self.selector_sections.pop(name, None)
+        self.menu_items = self.create_menu_items()
+        self.tray_icon.menu = Menu(*self.menu_items)
 
     # --- Event Handlers ---
 
@@ -107,10 +283,10 @@ class MainApp:
     def mi_quit_click(self, icon, item):
         """Equivalent to TfrmMain.miQuitClick (closes the application)."""
         # FormCloseQuery logic is implemented here
-        if self.drover.options.system_proxy_auto:
+        if self.drover is not None and self.drover.options.system_proxy_auto:
             self.toggle_system_proxy(False)
 
-        self.drover.stop_singbox()
+        self.stop_drover()
         self.tray_icon.stop()
 
     def mi_system_proxy_click(self, icon, item):
@@ -121,10 +297,125 @@ class MainApp:
     def mi_selector_click(self, selector_name: str, outbound_name: str):
         """Equivalent to TfrmMain.miSelectorClick (changes a selector outbound)."""
         def handler(icon, item):
-            print(f"Setting selector '{selector_name}' to '{outbound_name}'")
-            self.drover.edit_selector(selector_name, outbound_name)
+            self.select_outbound(selector_name, outbound_name)
+        return handler
+
+    def select_outbound(self, selector_name: str, outbound_name: str):
+        print(f"Setting selector '{selector_name}' to '{outbound_name}'")
+        self.drover.edit_selector(selector_name, outbound_name)
+
+    def mi_instance_selector_click(self, instance_name: str, selector_name: str, outbound_name: str):
+        """Changes a selector outbound of an extra instance."""
+        def handler(icon, item):
+            self.select_instance_outbound(instance_name, selector_name, outbound_name)
+        return handler
+
+    def select_instance_outbound(self, instance_name: str, selector_name: str, outbound_name: str):
+        print(f"Setting selector '{selector_name}' of instance '{instance_name}' to '{outbound_name}'")
+        self.drover.instances.set_selectors(instance_name, {selector_name: outbound_name})
+
+    def mi_auto_select_click(self, selector_name: str):
+        """Toggles the auto (fastest outbound) mode of a selector."""
+        def handler(icon, item):
+            self.drover.set_auto_select(selector_name, not self.drover.is_auto_select(selector_name))
         return handler
 
+    def mi_test_latency_click(self, icon, item):
+        """Re-measures outbound delays (only the ones whose cached result has expired)."""
+        self.start_latency_probe()
+
+    def start_latency_probe(self, force: bool = False):
+        def probe():
+            self.drover.probe_latency(force)
+            self.tray_icon.update_menu()
+        Thread(target=probe, name='latency-probe', daemon=True).start()
+
+    def outbound_label(self, outbound_name: str) -> str:
+        """Menu text of an outbound: its name plus the last measured delay, if any."""
+        from latency import LATENCY_FAILED
+        delay = self.drover.get_outbound_delay(outbound_name)
+        if delay is None:
+            return outbound_name
+        if delay == LATENCY_FAILED:
+            return f'{outbound_name} (timeout)'
+        return f'{outbound_name} ({delay} ms)'
+
+    @instrumented('singdrover_menu_build_seconds', builder='traffic')
+    def traffic_menu_items(self) -> List[MenuItem]:
+        """Contents of the Traffic submenu: current totals, then the top outbounds and hosts."""
+        from traffic import format_rate
+        items: List[MenuItem] = []
+        traffic = self.drover.traffic
+        if traffic is not None:
+            items.append(MenuItem(f'↑ {format_rate(traffic.up)}  ↓ {format_rate(traffic.down)}',
+                                  None, enabled=False))
+
+        count = self.drover.options.monitor_top_count
+        monitor = self.drover.connection_monitor
+        for caption, top in (('Top outbounds', monitor.top_outbounds(count)),
+                             ('Top hosts', monitor.top_hosts(count))):
+            items.append(Menu.SEPARATOR)
+            items.append(MenuItem(caption, None, enabled=False))
+            for name, up, down in top:
+                items.append(MenuItem(f'{name}  ↑ {format_rate(up)}  ↓ {format_rate(down)}', None, enabled=False))
+            if not top:
+                items.append(MenuItem('(no traffic yet)', None, enabled=False))
+        return items
+
+    @instrumented('singdrover_menu_build_seconds', builder='selector_section')
+    def create_selector_section(self, selector: ConfigSelector) -> List[MenuItem]:
+        """Builds the menu items of one selector (a submenu or a flat captioned group)."""
+        is_nested = self.drover.options.selector_menu_layout == 'nested'
+
+        # Auto mode toggle, shown before the outbounds themselves
+        mi_auto_select = MenuItem(
+            'Auto (fastest)',
+            self.mi_auto_select_click(selector.name),
+            checked=lambda item, selector_name=selector.name: self.drover.is_auto_select(selector_name)
+        )
+
+        if len(selector.outbounds) > self.drover.options.menu_page_size:
+            # Large selectors always get a lazily built, bucketed and paged submenu
+            from menu_model import SelectorMenuModel
+            model = SelectorMenuModel(
+                selector,
+                on_select=self.select_outbound,
+                label_func=self.outbound_label,
+                selected_func=self.drover.get_selected,
+                delay_func=self.drover.get_outbound_delay,
+                refresh=lambda: self.tray_icon.update_menu(),
+                page_size=self.drover.options.menu_page_size,
+                max_buckets=self.drover.options.menu_max_buckets,
+                pinned_count=self.drover.options.menu_pinned_count
+            )
+            return [MenuItem(selector.name, Menu(lambda: [mi_auto_select, Menu.SEPARATOR] + model.items()))]
+
+        # Create outbound menu items for the current selector
+        outbound_items: List[MenuItem] = [mi_auto_select]
+
+        for outbound_name in selector.outbounds:
+
+            # The check mark follows the live selection mirrored by the drover
+            # (an in-memory lookup, no API call per menu redraw).
+            def outbound_checked_func(item, selector_name=selector.name, outbound_name=outbound_name):
+                return self.drover.get_selected(selector_name) == outbound_name
+
+            outbound_item = MenuItem(
+                lambda item, outbound_name=outbound_name: self.outbound_label(outbound_name),
+                self.mi_selector_click(selector.name, outbound_name),
+                radio=True,
+                checked=outbound_checked_func
+            )
+            outbound_items.append(outbound_item)
+
+        if is_nested:
+            # Nested menu: Selector name is the parent menu item
+            return [MenuItem(selector.name, Menu(*outbound_items))]
+
+        # Flat menu: Selector name is a disabled caption, followed by outbounds
+        return [MenuItem(selector.name, lambda x: None, enabled=False)] + outbound_items + [Menu.SEPARATOR]
+
+    @instrumented('singdrover_menu_build_seconds', builder='menu')
     def create_menu_items(self) -> List[MenuItem]:
         """Equivalent to TfrmMain.DrawSelectors and PopupMenu initialization."""
 
@@ -140,61 +431,118 @@ class MainApp:
 
         menu_list: List[MenuItem] = [mi_system_proxy, Menu.SEPARATOR] # miBeforeSelectors is implicitly here
 
-        # 2. Selector Items
-        is_nested = self.drover.options.selector_menu_layout == 'nested'
-
+        # 2. Selector Items (sections are cached, a config reload rebuilds only the changed ones)
         for selector in self.drover.sb_config.selectors:
-            # Create outbound menu items for the current selector
-            outbound_items: List[MenuItem] = []
-            for outbound_name in selector.outbounds:
-
-                # Logic to determine which outbound is currently selected
-                # Note: The original code used item.Checked to set the default on menu creation.
-                # Here, we need a dynamic check for the pystray MenuItem.
-                # In a real-world app, we'd fetch the current setting from the sing-box API,
-                # but for simplicity, we assume the initial 'default' is the current setting.
-
-                def outbound_checked_func(outbound_name=outbound_name, selector_default_name=selector.default_name):
-                    # We can't easily query the live state, so we mark the default as checked initially
-                    return outbound_name == selector_default_name
-
-                outbound_item = MenuItem(
-                    outbound_name,
-                    self.mi_selector_click(selector.name, outbound_name),
-                    radio=True,
-                    checked=outbound_checked_func # Will not update dynamically without API query
-                )
-                outbound_items.append(outbound_item)
-
-            if is_nested:
-                # Nested menu: Selector name is the parent menu item
-                selector_menu = MenuItem(selector.name, Menu(*outbound_items))
-                menu_list.append(selector_menu)
-            else:
-                # Flat menu: Selector name is a disabled caption, followed by outbounds
-                menu_list.append(MenuItem(selector.name, lambda x: None, enabled=False))
-                menu_list.extend(outbound_items)
-                menu_list.append(Menu.SEPARATOR) # Separator after the group
-
-        # 3. Quit
+            section = self.selector_sections.get(selector.name)
+            if section is None:
+                section = self.create_selector_section(selector)
+                self.selector_sections[selector.name] = section
+            menu_list.extend(section)
+
+        # 3. Extra sing-box instances, one submenu each
+        if self.drover.instances is not None:
+            for instance in self.drover.instances.instances.values():
+                menu_list.append(MenuItem(
+                    lambda item, instance=instance: f'{instance.name} ({instance.status})',
+                    Menu(lambda instance=instance: self.instance_menu_items(instance))
+                ))
+            menu_list.append(Menu.SEPARATOR)
+
+        # 4. Latency and traffic
+        menu_list.append(MenuItem('Test Latency', self.mi_test_latency_click))
+        if self.drover.connection_monitor is not None:
+            menu_list.append(MenuItem('Traffic', Menu(self.traffic_menu_items)))
+
+        # 5. Quit
         menu_list.append(Menu.SEPARATOR)
         menu_list.append(MenuItem('Quit', self.mi_quit_click))
 
         return menu_list
 
+    @instrumented('singdrover_menu_build_seconds', builder='instance')
+    def instance_menu_items(self, instance: 'SingBoxInstance') -> List[MenuItem]:
+        """
+        Contents of an extra instance's submenu: its last error, if any, then one
+        submenu per selector. Built once per loaded config of the instance.
+        """
+        items: List[MenuItem] = []
+        if instance.error:
+            items.append(MenuItem(instance.error.splitlines()[0], None, enabled=False))
+        if instance.config is None:
+            return items or [MenuItem('Starting sing-box...', None, enabled=False)]
+
+        cached = self.instance_sections.get(instance.name)
+        if cached is None or cached[0] is not instance.config:
+            cached = self.instance_sections[instance.name] = (instance.config,
+                                                              self.create_instance_section(instance))
+        return items + cached[1]
+
+    def create_instance_section(self, instance: 'SingBoxInstance') -> List[MenuItem]:
+        """One submenu per selector of an extra instance; large selectors get the paged model."""
+        from menu_model import SelectorMenuModel
+
+        options = self.drover.options
+
+        def select(selector_name: str, outbound_name: str):
+            self.select_instance_outbound(instance.name, selector_name, outbound_name)
+
+        section: List[MenuItem] = []
+        for selector in instance.config.selectors:
+            if len(selector.outbounds) > options.menu_page_size:
+                model = SelectorMenuModel(
+                    selector,
+                    on_select=select,
+                    label_func=lambda outbound_name: outbound_name,
+                    selected_func=instance.get_selected,
+                    delay_func=lambda outbound_name: None,
+                    refresh=lambda: self.tray_icon.update_menu(),
+                    page_size=options.menu_page_size,
+                    max_buckets=options.menu_max_buckets,
+                    pinned_count=options.menu_pinned_count
+                )
+                section.append(MenuItem(selector.name, Menu(model.items)))
+                continue
+
+            outbound_items = [MenuItem(
+                outbound_name,
+                self.mi_instance_selector_click(instance.name, selector.name, outbound_name),
+                radio=True,
+                checked=lambda item, selector_name=selector.name, outbound_name=outbound_name:
+                    instance.get_selected(selector_name) == outbound_name
+            ) for outbound_name in selector.outbounds]
+            section.append(MenuItem(selector.name, Menu(*outbound_items)))
+        return section
+
+    def create_starting_menu_items(self) -> List[MenuItem]:
+        """The menu shown until sing-box is up: a status line and Quit."""
+        return [
+            MenuItem('Starting sing-box...', None, enabled=False),
+            Menu.SEPARATOR,
+            MenuItem('Quit', self.mi_quit_click)
+        ]
+
     def run(self):
         """Starts the main loop for the tray icon."""
-        print(f"Starting Drover App in {self.drover.options.selector_menu_layout} layout...")
+        print("Starting Drover App...")
         try:
-            self.tray_icon.run()
+            self.tray_icon.run(setup=self.on_tray_ready)
         except NotImplementedError as e:
             # Catch exceptions from system_proxy.py if OS is unsupported
             print(f"FATAL ERROR: {e}")
-            self.drover.stop_singbox()
+            self.stop_drover()
             sys.exit(1)
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
-            self.drover.stop_singbox()
+            self.stop_drover()
+            sys.exit(1)
+        finally:
+            # The tray is gone: a startup still in progress stops sing-box instead of
+            # filling in the menu, and is waited for so sing-box is not left behind
+            with self.drover_lock:
+                self.quitting = True
+            self.tray_ready.set()
+            self.drover_thread.join()
+        if self.drover_error:
             sys.exit(1)
 
 
@@ -204,8 +552,9 @@ if __name__ == '__main__':
     # 1. sing-box.exe (or the executable for your OS)
     # 2. config.json (a valid sing-box config)
     # 3. options.json (for custom settings)
+    # --profile-startup prints when each startup stage finished
     try:
-        app = MainApp()
+        app = MainApp(StartupProfile(enabled='--profile-startup' in sys.argv[1:]))
         app.run()
     except Exception as e:
         print(f"Application initialization failed: {e}")
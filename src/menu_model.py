@@ -0,0 +1,186 @@
+# menu_model.py
+
+import re
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from pystray import Menu, MenuItem
+
+from config_types import ConfigSelector
+from metrics import instrumented
+
+# Leading flag/emoji (anything that is not a letter or digit) or leading letters
+# up to a separator, e.g. "🇩🇪 Frankfurt 1" -> "🇩🇪", "US-West-03" -> "US"
+_PREFIX_RE = re.compile(r'\s*([^\w\s]+|[A-Za-z]+)')
+
+
+def bucket_key(name: str) -> str:
+    match = _PREFIX_RE.match(name)
+    return match.group(1) if match else '#'
+
+
+class OutboundEntry:
+    """
+    Menu entry of one outbound. Only entries of materialized pages exist, and
+    they hold plain references instead of a set of closures per node.
+    """
+    __slots__ = ('model', 'outbound')
+
+    def __init__(self, model: 'SelectorMenuModel', outbound: str):
+        self.model = model
+        self.outbound: str = outbound
+
+    def select(self, icon, item):
+        self.model.select(self.outbound)
+
+    def text(self, item) -> str:
+        return self.model.label_func(self.outbound)
+
+    def checked(self, item) -> bool:
+        return self.model.selected_func(self.model.selector.name) == self.outbound
+
+    def menu_item(self) -> MenuItem:
+        return MenuItem(self.text, self.select, radio=True, checked=self.checked)
+
+
+class MenuBucket:
+    """A group of outbounds shown as one submenu, one page at a time."""
+    __slots__ = ('label', 'outbounds', 'page', 'items')
+
+    def __init__(self, label: str, outbounds: List[str]):
+        self.label: str = label
+        self.outbounds: List[str] = outbounds
+        self.page: int = 0
+        # Materialized items of the current page, built on first display
+        self.items: Optional[List[MenuItem]] = None
+
+
+class SelectorMenuModel:
+    """
+    Lazily materialized menu of a large selector.
+    Outbounds are grouped into buckets (by name prefix, e.g. a region tag, or by
+    alphabetical range when prefixes don't split them usefully); each bucket is
+    a submenu showing `page_size` items at a time, with the fastest and most
+    recently picked outbounds pinned on top. Buckets and their items are built
+    the first time the menu is drawn, not when the tray starts.
+    """
+    def __init__(self, selector: ConfigSelector,
+                 on_select: Callable[[str, str], None],
+                 label_func: Callable[[str], str],
+                 selected_func: Callable[[str], str],
+                 delay_func: Callable[[str], Optional[int]],
+                 refresh: Callable[[], None],
+                 page_size: int = 50, max_buckets: int = 26, pinned_count: int = 5):
+        self.selector = selector
+        self.on_select = on_select
+        self.label_func = label_func
+        self.selected_func = selected_func
+        self.delay_func = delay_func
+        self.refresh = refresh
+        self.page_size: int = max(1, page_size)
+        self.max_buckets: int = max(1, max_buckets)
+        self.pinned_count: int = pinned_count
+
+        self.recent: Deque[str] = deque(maxlen=pinned_count)
+        self._buckets: Optional[List[MenuBucket]] = None
+        self._entries: Dict[str, OutboundEntry] = {}
+
+    def select(self, outbound: str):
+        if outbound in self.recent:
+            self.recent.remove(outbound)
+        self.recent.appendleft(outbound)
+        self.on_select(self.selector.name, outbound)
+
+    def entry(self, outbound: str) -> OutboundEntry:
+        entry = self._entries.get(outbound)
+        if entry is None:
+            entry = self._entries[outbound] = OutboundEntry(self, outbound)
+        return entry
+
+    # --- Buckets ---
+
+    @property
+    def buckets(self) -> List[MenuBucket]:
+        if self._buckets is None:
+            self._buckets = self._make_buckets(self.selector.outbounds)
+        return self._buckets
+
+    def _make_buckets(self, outbounds: Sequence[str]) -> List[MenuBucket]:
+        if len(outbounds) <= self.page_size:
+            return [MenuBucket(self.selector.name, list(outbounds))]
+
+        groups: Dict[str, List[str]] = {}
+        for name in outbounds:
+            groups.setdefault(bucket_key(name), []).append(name)
+
+        if 1 < len(groups) <= self.max_buckets:
+            return [MenuBucket(f'{key} ({len(names)})', names) for key, names in groups.items()]
+
+        # Prefixes are useless here (all the same, or far too many): split by sorted ranges
+        ordered = sorted(outbounds, key=str.casefold)
+        chunk = max(self.page_size, -(-len(ordered) // self.max_buckets))
+        return [MenuBucket(f'{ordered[start]} … {ordered[min(start + chunk, len(ordered)) - 1]}',
+                           ordered[start:start + chunk])
+                for start in range(0, len(ordered), chunk)]
+
+    def _bucket_items(self, bucket: MenuBucket) -> List[MenuItem]:
+        if bucket.items is None:
+            start = bucket.page * self.page_size
+            page = bucket.outbounds[start:start + self.page_size]
+            items = [self.entry(name).menu_item() for name in page]
+
+            pages = -(-len(bucket.outbounds) // self.page_size)
+            if pages > 1:
+                items.append(Menu.SEPARATOR)
+                items.append(MenuItem(f'Page {bucket.page + 1}/{pages}: next ›',
+                                      lambda icon, item, bucket=bucket: self._next_page(bucket)))
+            bucket.items = items
+        return bucket.items
+
+    def _next_page(self, bucket: MenuBucket):
+        pages = -(-len(bucket.outbounds) // self.page_size)
+        bucket.page = (bucket.page + 1) % pages
+        bucket.items = None
+        self.refresh()
+
+    # --- Pinned ---
+
+    def fastest(self) -> List[str]:
+        measured: List[Tuple[int, str]] = []
+        for name in self.selector.outbounds:
+            delay = self.delay_func(name)
+            if delay is not None and delay > 0:
+                measured.append((delay, name))
+        measured.sort()
+        return [name for _, name in measured[:self.pinned_count]]
+
+    def pinned_items(self) -> List[MenuItem]:
+        items: List[MenuItem] = []
+        current = self.selected_func(self.selector.name)
+        if current:
+            items.append(MenuItem('Current', None, enabled=False))
+            items.append(self.entry(current).menu_item())
+
+        for caption, names in (('Fastest', self.fastest()), ('Recent', list(self.recent))):
+            names = [name for name in names if name != current]
+            if names:
+                items.append(MenuItem(caption, None, enabled=False))
+                items.extend(self.entry(name).menu_item() for name in names)
+
+        if items:
+            items.append(Menu.SEPARATOR)
+        return items
+
+    # --- Menu ---
+
+    @instrumented('singdrover_menu_build_seconds', builder='selector_model')
+    def items(self) -> List[MenuItem]:
+        """Contents of the selector's submenu; called by pystray whenever the menu is (re)built."""
+        items = self.pinned_items()
+        buckets = self.buckets
+        if len(buckets) == 1:
+            return items + self._bucket_items(buckets[0])
+
+        for bucket in buckets:
+            items.append(MenuItem(bucket.label, Menu(lambda bucket=bucket: self._bucket_items(bucket))))
+        return items
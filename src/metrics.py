@@ -0,0 +1,344 @@
+# metrics.py
+
+# Cheap to import on purpose, it is loaded before the tray icon is shown:
+# the profiler modules are imported when a session starts and the exporters
+# live in metrics_export.py.
+
+import bisect
+import functools
+import io
+import os
+import signal
+import sys
+import time
+from array import array
+from threading import Lock, Timer, local
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import cProfile
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+    'singdrover_startup_phase_seconds': 'Duration of the Drover startup phases.',
+    'singdrover_api_request_seconds': 'Clash API request latency, including retries.',
+    'singdrover_api_requests_total': 'Clash API requests by outcome.',
+    'singdrover_selector_batch_seconds': 'Time to apply one batch of selector changes.',
+    'singdrover_selector_changes_total': 'Selector changes sent to sing-box by outcome.',
+    'singdrover_singbox_start_seconds': 'Time to spawn the sing-box process.',
+    'singdrover_system_proxy_seconds': 'Time to change the system proxy settings.',
+    'singdrover_system_proxy_total': 'System proxy changes by outcome.',
+    'singdrover_menu_build_seconds': 'Time spent building tray menu items.',
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts per bucket live in one array."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = array('L', bytes(array('L').itemsize * (len(buckets) + 1)))
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _NullTimer:
+    """What timer() hands out while metrics are off: a do-nothing context manager."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'labels', 'started')
+
+    def __init__(self, metrics: 'Metrics', name: str, labels: Dict[str, str]):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Metrics:
+    """
+    Process-wide counters and latency histograms.
+    Everything is a no-op until `enabled` is set: timer() returns a shared null
+    context manager and inc()/observe() return after one attribute check, so
+    instrumented hot paths cost next to nothing when metrics are off.
+    """
+    def __init__(self):
+        self.enabled: bool = False
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._lock = Lock()
+
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name: str, **labels: str):
+        """Context manager observing the duration of its block into histogram `name`."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                self._header(lines, name, 'counter')
+                for key, value in series.items():
+                    lines.append(f'{name}{_labels(key)} {value:g}')
+
+            for name, series in sorted(self.histograms.items()):
+                self._header(lines, name, 'histogram')
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                        lines.append(f'{name}_bucket{_labels(key + (("le", le),))} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(key)} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{_labels(key)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _header(lines: List[str], name: str, kind: str):
+        if name in DESCRIPTIONS:
+            lines.append(f'# HELP {name} {DESCRIPTIONS[name]}')
+        lines.append(f'# TYPE {name} {kind}')
+
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ''
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in key)
+    return '{' + ','.join(escaped) + '}'
+
+
+METRICS = Metrics()
+
+
+class PhaseClock:
+    """
+    Observes the time between successive mark() calls, labelled by phase (e.g.
+    startup steps). The durations are also kept in `phases`, metrics or not,
+    for --profile-startup.
+    """
+    __slots__ = ('name', 'last', 'phases')
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.last: float = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        METRICS.observe(self.name, now - self.last, phase=phase)
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+
+def instrumented(name: str, **labels: str) -> Callable:
+    """
+    Decorator timing every call into histogram `name`. While a profile session
+    is running, the call is also recorded by the calling thread's profiler.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return func(*args, **kwargs)
+            with _Timer(METRICS, name, labels):
+                if PROFILER.active:
+                    return PROFILER.call(func, *args, **kwargs)
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- On-demand profiling ---
+
+# cProfile uses sys.monitoring since 3.12: one active profiler per process, seeing all threads
+SHARED_PROFILER = sys.version_info >= (3, 12)
+
+
+class ProfileSession:
+    """
+    cProfile on demand. Before Python 3.12 cProfile only sees the thread that
+    enabled it, so every thread entering an instrumented call gets its own
+    profiler for the duration of the session. Since 3.12 it sits on
+    sys.monitoring, which allows one profiler per process that sees every
+    thread, so the threads share one that is enabled while any of them is in
+    an instrumented call (call counts of overlapping calls are approximate
+    then). If another profiler is already active, calls run unprofiled. The
+    profiles are merged into one .prof file (plus a printed top list) when the
+    session ends. Triggered by SIGUSR2 or GET /profile.
+    """
+    def __init__(self):
+        self.active: bool = False
+        self.output_dir: str = ''
+        self.seconds: float = 30.0 # length of a session started by SIGUSR2
+        self._profiles: List['cProfile.Profile'] = []
+        self._shared: Optional['cProfile.Profile'] = None
+        self._shared_calls: int = 0 # instrumented calls running under _shared
+        self._unavailable: bool = False # reported that another profiler is active
+        self._local = local()
+        self._lock = Lock()
+
+    def start(self, seconds: float) -> bool:
+        """Starts a session of `seconds`; returns False if one is already running."""
+        with self._lock:
+            if self.active:
+                return False
+            self._profiles = []
+            self._unavailable = False
+            self.active = True
+        timer = Timer(seconds, self.finish)
+        timer.daemon = True
+        timer.start()
+        print(f"Profiling instrumented calls for {seconds:g} s")
+        return True
+
+    def call(self, func: Callable, *args, **kwargs):
+        if getattr(self._local, 'running', False):
+            # Nested instrumented call, the outer one is already being profiled
+            return func(*args, **kwargs)
+        profile = self._enable()
+        if profile is None:
+            # Profiling must never break the call itself
+            return func(*args, **kwargs)
+
+        self._local.running = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._local.running = False
+            self._disable(profile)
+
+    def _enable(self) -> Optional['cProfile.Profile']:
+        """Enables this thread's profiler; None if the session ended or another profiler is active."""
+        import cProfile
+        with self._lock:
+            if not self.active:
+                return None
+            if SHARED_PROFILER:
+                if self._shared_calls:
+                    self._shared_calls += 1
+                    return self._shared
+                profile = self._shared or cProfile.Profile()
+            else:
+                profile = getattr(self._local, 'profile', None)
+                if profile not in self._profiles:
+                    profile = self._local.profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # Another profiler or debugger holds sys.monitoring
+                if not self._unavailable:
+                    self._unavailable = True
+                    print(f"Profiling unavailable: {e}")
+                return None
+            if profile not in self._profiles:
+                self._profiles.append(profile)
+            if SHARED_PROFILER:
+                self._shared, self._shared_calls = profile, 1
+            return profile
+
+    def _disable(self, profile: 'cProfile.Profile'):
+        with self._lock:
+            if profile is self._shared:
+                self._shared_calls -= 1
+                if self._shared_calls:
+                    return
+            profile.disable()
+
+    def finish(self) -> Optional[str]:
+        with self._lock:
+            self.active = False
+            profiles, self._profiles = self._profiles, []
+            # pstats disables the profilers it reads; calls still inside one carry on unprofiled
+            self._shared, self._shared_calls = None, 0
+        if not profiles:
+            print("Profiling finished: no instrumented calls were made")
+            return None
+
+        import pstats
+        import tempfile
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        path = os.path.join(self.output_dir or tempfile.gettempdir(),
+                            f'singdrover-{time.strftime("%Y%m%d-%H%M%S")}.prof')
+        try:
+            stats.dump_stats(path)
+        except OSError as e:
+            print(f"Failed to write profile ({path}): {e}")
+            path = ''
+
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats('cumulative').print_stats(20)
+        print(f"Profile written to {path or '(nowhere)'}\n{summary.getvalue()}")
+        return path
+
+
+PROFILER = ProfileSession()
+
+
+def install_profile_signal(seconds: Optional[float] = None):
+    """
+    Starts a profile session on SIGUSR2 (POSIX only), if metrics are enabled by
+    then. Must run on the main thread, so the tray app installs it before the
+    options are known; `seconds` updates the session length.
+    """
+    if seconds is not None:
+        PROFILER.seconds = seconds
+    if sys.platform == 'win32' or not hasattr(signal, 'SIGUSR2'):
+        return
+    try:
+        signal.signal(signal.SIGUSR2, lambda *_: METRICS.enabled and PROFILER.start(PROFILER.seconds))
+    except ValueError:
+        # Not called from the main thread
+        pass
@@ -0,0 +1,103 @@
+# metrics_export.py
+#
+# Ways to get the numbers collected in metrics.py out of the process: a
+# Prometheus text file and a local HTTP endpoint (which can also start a
+# profiling session). Kept out of metrics.py, which is imported before the
+# tray icon is shown: this module, and http.server with it, is only imported
+# by Drover.start_metrics() when metrics are switched on.
+
+import math
+import os
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Event
+from typing import List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from metrics import METRICS, PROFILER
+
+# Longest profiling session /profile starts; longer requests are cut to this
+PROFILE_MAX_SECONDS = 600.0
+
+
+class MetricsFileWriter(Thread):
+    """Rewrites a Prometheus text file (e.g. for node_exporter's textfile collector) every `interval` seconds."""
+    def __init__(self, path: str, interval: float = 15.0):
+        super().__init__(name='metrics-writer', daemon=True)
+        self.path: str = path
+        self.interval: float = interval
+        self._stopping = Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            self.write()
+        self.write()
+
+    def write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(METRICS.render())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Failed to write metrics ({self.path}): {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/metrics':
+            self._reply(200, METRICS.render(), 'text/plain; version=0.0.4')
+        elif url.path == '/profile':
+            seconds = profile_seconds(parse_qs(url.query).get('seconds'))
+            if seconds is None:
+                self._reply(400, 'seconds must be a positive number\n', 'text/plain')
+                return
+            started = PROFILER.start(seconds)
+            self._reply(202 if started else 409, 'started\n' if started else 'already running\n', 'text/plain')
+        else:
+            self._reply(404, 'not found\n', 'text/plain')
+
+    def _reply(self, status: int, text: str, content_type: str):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def profile_seconds(values: Optional[List[str]]) -> Optional[float]:
+    """Session length from the `seconds` query values, clamped to PROFILE_MAX_SECONDS; None if invalid."""
+    if not values:
+        return PROFILER.seconds
+    try:
+        seconds = float(values[-1])
+    except ValueError:
+        return None
+    if math.isnan(seconds) or seconds <= 0:
+        return None
+    return min(seconds, PROFILE_MAX_SECONDS)
+
+
+class MetricsHttpServer(ThreadingHTTPServer):
+    """Local endpoint: GET /metrics for Prometheus, GET /profile?seconds=N to start profiling."""
+    daemon_threads = True
+
+    def __init__(self, port: int, host: str = '127.0.0.1'):
+        super().__init__((host, port), _MetricsHandler)
+
+    def start(self):
+        Thread(target=self.serve_forever, name='metrics-http', daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
@@ -0,0 +1,373 @@
+# proxy_backends.py
+
+import ast
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+# Hosts that never go through the proxy
+PROXY_BYPASS = ['localhost', '127.0.0.0/8', '::1']
+
+# XDG_CURRENT_DESKTOP values of desktops that use the org.gnome.system.proxy settings
+GNOME_DESKTOPS = ('GNOME', 'UNITY', 'X-CINNAMON', 'CINNAMON', 'BUDGIE', 'PANTHEON', 'POP')
+
+# ProxyType values in kioslaverc
+KDE_PROXY_NONE = 0
+KDE_PROXY_MANUAL = 1
+
+BACKEND_TIMEOUT = 5.0
+
+
+class ProxyState:
+    """The proxy settings a backend holds; host, port and bypass only matter while enabled."""
+    __slots__ = ('enabled', 'host', 'port', 'bypass')
+
+    def __init__(self, enabled: bool, host: str = '', port: int = 0, bypass: Optional[List[str]] = None):
+        self.enabled: bool = enabled
+        self.host: str = host
+        self.port: int = port
+        self.bypass: List[str] = list(PROXY_BYPASS if bypass is None else bypass)
+
+    def satisfies(self, wanted: 'ProxyState') -> bool:
+        """True if writing `wanted` over this state would change nothing that matters."""
+        if not wanted.enabled:
+            return not self.enabled
+        return (self.enabled and self.host == wanted.host and self.port == wanted.port
+                and self.bypass == wanted.bypass)
+
+    def __repr__(self) -> str:
+        if not self.enabled:
+            return 'ProxyState(disabled)'
+        return f'ProxyState({self.host}:{self.port}, bypass={self.bypass})'
+
+
+class ProxyBackend:
+    """
+    One way of setting the desktop's proxy. apply() reads the current settings
+    first and only writes when they differ, so repeated toggles cost a single read.
+    """
+    name = ''
+
+    def read_state(self) -> Optional[ProxyState]:
+        """The current settings, or None if they can't be determined (forces a write)."""
+        raise NotImplementedError
+
+    def write_state(self, state: ProxyState):
+        raise NotImplementedError
+
+    def apply(self, state: ProxyState) -> bool:
+        try:
+            current = self.read_state()
+            if current is not None and current.satisfies(state):
+                return True
+            self.write_state(state)
+            return True
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            print(f"Failed to apply proxy settings ({self.name}): {e}")
+            return False
+
+
+# --- GNOME (dconf) ---
+
+def _gvariant(value) -> str:
+    """GVariant text form of a string, int or list of strings, as `dconf dump` prints it."""
+    if isinstance(value, list):
+        return '[' + ', '.join(_gvariant(item) for item in value) + ']'
+    if isinstance(value, int):
+        return str(value)
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def _parse_gvariant(text: str):
+    """Parses the subset of GVariant text used by the proxy keys (strings, ints, string arrays)."""
+    text = text.strip()
+    if text.startswith('@'):
+        # Type annotation of an empty value, e.g. "@as []"
+        text = text.split(' ', 1)[1] if ' ' in text else ''
+    return ast.literal_eval(text)
+
+
+def parse_keyfile(text: str) -> Dict[str, Dict[str, str]]:
+    """Splits `dconf dump` output into {section: {key: raw value}}."""
+    sections: Dict[str, Dict[str, str]] = {}
+    current: Optional[Dict[str, str]] = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            current = sections.setdefault(line[1:-1], {})
+        elif current is not None and '=' in line:
+            key, value = line.split('=', 1)
+            current[key.strip()] = value.strip()
+    return sections
+
+
+class GnomeProxyBackend(ProxyBackend):
+    """
+    org.gnome.system.proxy through dconf: one `dconf dump` to read the settings and
+    one `dconf load` to write all keys in a single transaction, instead of a
+    gsettings process per key. `env` overrides the environment of the dconf
+    processes, e.g. DCONF_PROFILE or XDG_CONFIG_HOME for a private database.
+    """
+    name = 'gnome'
+
+    def __init__(self, dconf: str = 'dconf', env: Optional[Dict[str, str]] = None,
+                 directory: str = '/system/proxy/'):
+        self.dconf: str = dconf
+        self.env: Optional[Dict[str, str]] = dict(os.environ, **env) if env else None
+        self.directory: str = directory
+
+    def available(self) -> bool:
+        return shutil.which(self.dconf) is not None
+
+    def _run(self, command: str, input: Optional[str] = None) -> str:
+        result = subprocess.run([self.dconf, command, self.directory], input=input, env=self.env,
+                                capture_output=True, text=True, timeout=BACKEND_TIMEOUT)
+        if result.returncode != 0:
+            raise OSError(f"dconf {command} failed: {result.stderr.strip() or result.returncode}")
+        return result.stdout
+
+    def read_state(self) -> Optional[ProxyState]:
+        sections = parse_keyfile(self._run('dump'))
+        root = sections.get('/', {})
+        http = sections.get('http', {})
+        try:
+            # Keys at their default value are not listed by dconf dump
+            mode = _parse_gvariant(root.get('mode', "'none'"))
+            host = _parse_gvariant(http.get('host', "''"))
+            port = _parse_gvariant(http.get('port', '8080'))
+            bypass = _parse_gvariant(root['ignore-hosts']) if 'ignore-hosts' in root else None
+        except (ValueError, SyntaxError):
+            return None
+        if mode != 'manual':
+            return ProxyState(False)
+        # The https and socks keys are always written together with the http ones
+        for scheme in ('https', 'socks'):
+            section = sections.get(scheme, {})
+            try:
+                if (_parse_gvariant(section.get('host', "''")) != host
+                        or _parse_gvariant(section.get('port', '0')) != port):
+                    return None
+            except (ValueError, SyntaxError):
+                return None
+        return ProxyState(True, host, port, bypass)
+
+    def write_state(self, state: ProxyState):
+        if not state.enabled:
+            self._run('load', "[/]\nmode='none'\n")
+            return
+
+        lines = ['[/]', "mode='manual'", f'ignore-hosts={_gvariant(state.bypass)}']
+        for scheme in ('http', 'https', 'socks'):
+            lines += ['', f'[{scheme}]', f'host={_gvariant(state.host)}', f'port={_gvariant(state.port)}']
+        self._run('load', '\n'.join(lines) + '\n')
+
+
+# --- KDE (kioslaverc) ---
+
+def _config_home(home: Optional[str]) -> str:
+    if home:
+        return os.path.join(home, '.config')
+    return os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+
+
+def _atomic_write(path: str, text: str):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+
+
+class KdeProxyBackend(ProxyBackend):
+    """
+    KDE proxy settings in kioslaverc. Only the [Proxy Settings] keys we own are
+    rewritten (the rest of the file is kept as is), followed by a single D-Bus
+    signal telling running KIO workers to reparse their configuration.
+    """
+    name = 'kde'
+    SECTION = 'Proxy Settings'
+    _SECTION_RE = re.compile(r'^\s*\[([^\]]*)\]')
+
+    def __init__(self, home: Optional[str] = None, dbus_send: str = 'dbus-send'):
+        self.path: str = os.path.join(_config_home(home), 'kioslaverc')
+        self.dbus_send: str = dbus_send
+
+    def available(self) -> bool:
+        return True
+
+    def _read_lines(self) -> List[str]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def _section_range(self, lines: List[str]) -> Tuple[int, int]:
+        """Start (after the header) and end of [Proxy Settings], or (-1, -1)."""
+        start = -1
+        for index, line in enumerate(lines):
+            match = self._SECTION_RE.match(line)
+            if match is None:
+                continue
+            if start >= 0:
+                return start, index
+            if match.group(1) == self.SECTION:
+                start = index + 1
+        return (start, len(lines)) if start >= 0 else (-1, -1)
+
+    def _read_values(self) -> Dict[str, str]:
+        lines = self._read_lines()
+        start, end = self._section_range(lines)
+        values: Dict[str, str] = {}
+        for line in lines[start:end] if start >= 0 else ():
+            if '=' in line:
+                key, value = line.split('=', 1)
+                values[key.strip()] = value.strip()
+        return values
+
+    @staticmethod
+    def _values(state: ProxyState) -> Dict[str, str]:
+        if not state.enabled:
+            return {'ProxyType': str(KDE_PROXY_NONE)}
+        return {
+            'ProxyType': str(KDE_PROXY_MANUAL),
+            'httpProxy': f'http://{state.host} {state.port}',
+            'httpsProxy': f'http://{state.host} {state.port}',
+            'socksProxy': f'socks://{state.host} {state.port}',
+            'NoProxyFor': ','.join(state.bypass)
+        }
+
+    def read_state(self) -> Optional[ProxyState]:
+        values = self._read_values()
+        if values.get('ProxyType', str(KDE_PROXY_NONE)) != str(KDE_PROXY_MANUAL):
+            return ProxyState(False)
+
+        match = re.fullmatch(r'http://(.*?)[ :](\d+)', values.get('httpProxy', ''))
+        if match is None:
+            return None
+        bypass = [host for host in values.get('NoProxyFor', '').split(',') if host]
+        state = ProxyState(True, match.group(1), int(match.group(2)), bypass)
+        # Anything else differing from what we would write counts as unknown
+        return state if all(values.get(key) == value for key, value in self._values(state).items()) else None
+
+    def write_state(self, state: ProxyState):
+        lines = self._read_lines()
+        pending = self._values(state)
+        start, end = self._section_range(lines)
+        if start < 0:
+            if lines and lines[-1].strip():
+                lines.append('')
+            lines.append(f'[{self.SECTION}]')
+            start = end = len(lines)
+
+        section: List[str] = []
+        for line in lines[start:end]:
+            key = line.split('=', 1)[0].strip() if '=' in line else None
+            if key in pending:
+                section.append(f'{key}={pending.pop(key)}')
+            else:
+                section.append(line)
+        # New keys go before the blank lines separating the next section
+        insert_at = len(section)
+        while insert_at > 0 and not section[insert_at - 1].strip():
+            insert_at -= 1
+        section[insert_at:insert_at] = [f'{key}={value}' for key, value in pending.items()]
+
+        lines[start:end] = section
+        _atomic_write(self.path, '\n'.join(lines) + '\n')
+        self._reload()
+
+    def _reload(self):
+        if shutil.which(self.dbus_send) is None:
+            return
+        try:
+            subprocess.run([self.dbus_send, '--type=signal', '/KIO/Scheduler',
+                            'org.kde.KIO.Scheduler.reparseSlaveConfiguration', 'string:'],
+                           capture_output=True, timeout=BACKEND_TIMEOUT, check=False)
+        except (OSError, subprocess.SubprocessError) as e:
+            # The file is written; applications pick it up on their next start
+            print(f"Failed to notify KDE about the proxy change: {e}")
+
+
+# --- Environment file fallback ---
+
+class EnvFileProxyBackend(ProxyBackend):
+    """
+    Fallback for desktops without a proxy setting: a shell snippet with the
+    *_proxy variables (source it from the shell profile). It only affects
+    programs started after it changed.
+    """
+    name = 'env'
+    VARIABLES = ('http_proxy', 'https_proxy', 'all_proxy', 'no_proxy')
+
+    def __init__(self, path: str = '', home: Optional[str] = None):
+        self.path: str = path or os.path.join(_config_home(home), 'SingDrover', 'proxy.env')
+
+    def available(self) -> bool:
+        return True
+
+    def render(self, state: ProxyState) -> str:
+        names = [name for variable in self.VARIABLES for name in (variable, variable.upper())]
+        if not state.enabled:
+            return f"unset {' '.join(names)}\n"
+        values = {
+            'http_proxy': f'http://{state.host}:{state.port}',
+            'https_proxy': f'http://{state.host}:{state.port}',
+            'all_proxy': f'socks5://{state.host}:{state.port}',
+            'no_proxy': ','.join(state.bypass)
+        }
+        return ''.join(f"export {name}='{values[name.lower()]}'\n" for name in names)
+
+    def read_state(self) -> Optional[ProxyState]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            return ProxyState(False)
+
+        if text.startswith('unset '):
+            return ProxyState(False)
+        match = re.search(r"^export http_proxy='http://(.*):(\d+)'$", text, re.MULTILINE)
+        bypass = re.search(r"^export no_proxy='(.*)'$", text, re.MULTILINE)
+        if match is None or bypass is None:
+            return None
+        state = ProxyState(True, match.group(1), int(match.group(2)),
+                           [host for host in bypass.group(1).split(',') if host])
+        return state if text == self.render(state) else None
+
+    def write_state(self, state: ProxyState):
+        _atomic_write(self.path, self.render(state))
+
+
+def create_backend(name: str = 'auto', home: Optional[str] = None) -> ProxyBackend:
+    """
+    Backend by name ('gnome', 'kde', 'env'), or the one matching the running
+    desktop for 'auto'. `home` points the file based backends at another home
+    directory.
+    """
+    if name == 'auto':
+        desktops = os.environ.get('XDG_CURRENT_DESKTOP', '').upper().split(':')
+        if 'KDE' in desktops:
+            name = 'kde'
+        elif any(desktop in GNOME_DESKTOPS for desktop in desktops) and GnomeProxyBackend().available():
+            name = 'gnome'
+        else:
+            name = 'env'
+
+    if name == 'gnome':
+        return GnomeProxyBackend()
+    if name == 'kde':
+        return KdeProxyBackend(home)
+    if name == 'env':
+        return EnvFileProxyBackend(home=home)
+    raise ValueError(f"Unknown system proxy backend: {name}")
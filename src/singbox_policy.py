@@ -0,0 +1,81 @@
+# singbox_policy.py
+#
+# How a sing-box process is waited for, restarted and drained. The primary
+# instance (drover.py, threads) and the extra ones (instances.py, asyncio)
+# follow the same rules; they differ only in how they wait and send requests,
+# so the rules and their constants live here.
+
+import time
+from typing import Any, Iterable, Iterator, List, Optional
+
+# Readiness probe: first retry after READY_BACKOFF_MIN, doubling up to READY_BACKOFF_MAX,
+# giving up after READY_DEADLINE seconds in total
+READY_DEADLINE = 10.0
+READY_BACKOFF_MIN = 0.01
+READY_BACKOFF_MAX = 0.25
+READY_PROBE_TIMEOUT = 0.5
+
+# Restarts: immediate at first, then doubling up to RESTART_BACKOFF_MAX while
+# sing-box keeps going down within STABLE_UPTIME seconds of starting
+RESTART_BACKOFF_MIN = 0.1
+RESTART_BACKOFF_MAX = 5.0
+STABLE_UPTIME = 30.0
+# Consecutive failed Clash API probes before a running sing-box is considered hung
+LIVENESS_FAILURES = 3
+# How long a terminated sing-box gets to exit before it is killed
+TERMINATE_TIMEOUT = 5.0
+
+# How many sing-box log lines end up in error messages
+SINGBOX_ERROR_LINES = 10
+
+# Which connections are closed after a selector change
+DRAIN_ALL = 'all' # every connection, like the original Drover
+DRAIN_AFFECTED = 'affected' # only connections routed through a changed selector
+DRAIN_NONE = 'none' # keep everything, new connections use the new outbound
+
+# Connections closed per round of DELETEs; stopping and queued selector
+# changes are checked in between
+DRAIN_CHUNK = 32
+
+
+class ReadyBackoff:
+    """
+    Sleep schedule of the readiness probe. Callers probe, and while the probe
+    fails sleep for next_delay() seconds until it returns None.
+    """
+    def __init__(self, deadline: float = READY_DEADLINE):
+        self.deadline: float = deadline
+        self.started: float = time.monotonic()
+        self._delay: float = READY_BACKOFF_MIN
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def next_delay(self) -> Optional[float]:
+        """Seconds to sleep before the next probe, or None once the deadline has passed."""
+        elapsed = self.elapsed
+        if elapsed >= self.deadline:
+            return None
+        delay = min(self._delay, self.deadline - elapsed)
+        self._delay = min(self._delay * 2, READY_BACKOFF_MAX)
+        return delay
+
+    def timeout_error(self) -> str:
+        return f"Sing-box Clash API did not become ready within {self.deadline:.0f} s."
+
+
+def affected_connections(snapshot: Any, selector_names: Iterable[str]) -> List[str]:
+    """IDs of the connections in a /connections snapshot that went through one of the selectors."""
+    if not isinstance(snapshot, dict):
+        return []
+    # "chains" lists every outbound and group a connection went through
+    changed = set(selector_names)
+    return [conn['id'] for conn in snapshot.get('connections') or []
+            if isinstance(conn, dict) and 'id' in conn and not changed.isdisjoint(conn.get('chains') or ())]
+
+
+def drain_rounds(conn_ids: List[str]) -> Iterator[List[str]]:
+    """Splits connection IDs into rounds of at most DRAIN_CHUNK DELETEs."""
+    for start in range(0, len(conn_ids), DRAIN_CHUNK):
+        yield conn_ids[start:start + DRAIN_CHUNK]
@@ -0,0 +1,89 @@
+# state_sync.py
+
+from threading import Thread, Event, Lock
+from typing import Callable, Dict, Optional
+
+from clash_api import ClashApiClient
+
+
+class SelectorStateSync(Thread):
+    """
+    Mirrors the live `now` of every group (selectors, urltest, ...) from GET /proxies.
+    sing-box has no event stream for group changes, so the state is polled on an
+    adaptive interval: it starts at `min_interval`, doubles up to `max_interval`
+    while nothing changes and drops back as soon as a change is seen or kick()
+    is called. Readers get the cached value without touching the network.
+    """
+    def __init__(self, api: ClashApiClient, min_interval: float = 1.0, max_interval: float = 30.0):
+        super().__init__(name='selector-state-sync', daemon=True)
+        self.api = api
+        self.min_interval: float = min_interval
+        self.max_interval: float = max_interval
+
+        # Called with {group: now} of the groups that changed (from the sync or selector worker thread)
+        self.on_change: Optional[Callable[[Dict[str, str]], None]] = None
+
+        self.state: Dict[str, str] = {}
+        self._lock = Lock()
+        self._interval: float = min_interval
+        self._wake = Event()
+        self._stopping = Event()
+
+    def current(self, name: str) -> Optional[str]:
+        """The last known outbound of a group, or None if it was never seen."""
+        return self.state.get(name)
+
+    def set_local(self, name: str, value: str):
+        """Records a change made by us, so readers see it before the next poll confirms it."""
+        with self._lock:
+            if self.state.get(name) == value:
+                return
+            self.state[name] = value
+        self._notify({name: value})
+
+    def kick(self):
+        """Polls soon, e.g. right after we changed something ourselves."""
+        self._interval = self.min_interval
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+
+            diff = self.poll()
+            if diff:
+                self._interval = self.min_interval
+                self._notify(diff)
+            else:
+                self._interval = min(self._interval * 2, self.max_interval)
+
+    def _notify(self, diff: Dict[str, str]):
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(diff)
+        except Exception as e:
+            print(f"Selector state callback failed: {e}")
+
+    def poll(self) -> Dict[str, str]:
+        """Fetches /proxies once and returns the groups whose `now` differs from the cache."""
+        # The next poll is the retry; a sing-box restart must not print on every tick
+        snapshot = self.api.get_json('/proxies', retries=0, quiet=True)
+        if not isinstance(snapshot, dict):
+            return {}
+
+        diff: Dict[str, str] = {}
+        with self._lock:
+            for name, proxy in (snapshot.get('proxies') or {}).items():
+                now = proxy.get('now') if isinstance(proxy, dict) else None
+                if now and self.state.get(name) != now:
+                    self.state[name] = now
+                    diff[name] = now
+        return diff
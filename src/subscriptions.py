@@ -0,0 +1,854 @@
+# subscriptions.py
+#
+# Merges node lists ("subscriptions") into the sing-box config. A subscription
+# is a local file holding one share link per line (vmess://, vless://,
+# trojan://, ss://, hysteria2://, tuic://), the same list base64-encoded as a
+# whole, or a JSON array of sing-box outbounds. Files are read as a stream and
+# nodes are deduplicated by a hash of their content (the name does not count).
+#
+# Ingestion is incremental. A state file per subscription remembers every
+# entry by the hash of its raw text, together with the outbound built from it:
+#   - an unchanged file is skipped after hashing it, nothing is parsed
+#   - otherwise only entries not seen before are parsed; the others cost a hash
+#     and a dict lookup and their outbound JSON is reused as it is
+#   - the config is only rewritten if the resulting outbounds changed, and then
+#     only inside its "outbounds" section: subscription nodes come from the
+#     cached JSON and target groups get a new member list; every other outbound
+#     and the rest of the file (comments included) is copied as it was written
+# The config is written atomically; reloading it is up to the caller.
+
+import base64
+import hashlib
+import json
+import os
+import re
+import stat
+import tempfile
+from threading import Lock
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from config_loader import extract_sections
+from json_utils import loads_jsonc, normalize_json
+
+# Bump when the state file layout changes
+STATE_VERSION = 1
+
+READ_CHUNK = 64 * 1024
+
+_WHITESPACE_RE = re.compile(r'\s*')
+_DECODER = json.JSONDecoder()
+
+# Groups and special outbounds are never taken from a JSON subscription
+NON_NODE_TYPES = {'selector', 'urltest', 'direct', 'block', 'dns'}
+
+
+def entry_hash(raw: str) -> str:
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def content_hash(outbound: Dict[str, Any]) -> str:
+    """Identity of a node for deduplication: everything but its tag."""
+    data = json.dumps(outbound, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def encode_outbound(tag: str, outbound: Dict[str, Any]) -> str:
+    """One outbound per line, the form nodes are kept in (state file and config)."""
+    return json.dumps({'tag': tag, **outbound}, ensure_ascii=False, separators=(', ', ': '))
+
+
+def retag(encoded: str, tag: str) -> str:
+    outbound = json.loads(encoded)
+    outbound.pop('tag', None)
+    return encode_outbound(tag, outbound)
+
+
+# --- Share links ---
+
+def _b64decode(text: str) -> bytes:
+    text = ''.join(text.split())
+    return base64.b64decode(text + '=' * (-len(text) % 4), altchars=b'-_')
+
+
+def _address(parts) -> Tuple[str, int]:
+    host, port = parts.hostname, parts.port
+    if not host or not port:
+        raise ValueError('missing server or port')
+    return host, port
+
+
+def _tls(query: Dict[str, str], default: str = '') -> Optional[Dict[str, Any]]:
+    security = query.get('security') or default
+    if security not in ('tls', 'reality', 'xtls'):
+        return None
+    tls: Dict[str, Any] = {'enabled': True}
+    server_name = query.get('sni') or query.get('peer')
+    if server_name:
+        tls['server_name'] = server_name
+    if query.get('allowInsecure') in ('1', 'true') or query.get('insecure') in ('1', 'true'):
+        tls['insecure'] = True
+    if query.get('alpn'):
+        tls['alpn'] = query['alpn'].split(',')
+    if query.get('fp'):
+        tls['utls'] = {'enabled': True, 'fingerprint': query['fp']}
+    if security == 'reality':
+        tls['reality'] = {'enabled': True, 'public_key': query.get('pbk', ''), 'short_id': query.get('sid', '')}
+    return tls
+
+
+def _transport(kind: str, host: str, path: str, service_name: str = '') -> Optional[Dict[str, Any]]:
+    if kind == 'ws':
+        transport: Dict[str, Any] = {'type': 'ws'}
+        if path:
+            transport['path'] = path
+        if host:
+            transport['headers'] = {'Host': host}
+        return transport
+    if kind == 'httpupgrade':
+        transport = {'type': 'httpupgrade'}
+        if path:
+            transport['path'] = path
+        if host:
+            transport['host'] = host
+        return transport
+    if kind == 'grpc':
+        return {'type': 'grpc', 'service_name': service_name or path}
+    if kind in ('http', 'h2'):
+        transport = {'type': 'http'}
+        if host:
+            transport['host'] = host.split(',')
+        if path:
+            transport['path'] = path
+        return transport
+    return None
+
+
+def _with_options(outbound: Dict[str, Any], tls: Optional[Dict[str, Any]],
+                  transport: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if tls is not None:
+        outbound['tls'] = tls
+    if transport is not None:
+        outbound['transport'] = transport
+    return outbound
+
+
+def _parse_vmess(link: str) -> Tuple[str, Dict[str, Any]]:
+    data = json.loads(_b64decode(link[len('vmess://'):]).decode('utf-8'))
+    outbound = {
+        'type': 'vmess',
+        'server': data['add'],
+        'server_port': int(data['port']),
+        'uuid': data['id'],
+        'security': data.get('scy') or 'auto',
+        'alter_id': int(data.get('aid') or 0),
+    }
+    tls = _tls({'security': data.get('tls', ''), 'sni': data.get('sni', ''),
+                'alpn': data.get('alpn', ''), 'fp': data.get('fp', '')})
+    transport = _transport(data.get('net', ''), data.get('host', ''), data.get('path', ''))
+    return data.get('ps', ''), _with_options(outbound, tls, transport)
+
+
+def _parse_vless(link: str) -> Tuple[str, Dict[str, Any]]:
+    parts = urlsplit(link)
+    query = dict(parse_qsl(parts.query))
+    server, port = _address(parts)
+    outbound: Dict[str, Any] = {'type': 'vless', 'server': server, 'server_port': port,
+                                'uuid': unquote(parts.username or '')}
+    if query.get('flow'):
+        outbound['flow'] = query['flow']
+    transport = _transport(query.get('type', ''), query.get('host', ''), query.get('path', ''),
+                           query.get('serviceName', ''))
+    return unquote(parts.fragment), _with_options(outbound, _tls(query), transport)
+
+
+def _parse_trojan(link: str) -> Tuple[str, Dict[str, Any]]:
+    parts = urlsplit(link)
+    query = dict(parse_qsl(parts.query))
+    server, port = _address(parts)
+    outbound = {'type': 'trojan', 'server': server, 'server_port': port,
+                'password': unquote(parts.netloc.rpartition('@')[0])}
+    transport = _transport(query.get('type', ''), query.get('host', ''), query.get('path', ''),
+                           query.get('serviceName', ''))
+    return unquote(parts.fragment), _with_options(outbound, _tls(query, default='tls'), transport)
+
+
+def _parse_shadowsocks(link: str) -> Tuple[str, Dict[str, Any]]:
+    parts = urlsplit(link)
+    if '@' in parts.netloc:
+        # SIP002: ss://base64(method:password)@host:port or with a plain, percent-encoded userinfo
+        userinfo = unquote(parts.netloc.rpartition('@')[0])
+        if ':' not in userinfo:
+            userinfo = _b64decode(userinfo).decode('utf-8')
+        server, port = _address(parts)
+    else:
+        # Legacy: ss://base64(method:password@host:port)
+        decoded = _b64decode(unquote(parts.netloc)).decode('utf-8')
+        userinfo, _, address = decoded.rpartition('@')
+        server, port = _address(urlsplit(f'//{address}'))
+    method, sep, password = userinfo.partition(':')
+    if not sep:
+        raise ValueError('missing method or password')
+    outbound: Dict[str, Any] = {'type': 'shadowsocks', 'server': server, 'server_port': port,
+                                'method': method, 'password': password}
+    plugin = dict(parse_qsl(parts.query)).get('plugin')
+    if plugin:
+        name, _, plugin_opts = plugin.partition(';')
+        outbound['plugin'] = name
+        if plugin_opts:
+            outbound['plugin_opts'] = plugin_opts
+    return unquote(parts.fragment), outbound
+
+
+def _parse_hysteria2(link: str) -> Tuple[str, Dict[str, Any]]:
+    parts = urlsplit(link)
+    query = dict(parse_qsl(parts.query))
+    server, port = _address(parts)
+    password = unquote(parts.netloc.rpartition('@')[0]) if '@' in parts.netloc else ''
+    outbound: Dict[str, Any] = {'type': 'hysteria2', 'server': server, 'server_port': port, 'password': password}
+    if query.get('obfs'):
+        outbound['obfs'] = {'type': query['obfs'], 'password': query.get('obfs-password', '')}
+    return unquote(parts.fragment), _with_options(outbound, _tls(query, default='tls'))
+
+
+def _parse_tuic(link: str) -> Tuple[str, Dict[str, Any]]:
+    parts = urlsplit(link)
+    query = dict(parse_qsl(parts.query))
+    server, port = _address(parts)
+    outbound: Dict[str, Any] = {'type': 'tuic', 'server': server, 'server_port': port,
+                                'uuid': unquote(parts.username or ''), 'password': unquote(parts.password or '')}
+    if query.get('congestion_control'):
+        outbound['congestion_control'] = query['congestion_control']
+    if query.get('udp_relay_mode'):
+        outbound['udp_relay_mode'] = query['udp_relay_mode']
+    return unquote(parts.fragment), _with_options(outbound, _tls(query, default='tls'))
+
+
+SHARE_LINK_PARSERS = {
+    'vmess': _parse_vmess,
+    'vless': _parse_vless,
+    'trojan': _parse_trojan,
+    'ss': _parse_shadowsocks,
+    'hysteria2': _parse_hysteria2,
+    'hy2': _parse_hysteria2,
+    'tuic': _parse_tuic,
+}
+
+
+def parse_share_link(link: str) -> Tuple[str, Dict[str, Any]]:
+    """Share link -> (name, sing-box outbound without a tag); raises ValueError if it cannot be used."""
+    scheme, sep, _ = link.partition('://')
+    parser = SHARE_LINK_PARSERS.get(scheme.lower()) if sep else None
+    if parser is None:
+        raise ValueError(f'unsupported link: {link[:20]!r}')
+    try:
+        name, outbound = parser(link)
+    except (KeyError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError(f'malformed {scheme} link: {e}')
+    return name or f"{outbound['server']}:{outbound['server_port']}", outbound
+
+
+def parse_outbound(item: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """JSON subscription entry -> (name, outbound without a tag)."""
+    outbound = dict(item)
+    name = str(outbound.pop('tag', '') or '')
+    if not outbound.get('type') or outbound['type'] in NON_NODE_TYPES:
+        raise ValueError(f"not a node: {outbound.get('type')!r}")
+    return name or f"{outbound.get('server')}:{outbound.get('server_port')}", outbound
+
+
+# --- Streaming readers ---
+
+def iter_entries(path: str) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+    """
+    Yields (raw text, decoded JSON entry or None) for every entry of a subscription
+    file. Share links are only yielded as text and left to the caller to
+    parse, so unchanged ones are never parsed again.
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        head = f.read(READ_CHUNK)
+        start = head.lstrip()[:1]
+        if start == '[':
+            yield from _iter_json_array(f, head)
+        elif start == '{':
+            # A whole sing-box config: these are small, it is read in one go
+            document = loads_jsonc(head + f.read())
+            for item in document.get('outbounds') or []:
+                if isinstance(item, dict):
+                    yield json.dumps(item, sort_keys=True, ensure_ascii=False), item
+        else:
+            first = next((line for line in head.splitlines() if line.strip() and not line.startswith('#')), '')
+            lines = _iter_lines(f, head) if '://' in first else _iter_base64_lines(f, head)
+            for line in lines:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line, None
+
+
+def _iter_lines(f, head: str) -> Iterator[str]:
+    rest = head
+    while True:
+        chunk = f.read(READ_CHUNK)
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        yield from lines
+        if not chunk:
+            if rest:
+                yield rest
+            return
+
+
+def _iter_base64_lines(f, head: str) -> Iterator[str]:
+    """Decodes a base64-encoded link list chunk by chunk (4 characters at a time make 3 bytes)."""
+    pending = ''
+    tail = b''
+    chunk = head
+    while chunk:
+        data = pending + ''.join(chunk.split())
+        cut = len(data) - len(data) % 4
+        pending = data[cut:]
+        lines = (tail + _b64decode(data[:cut])).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8', 'replace')
+        chunk = f.read(READ_CHUNK)
+    if pending.rstrip('='):
+        tail += _b64decode(pending)
+    if tail:
+        yield tail.decode('utf-8', 'replace')
+
+
+def _iter_json_array(f, head: str) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+    """Decodes a JSON array one element at a time, reading more of the file only when an element is cut off."""
+    buffer, pos, eof = head, head.index('[') + 1, False
+    while True:
+        pos = _WHITESPACE_RE.match(buffer, pos).end()
+        char = buffer[pos:pos + 1]
+        if char == ']':
+            return
+        if char == ',':
+            pos += 1
+            continue
+
+        end = -1
+        if char:
+            try:
+                item, end = _DECODER.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                end = -1
+        # An element ending right at the buffer's end may be cut short, e.g. a number
+        if end < 0 or (end == len(buffer) and not eof):
+            if eof:
+                raise ValueError(f'invalid or truncated JSON array near: {buffer[pos:pos + 40]!r}')
+            chunk = f.read(READ_CHUNK)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        raw, pos = buffer[pos:end], end
+        if isinstance(item, dict):
+            yield raw, item
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write(path: str, text: str, mode: Optional[int] = None):
+    """Writes through a temporary file in the same directory, so readers never see a half-written file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp_path, stat.S_IMODE(mode))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class IngestResult:
+    """What re-reading one subscription changed, in terms of node tags."""
+    def __init__(self, path: str):
+        self.path: str = path
+        self.added: List[str] = []
+        self.removed: List[str] = []
+        self.changed: List[str] = []
+        self.reordered: bool = False
+        self.parsed: int = 0 # entries that were new and had to be parsed
+        self.duplicates: int = 0
+        self.skipped: int = 0 # unsupported or malformed entries
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed or self.reordered)
+
+    def __str__(self) -> str:
+        return (f"{os.path.basename(self.path)}: {len(self.added)} added, {len(self.removed)} removed, "
+                f"{len(self.changed)} changed ({self.parsed} parsed, {self.duplicates} duplicates, "
+                f"{self.skipped} skipped)")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'path': self.path, 'added': len(self.added), 'removed': len(self.removed),
+                'changed': len(self.changed), 'parsed': self.parsed, 'duplicates': self.duplicates,
+                'skipped': self.skipped}
+
+
+class Subscription:
+    """
+    One subscription file, the groups it fills and what the last ingestion left
+    in the config. ingest() computes the new node list, commit() makes it the
+    current one once the config was written.
+    """
+    def __init__(self, spec: Dict[str, Any], state_dir: str):
+        self.path: str = os.path.abspath(spec['path'])
+        self.selectors: List[str] = list(spec.get('selectors') or [])
+        self.tag_prefix: str = spec.get('tag_prefix', '')
+        key = hashlib.sha1(self.path.encode('utf-8')).hexdigest()
+        self.state_path: str = os.path.join(state_dir, f'subscription-{key}.state')
+
+        self.digest: str = ''
+        # raw entry hash -> [content hash, tag, outbound JSON]
+        self.entries: Dict[str, List[str]] = {}
+        # tag -> outbound JSON of the nodes in the config, in file order
+        self.outbounds: Dict[str, str] = {}
+        self._keys: Dict[str, str] = {}
+        self._pending: Optional[Tuple[str, Dict[str, List[str]], Dict[str, str], Dict[str, str]]] = None
+        self.load_state()
+
+    @property
+    def current(self) -> Dict[str, str]:
+        """The nodes the config should hold: the pending ones while an ingestion is in flight."""
+        return self._pending[2] if self._pending is not None else self.outbounds
+
+    def ingest(self, digest: str, reserved: Set[str], document: 'ConfigDocument') -> IngestResult:
+        """
+        Reads the file and builds the new node list. Tags in `reserved` (other
+        subscriptions') and of other outbounds in the config are left to their
+        owners, except for an identical node, which is taken over (e.g. after
+        the state file was lost).
+        """
+        result = IngestResult(self.path)
+        entries: Dict[str, List[str]] = {}
+        outbounds: Dict[str, str] = {}
+        keys: Dict[str, str] = {}
+        seen: Set[str] = set()
+
+        for raw, decoded in iter_entries(self.path):
+            key = entry_hash(raw)
+            entry = entries.get(key) or self.entries.get(key)
+            if entry is None:
+                try:
+                    name, outbound = parse_share_link(raw) if decoded is None else parse_outbound(decoded)
+                except ValueError:
+                    result.skipped += 1
+                    continue
+                result.parsed += 1
+                # Tags end up in menus and in the line based state file: no tabs or line breaks
+                tag = ' '.join((self.tag_prefix + name).split())
+                entry = [content_hash(outbound), tag, encode_outbound(tag, outbound)]
+            entries[key] = entry
+
+            if entry[0] in seen:
+                result.duplicates += 1
+                continue
+            seen.add(entry[0])
+
+            tag, encoded = entry[1], entry[2]
+            if tag in outbounds or tag in reserved or self._foreign(tag, entry[0], document):
+                base, number = tag, 2
+                while (tag in outbounds or tag in reserved
+                       or (tag in document.tags and tag not in self.outbounds)):
+                    tag = f'{base} {number}'
+                    number += 1
+                encoded = retag(encoded, tag)
+            outbounds[tag] = encoded
+            keys[tag] = key
+
+        if not outbounds:
+            raise ValueError('no usable nodes, keeping the previous ones')
+
+        previous = self.outbounds
+        result.added = [tag for tag in outbounds if tag not in previous]
+        result.removed = [tag for tag in previous if tag not in outbounds]
+        result.changed = [tag for tag, encoded in outbounds.items() if tag in previous and previous[tag] != encoded]
+        result.reordered = not (result.added or result.removed) and list(outbounds) != list(previous)
+        self._pending = (digest, entries, outbounds, keys)
+        return result
+
+    def _foreign(self, tag: str, content: str, document: 'ConfigDocument') -> bool:
+        return tag in document.tags and tag not in self.outbounds and document.node_hash(tag) != content
+
+    def commit(self):
+        if self._pending is None:
+            return
+        self.digest, self.entries, self.outbounds, self._keys = self._pending
+        self._pending = None
+        self.save_state()
+
+    def discard(self):
+        self._pending = None
+
+    def load_state(self):
+        """
+        The state file is line based, a JSON header followed by
+        "e<TAB>key<TAB>content hash<TAB>tag<TAB>outbound" per entry and
+        "o<TAB>key<TAB>tag" per node in the config, which keeps writing and
+        reading it close to a plain copy.
+        """
+        entries: Dict[str, List[str]] = {}
+        outbounds: Dict[str, str] = {}
+        keys: Dict[str, str] = {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                if header.get('version') != STATE_VERSION or header.get('path') != self.path:
+                    return
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if fields[0] == 'e':
+                        entries[fields[1]] = [fields[2], fields[3], fields[4]]
+                    else:
+                        tag = fields[2]
+                        _, entry_tag, encoded = entries[fields[1]]
+                        outbounds[tag] = encoded if entry_tag == tag else retag(encoded, tag)
+                        keys[tag] = fields[1]
+        except (OSError, ValueError, KeyError, IndexError, AttributeError):
+            return
+        self.digest, self.entries, self.outbounds, self._keys = header['digest'], entries, outbounds, keys
+
+    def save_state(self):
+        header = {'version': STATE_VERSION, 'path': self.path, 'digest': self.digest}
+        lines = [json.dumps(header, ensure_ascii=False)]
+        lines.extend(f'e\t{key}\t{content}\t{tag}\t{encoded}' for key, (content, tag, encoded) in self.entries.items())
+        lines.extend(f'o\t{key}\t{tag}' for tag, key in self._keys.items())
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            atomic_write(self.state_path, '\n'.join(lines) + '\n')
+        except OSError as e:
+            print(f"Failed to write subscription state ({self.state_path}): {e}")
+
+
+class ConfigDocument:
+    """
+    The config's outbounds section, located item by item so subscription nodes
+    and group member lists can be spliced in while everything else keeps its
+    original text. The layout is kept between reads: as long as the file is
+    what was written last, finding the items again costs a hash instead of a parse.
+    """
+    def __init__(self, path: str):
+        self.path: str = path
+        self.text: str = ''
+        self.mode: Optional[int] = None
+        self.digest: str = ''
+        # Outbounds in file order; subscription nodes are kept as just their tag
+        self.outbounds: List[Any] = []
+        self.span: Tuple[int, int] = (0, 0)
+        # (lead, start, end) of every outbound in the text, see decode_array()
+        self.offsets: List[Tuple[int, int, int]] = []
+        self.tags: Set[str] = set()
+        self._by_tag: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            self.mode = os.fstat(f.fileno()).st_mode
+            data = f.read()
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        try:
+            self.text = data.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise ValueError(f"Configuration file is not valid UTF-8: {e}")
+        if digest == self.digest:
+            return
+
+        self.digest = ''
+        # normalize_json keeps every character's offset, so spans apply to the original text
+        spans: Dict[str, Tuple[int, int]] = {}
+        items: Dict[str, List[Tuple[int, int, int]]] = {}
+        sections = extract_sections(normalize_json(self.text), ('outbounds',), spans=spans, items=items)
+        outbounds = sections.get('outbounds')
+        if not isinstance(outbounds, list):
+            raise ValueError('the config has no outbounds list')
+        self.outbounds = outbounds
+        self.span = spans['outbounds']
+        self.offsets = items['outbounds']
+        self.tags = {item.get('tag') for item in outbounds if isinstance(item, dict)}
+        self._by_tag = None
+        self.digest = digest
+
+    def node_hash(self, tag: str) -> Optional[str]:
+        """content_hash() of the plain node with this tag, None for groups and unknown tags."""
+        if self._by_tag is None:
+            self._by_tag = {item.get('tag'): item for item in self.outbounds if isinstance(item, dict)}
+        item = self._by_tag.get(tag)
+        if item is None:
+            return None
+        try:
+            _, outbound = parse_outbound(item)
+        except ValueError:
+            return None
+        return content_hash(outbound)
+
+    def apply(self, subscriptions: Iterable[Subscription]):
+        """
+        Replaces the subscription nodes and fills the groups they target.
+        Only those are written anew: other outbounds, with the whitespace and
+        comments in front of them, are copied from the original text.
+        """
+        managed: Set[str] = set()
+        nodes: Dict[str, str] = {}
+        members: Dict[str, List[str]] = {}
+        for subscription in subscriptions:
+            managed.update(subscription.outbounds)
+            nodes.update(subscription.current)
+            for selector in subscription.selectors:
+                members.setdefault(selector, []).extend(subscription.current)
+        managed.update(nodes)
+        removed = managed - nodes.keys()
+
+        for selector in members:
+            if selector not in self.tags:
+                print(f"Subscription target group not found in the config: {selector}")
+
+        text = self.text
+        start, end = self.span
+        indent = self._indent()
+        pieces: List[str] = ['[']
+        size = start + 1
+        outbounds: List[Any] = []
+        offsets: List[Tuple[int, int, int]] = []
+        # Index of the original outbound written last, None after a node or at the start
+        last: Optional[int] = None
+
+        def place(separator: str, lead: int, body: str, item: Any):
+            nonlocal size
+            pieces.append(separator)
+            pieces.append(body)
+            offsets.append((size + lead, size + len(separator), size + len(separator) + len(body)))
+            size += len(separator) + len(body)
+            outbounds.append(item)
+
+        def place_nodes():
+            nonlocal last
+            for tag, encoded in nodes.items():
+                comma = ',' if outbounds else ''
+                place(comma + '\n' + indent, len(comma), encoded, tag)
+            last = None
+
+        nodes_placed = False
+        for index, (item, (lead, item_start, item_end)) in enumerate(zip(self.outbounds, self.offsets)):
+            tag = item if isinstance(item, str) else item.get('tag') if isinstance(item, dict) else None
+            if tag in managed:
+                # Nodes go where the first of them was, or to the end for a new subscription
+                if not nodes_placed:
+                    place_nodes()
+                    nodes_placed = True
+                continue
+
+            body = text[item_start:item_end]
+            if isinstance(item, dict) and isinstance(item.get('outbounds'), list):
+                updated = self._update_group(item, members.get(tag, []), removed)
+                if updated is not item:
+                    body = self._splice_group(body, updated, 'default' in item and 'default' not in updated)
+                    item = updated
+
+            if last is not None and last == index - 1:
+                # Still next to its original neighbour: keep the separator as written
+                previous_end = self.offsets[index - 1][2]
+                place(text[previous_end:item_start], lead - previous_end, body, item)
+            else:
+                comma = ',' if outbounds else ''
+                place(comma + text[lead:item_start], len(comma), body, item)
+            last = index
+        if not nodes_placed:
+            place_nodes()
+
+        # Whatever follows the last original outbound (a trailing comma, comments) up to "]"
+        tail_start = self.offsets[-1][2] if self.offsets else start + 1
+        section = ''.join(pieces) + text[tail_start:end]
+        self.text = text[:start] + section + text[end:]
+        self.outbounds = outbounds
+        self.offsets = offsets
+        self.span = (start, start + len(section))
+        self.tags = {item if isinstance(item, str) else item.get('tag') for item in outbounds if isinstance(item, (str, dict))}
+        self._by_tag = None
+        self.digest = ''
+
+    def _indent(self) -> str:
+        """Indentation of the first outbound, used for new nodes."""
+        if self.offsets:
+            item_start = self.offsets[0][1]
+            line = self.text[self.text.rfind('\n', 0, item_start) + 1:item_start]
+            if line and not line.strip():
+                return line
+        return '    '
+
+    @staticmethod
+    def _update_group(item: Dict[str, Any], members: List[str], removed: Set[str]) -> Dict[str, Any]:
+        member_set = set(members)
+        outbounds = [tag for tag in item['outbounds'] if tag not in removed and tag not in member_set] + members
+        if outbounds == item['outbounds']:
+            return item
+        item = dict(item, outbounds=outbounds)
+        # sing-box refuses a default that is not among the group's outbounds
+        if item.get('default') and item['default'] not in outbounds:
+            del item['default']
+        return item
+
+    @staticmethod
+    def _splice_group(body: str, item: Dict[str, Any], drop_default: bool) -> str:
+        """The group's text with a new "outbounds" list (and without "default" if asked)."""
+        normalized = normalize_json(body)
+        spans: Dict[str, Tuple[int, int]] = {}
+        extract_sections(normalized, ('outbounds', 'default'), spans=spans)
+
+        value_start, value_end = spans['outbounds']
+        edits = [(value_start, value_end, _encode_members(body, value_start, value_end, item['outbounds']))]
+        if drop_default and 'default' in spans:
+            cut = _member_range(normalized, 'default', *spans['default'])
+            if cut is None:
+                # A key spelled with escapes: give up on keeping this group's layout
+                return json.dumps(item, ensure_ascii=False, indent=2)
+            edits.append((cut[0], cut[1], ''))
+
+        for edit_start, edit_end, replacement in sorted(edits, reverse=True):
+            body = body[:edit_start] + replacement + body[edit_end:]
+        return body
+
+    def write(self):
+        data = self.text.encode('utf-8')
+        atomic_write(self.path, self.text, self.mode)
+        self.digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _encode_members(text: str, start: int, end: int, members: List[str]) -> str:
+    """A group's member list, one per line if the list it replaces was written that way."""
+    if '\n' not in text[start:end] or not members:
+        return json.dumps(members, ensure_ascii=False)
+    line = text[text.rfind('\n', 0, start) + 1:start]
+    indent = line[:len(line) - len(line.lstrip())]
+    return ('[\n' + ',\n'.join(indent + '  ' + json.dumps(member, ensure_ascii=False) for member in members)
+            + '\n' + indent + ']')
+
+
+def _member_range(normalized: str, key: str, value_start: int, value_end: int) -> Optional[Tuple[int, int]]:
+    """
+    Offsets to cut to remove the member `key` (its value at value_start:value_end)
+    from an object, together with one comma, and its line if it had one to itself.
+    None if the key is not written plainly.
+    """
+    pos = len(normalized[:value_start].rstrip()) - 1
+    if pos < 0 or normalized[pos] != ':':
+        return None
+    key_end = len(normalized[:pos].rstrip())
+    key_text = json.dumps(key)
+    key_start = key_end - len(key_text)
+    if normalized[key_start:key_end] != key_text:
+        return None
+
+    after = _WHITESPACE_RE.match(normalized, value_end).end()
+    if normalized[after:after + 1] == ',':
+        line_start = normalized.rfind('\n', 0, key_start) + 1
+        line_end = normalized.find('\n', after)
+        if not normalized[line_start:key_start].strip() and line_end >= 0 \
+                and not normalized[after + 1:line_end].strip():
+            return line_start, line_end + 1
+        return key_start, _WHITESPACE_RE.match(normalized, after + 1).end()
+    # The last member: take the comma in front of it instead
+    comma = len(normalized[:key_start].rstrip()) - 1
+    if normalized[comma:comma + 1] != ',':
+        return key_start, value_end
+    return comma, value_end
+
+
+class SubscriptionManager:
+    """
+    Keeps the config in sync with the `subscriptions` option:
+    [{"path": ..., "selectors": [...], "tag_prefix": ""}]. refresh() may be called
+    from any thread (file watchers, the control socket).
+    """
+    def __init__(self, specs: List[Dict[str, Any]], config_path: str, state_dir: str):
+        self.config_path: str = config_path
+        self.subscriptions: List[Subscription] = []
+        for spec in specs:
+            if not spec.get('path'):
+                print(f"Ignoring subscription without a path: {spec}")
+                continue
+            self.subscriptions.append(Subscription(spec, state_dir))
+        self.document = ConfigDocument(config_path)
+        self._lock = Lock()
+
+    @property
+    def paths(self) -> List[str]:
+        return [subscription.path for subscription in self.subscriptions]
+
+    def refresh(self) -> List[IngestResult]:
+        """
+        Re-reads the subscription files that changed and rewrites the config if
+        their nodes did. Returns the results that changed the config (empty if
+        the config was left alone).
+        """
+        with self._lock:
+            stale: List[Tuple[Subscription, str]] = []
+            for subscription in self.subscriptions:
+                try:
+                    digest = file_digest(subscription.path)
+                except OSError as e:
+                    print(f"Subscription not readable ({subscription.path}): {e}")
+                    continue
+                if digest != subscription.digest:
+                    stale.append((subscription, digest))
+            if not stale:
+                return []
+
+            document = self.document
+            try:
+                document.read()
+            except (OSError, ValueError) as e:
+                print(f"Subscriptions not applied, the config cannot be read: {e}")
+                return []
+
+            taken: Set[str] = set()
+            for subscription in self.subscriptions:
+                taken.update(subscription.outbounds)
+            changed: List[IngestResult] = []
+            for subscription, digest in stale:
+                try:
+                    result = subscription.ingest(digest, taken - subscription.outbounds.keys(), document)
+                except (OSError, ValueError) as e:
+                    print(f"Subscription not updated ({subscription.path}): {e}")
+                    continue
+                taken.update(subscription.current)
+                if result:
+                    changed.append(result)
+                else:
+                    # Same nodes (e.g. only comments or duplicates changed): just remember the new file
+                    subscription.commit()
+
+            if changed:
+                try:
+                    document.apply(self.subscriptions)
+                    document.write()
+                except (OSError, ValueError) as e:
+                    print(f"Failed to write the config with the subscription nodes: {e}")
+                    for subscription in self.subscriptions:
+                        subscription.discard()
+                    return []
+                finally:
+                    # Only the layout is kept, the text is read again next time
+                    document.text = ''
+                for subscription in self.subscriptions:
+                    subscription.commit()
+                for result in changed:
+                    print(f"Subscription updated: {result}")
+            document.text = ''
+            return changed
@@ -0,0 +1,141 @@
+# supervisor.py
+
+import time
+from threading import Thread, Event
+from typing import Callable, Optional, TYPE_CHECKING
+
+from singbox_policy import LIVENESS_FAILURES, RESTART_BACKOFF_MAX, RESTART_BACKOFF_MIN, STABLE_UPTIME
+
+if TYPE_CHECKING:
+    from drover import Drover
+
+
+class SingBoxSupervisor(Thread):
+    """
+    Watches the sing-box child and restarts it when it exits or stops answering.
+    Process exit is detected by a thread blocked in Popen.wait(), so a crash is
+    noticed immediately without polling; the Clash API is only probed every
+    `liveness_interval` seconds to catch a hung (but still running) process.
+    """
+    def __init__(self, drover: 'Drover', liveness_interval: float = 5.0,
+                 backoff_min: float = RESTART_BACKOFF_MIN, backoff_max: float = RESTART_BACKOFF_MAX):
+        super().__init__(name='sing-box-supervisor', daemon=True)
+        self.drover = drover
+        self.liveness_interval: float = liveness_interval
+        self.backoff_min: float = backoff_min
+        self.backoff_max: float = backoff_max
+
+        # Called from the supervisor thread when sing-box goes down / is back up
+        self.on_down: Optional[Callable[[], None]] = None
+        self.on_up: Optional[Callable[[], None]] = None
+
+        self.restart_count: int = 0
+        self.last_downtime: float = 0.0
+        self.total_downtime: float = 0.0
+
+        self._delay: float = 0.0
+        self._restart_requested: bool = False
+        self._started_at: float = time.monotonic()
+        self._wake = Event()
+        self._stopping = Event()
+
+    def request_restart(self):
+        """Restarts sing-box through the normal recovery path (e.g. after a config change)."""
+        self._restart_requested = True
+        self.drover.terminate_singbox()
+
+    def stop(self):
+        """Stops supervising; the current process is left to the caller."""
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            reason = self._watch()
+            if self._stopping.is_set():
+                break
+            if self._restart_requested:
+                reason = "restart requested"
+
+            print(f"sing-box is down ({reason}), restarting...")
+            down_since = time.monotonic()
+            self._notify(self.on_down)
+
+            if not self._restart():
+                break
+
+            self.last_downtime = time.monotonic() - down_since
+            self.total_downtime += self.last_downtime
+            self.restart_count += 1
+            print(f"sing-box restarted (restart #{self.restart_count}, "
+                  f"downtime {self.last_downtime * 1000:.0f} ms)")
+            self._notify(self.on_up)
+
+    def _watch(self) -> str:
+        """Blocks until the current process exits or fails its liveness probes. Returns the reason."""
+        process = self.drover.sb_process
+        self._wake.clear()
+        Thread(target=self._wait_exit, args=(process,), name='sing-box-wait', daemon=True).start()
+
+        failures = 0
+        while not self._stopping.is_set():
+            if self._wake.wait(self.liveness_interval):
+                if self._stopping.is_set():
+                    break
+                exit_code = process.poll()
+                if exit_code is not None:
+                    return f"exit code {exit_code}"
+                # A late wake-up from the waiter of a previous process
+                self._wake.clear()
+                continue
+
+            if self.drover.is_singbox_alive():
+                failures = 0
+                continue
+
+            failures += 1
+            if failures >= LIVENESS_FAILURES:
+                return "Clash API not responding"
+
+        return "stopped"
+
+    def _wait_exit(self, process):
+        process.wait()
+        self._wake.set()
+
+    def _restart(self) -> bool:
+        """Restarts sing-box with capped exponential backoff. Returns False if stopped meanwhile."""
+        # The first restart is immediate unless sing-box keeps crashing right after starting
+        if time.monotonic() - self._started_at >= STABLE_UPTIME or self._restart_requested:
+            self._delay = 0.0
+        self._restart_requested = False
+
+        while not self._stopping.is_set():
+            if self._delay and self._stopping.wait(self._delay):
+                return False
+            self._delay = min(max(self._delay * 2, self.backoff_min), self.backoff_max)
+
+            self.drover.terminate_singbox()
+            error = self.drover.start_singbox(self.drover.sb_exe_path, self.drover.sb_config_path)
+            if self._stopping.is_set():
+                # stop_singbox() ran while we were starting, don't leave an orphan behind
+                self.drover.terminate_singbox()
+                return False
+            if not error:
+                error = self.drover.wait_until_ready()
+            if not error:
+                self._started_at = time.monotonic()
+                self.drover.reapply_selectors()
+                return True
+
+            print(f"sing-box restart failed: {error}")
+
+        return False
+
+    def _notify(self, callback: Optional[Callable[[], None]]):
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            print(f"Supervisor callback failed: {e}")
@@ -1,9 +1,8 @@
 # system_proxy.py
 
 import sys
-import os
 import subprocess
-from typing import Union
+from typing import Optional
 
 # --- Windows Implementation ---
 if sys.platform == "win32":
@@ -48,6 +47,9 @@ if sys.platform == "win32":
             print(f"Error enabling system proxy: {e}")
             return False
 
+    def set_system_proxy_backend(name: str = 'auto', home: Optional[str] = None):
+        """Windows always uses the registry; kept for the same interface as other platforms."""
+
     def disable_system_proxy() -> bool:
         """Disables system-wide proxy using winreg for Windows."""
         if not winreg:
@@ -71,15 +73,26 @@ if sys.platform == "win32":
             print(f"Error disabling system proxy: {e}")
             return False
 
-# --- Linux/Cross-Platform Fallback (Often requires DE-specific tools like gsettings) ---
+# --- Linux and other desktops: GNOME (dconf), KDE (kioslaverc) or an environment file ---
 else:
-    # A complete solution for Linux would involve interacting with D-Bus/GSettings/KDE config.
-    # For a simplified, application-specific approach, we can rely on environment variables,
-    # but this does not set the *system* proxy for all applications.
-    # We will raise a NotImplementedError to signal the need for platform-specific implementation.
+    from proxy_backends import ProxyBackend, ProxyState, create_backend
+
+    _backend: Optional[ProxyBackend] = None
+
+    def set_system_proxy_backend(name: str = 'auto', home: Optional[str] = None):
+        """Selects the backend ('auto', 'gnome', 'kde' or 'env')."""
+        global _backend
+        _backend = create_backend(name, home)
+
+    def _get_backend() -> ProxyBackend:
+        if _backend is None:
+            set_system_proxy_backend()
+        return _backend
 
     def enable_system_proxy(host: str, port: int) -> bool:
-        return NotImplementedError(f"System proxy not implemented for {sys.platform}. Requires OS-specific tools (e.g., GSettings on Linux).")
+        """Points the desktop's proxy settings at the local sing-box inbound."""
+        return _get_backend().apply(ProxyState(True, host, port))
 
     def disable_system_proxy() -> bool:
-        return NotImplementedError(f"System proxy not implemented for {sys.platform}. Requires OS-specific tools (e.g., GSettings on Linux).")
+        """Switches the desktop's proxy settings off (the proxy address is kept)."""
+        return _get_backend().apply(ProxyState(False))
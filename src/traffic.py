@@ -0,0 +1,327 @@
+# traffic.py
+
+import heapq
+import json
+import time
+from array import array
+from threading import Thread, Event, Lock
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from clash_api import ClashApiClient
+
+# Rate thresholds (bytes per second) between throughput levels: below the first
+# one is level 0 (idle), above the last one is level len(TRAFFIC_THRESHOLDS)
+TRAFFIC_THRESHOLDS = (4 * 1024, 128 * 1024, 2 * 1024 * 1024)
+
+# sing-box sends a sample every second; a silent stream this long is considered dead
+TRAFFIC_READ_TIMEOUT = 5.0
+TRAFFIC_RETRY_MIN = 1.0
+TRAFFIC_RETRY_MAX = 30.0
+
+# Hosts whose totals are kept; the smallest ones are dropped beyond this
+MAX_TRACKED_HOSTS = 512
+
+
+def traffic_level(rate: float, thresholds: Sequence[int] = TRAFFIC_THRESHOLDS) -> int:
+    """Quantizes a rate into 0 (idle) .. len(thresholds)."""
+    level = 0
+    for threshold in thresholds:
+        if rate < threshold:
+            break
+        level += 1
+    return level
+
+
+class RingBuffer:
+    """Fixed-size history of floats; the oldest sample is overwritten once full."""
+    __slots__ = ('data', 'start', 'count')
+
+    def __init__(self, size: int):
+        self.data = array('d', bytes(8 * max(1, size)))
+        self.start: int = 0
+        self.count: int = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, value: float):
+        size = len(self.data)
+        if self.count < size:
+            self.data[(self.start + self.count) % size] = value
+            self.count += 1
+        else:
+            self.data[self.start] = value
+            self.start = (self.start + 1) % size
+
+    def values(self) -> List[float]:
+        """Samples from oldest to newest."""
+        end = self.start + self.count
+        if end <= len(self.data):
+            return self.data[self.start:end].tolist()
+        return self.data[self.start:].tolist() + self.data[:end - len(self.data)].tolist()
+
+    def last(self) -> float:
+        return self.data[(self.start + self.count - 1) % len(self.data)] if self.count else 0.0
+
+
+class TrafficMonitor(Thread):
+    """
+    Follows the Clash API /traffic stream (one {"up", "down"} sample per second).
+    Listeners only hear about the quantized (up, down) levels, and at most once
+    per `min_interval` seconds, so the tray is redrawn when the picture changes
+    rather than on every sample. The stream is reopened with backoff whenever
+    it breaks, e.g. while sing-box is restarted.
+    """
+    def __init__(self, api: ClashApiClient, min_interval: float = 1.0,
+                 thresholds: Sequence[int] = TRAFFIC_THRESHOLDS, history: int = 300):
+        super().__init__(name='traffic-monitor', daemon=True)
+        self.api = api
+        self.min_interval: float = min_interval
+        self.thresholds: Sequence[int] = thresholds
+        # Per-second rates of the last `history` samples
+        self.up_history = RingBuffer(history)
+        self.down_history = RingBuffer(history)
+
+        # Called with (up level, down level) from the monitor thread
+        self.on_level: Optional[Callable[[int, int], None]] = None
+
+        # Latest sample in bytes per second
+        self.up: int = 0
+        self.down: int = 0
+        self.level: Tuple[int, int] = (0, 0)
+        self._emitted_at: float = 0.0
+
+        self._response: Optional[requests.Response] = None
+        self._response_lock = Lock()
+        self._stopping = Event()
+
+    def stop(self):
+        self._stopping.set()
+        # Closing the response unblocks the read in run()
+        with self._response_lock:
+            if self._response is not None:
+                self._response.close()
+
+    def run(self):
+        delay = TRAFFIC_RETRY_MIN
+        while not self._stopping.is_set():
+            response = self.api.stream('/traffic', read_timeout=TRAFFIC_READ_TIMEOUT)
+            if response is not None:
+                with self._response_lock:
+                    self._response = response
+                if self._stopping.is_set():
+                    response.close()
+                    break
+                if self._follow(response):
+                    delay = TRAFFIC_RETRY_MIN
+                with self._response_lock:
+                    self._response = None
+                response.close()
+
+            # The stream is gone, so is the traffic it was reporting
+            self.sample(0, 0, force=True)
+            if self._stopping.wait(delay):
+                break
+            delay = min(delay * 2, TRAFFIC_RETRY_MAX)
+
+    def _follow(self, response: requests.Response) -> bool:
+        """Reads samples until the stream ends; returns True if at least one arrived."""
+        received = False
+        try:
+            for line in response.iter_lines(chunk_size=None):
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                    up, down = int(data.get('up', 0)), int(data.get('down', 0))
+                except (ValueError, TypeError, AttributeError):
+                    continue
+                self.up_history.append(up)
+                self.down_history.append(down)
+                self.sample(up, down)
+                received = True
+        except (requests.exceptions.RequestException, AttributeError, OSError):
+            # Timeouts, connection resets, or the response closed by stop()
+            pass
+        return received
+
+    def sample(self, up: int, down: int, force: bool = False):
+        self.up, self.down = up, down
+        level = (traffic_level(up, self.thresholds), traffic_level(down, self.thresholds))
+        if level == self.level:
+            return
+        # A change inside the throttle window is picked up by a later sample
+        now = time.monotonic()
+        if not force and now - self._emitted_at < self.min_interval:
+            return
+
+        self.level = level
+        self._emitted_at = now
+        if self.on_level is not None:
+            try:
+                self.on_level(*level)
+            except Exception as e:
+                print(f"Traffic callback failed: {e}")
+
+
+class ConnectionEntry:
+    """What we remember of an open connection between two snapshots."""
+    __slots__ = ('outbound', 'groups', 'host', 'upload', 'download')
+
+    def __init__(self, outbound: str, groups: Tuple[str, ...], host: str):
+        self.outbound: str = outbound
+        self.groups: Tuple[str, ...] = groups
+        self.host: str = host
+        self.upload: int = 0
+        self.download: int = 0
+
+
+class ConnectionMonitor(Thread):
+    """
+    Polls /connections and turns successive snapshots into per-outbound,
+    per-group and per-host byte rates. Snapshots are diffed by connection id:
+    each connection contributes only the bytes it moved since the previous
+    snapshot, so rates and running totals are updated incrementally instead of
+    being re-summed from every connection's lifetime counters. Closed
+    connections are forgotten, host totals are capped at MAX_TRACKED_HOSTS and
+    the history lives in fixed-size rings, so memory stays flat over long
+    uptimes.
+    """
+    def __init__(self, api: ClashApiClient, interval: float = 2.0, history: int = 300,
+                 max_hosts: int = MAX_TRACKED_HOSTS):
+        super().__init__(name='connection-monitor', daemon=True)
+        self.api = api
+        self.interval: float = interval
+        self.max_hosts: int = max_hosts
+
+        self.connections: Dict[str, ConnectionEntry] = {}
+        # Bytes per second during the last interval, {name: (up, down)}
+        self.outbound_rates: Dict[str, Tuple[float, float]] = {}
+        self.group_rates: Dict[str, Tuple[float, float]] = {}
+        self.host_rates: Dict[str, Tuple[float, float]] = {}
+        # Bytes moved since the monitor started, {name: up + down}
+        self.outbound_totals: Dict[str, int] = {}
+        self.host_totals: Dict[str, int] = {}
+        # Open connections per poll
+        self.count_history = RingBuffer(history)
+
+        self._lock = Lock()
+        self._polled_at: Optional[float] = None
+        self._stopping = Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            # The next tick is the retry; a sing-box restart must not print on every tick
+            snapshot = self.api.get_json('/connections', retries=0, quiet=True)
+            if isinstance(snapshot, dict):
+                self.update(snapshot.get('connections') or [], time.monotonic())
+            else:
+                # sing-box is down or restarting: nothing is flowing
+                self.update([], time.monotonic())
+
+    def update(self, connections: List[dict], now: float):
+        """Applies one /connections snapshot taken at `now` (monotonic seconds)."""
+        # The first snapshot only sets the baseline, its lifetime counters are not a rate
+        baseline = self._polled_at is None
+        elapsed = now - self._polled_at if not baseline else 0.0
+        self._polled_at = now
+
+        known = self.connections
+        current: Dict[str, ConnectionEntry] = {}
+        outbound_bytes: Dict[str, List[int]] = {}
+        group_bytes: Dict[str, List[int]] = {}
+        host_bytes: Dict[str, List[int]] = {}
+
+        for conn in connections:
+            conn_id = conn.get('id') if isinstance(conn, dict) else None
+            if conn_id is None:
+                continue
+            entry = known.get(conn_id)
+            if entry is None:
+                chains = conn.get('chains') or ['']
+                metadata = conn.get('metadata') or {}
+                host = metadata.get('host') or metadata.get('destinationIP') or ''
+                entry = ConnectionEntry(chains[0], tuple(chains[1:]), host)
+            current[conn_id] = entry
+
+            upload, download = conn.get('upload') or 0, conn.get('download') or 0
+            delta_up, delta_down = upload - entry.upload, download - entry.download
+            entry.upload, entry.download = upload, download
+            if baseline or (delta_up <= 0 and delta_down <= 0):
+                continue
+
+            for name, target in ((entry.outbound, outbound_bytes), (entry.host, host_bytes)):
+                counters = target.get(name)
+                if counters is None:
+                    target[name] = [delta_up, delta_down]
+                else:
+                    counters[0] += delta_up
+                    counters[1] += delta_down
+            for group in entry.groups:
+                counters = group_bytes.get(group)
+                if counters is None:
+                    group_bytes[group] = [delta_up, delta_down]
+                else:
+                    counters[0] += delta_up
+                    counters[1] += delta_down
+
+        def rates(counters: Dict[str, List[int]]) -> Dict[str, Tuple[float, float]]:
+            if elapsed <= 0:
+                return {}
+            return {name: (up / elapsed, down / elapsed) for name, (up, down) in counters.items()}
+
+        with self._lock:
+            # Connections missing from the snapshot were closed and are dropped here
+            self.connections = current
+            self.outbound_rates = rates(outbound_bytes)
+            self.group_rates = rates(group_bytes)
+            self.host_rates = rates(host_bytes)
+            for name, (up, down) in outbound_bytes.items():
+                self.outbound_totals[name] = self.outbound_totals.get(name, 0) + up + down
+            for name, (up, down) in host_bytes.items():
+                self.host_totals[name] = self.host_totals.get(name, 0) + up + down
+            if len(self.host_totals) > 2 * self.max_hosts:
+                self.host_totals = dict(heapq.nlargest(self.max_hosts, self.host_totals.items(),
+                                                       key=lambda item: item[1]))
+            self.count_history.append(len(current))
+
+    @staticmethod
+    def _top(rates: Dict[str, Tuple[float, float]], totals: Dict[str, int],
+             count: int) -> List[Tuple[str, float, float]]:
+        """The busiest entries right now, then the largest totals to fill up the list."""
+        top = heapq.nlargest(count, rates.items(), key=lambda item: item[1][0] + item[1][1])
+        result = [(name, up, down) for name, (up, down) in top]
+        if len(result) < count:
+            seen = {name for name, _, _ in result}
+            for name, _ in heapq.nlargest(count, totals.items(), key=lambda item: item[1]):
+                if name not in seen and len(result) < count:
+                    result.append((name, 0.0, 0.0))
+        return result
+
+    def top_outbounds(self, count: int = 5) -> List[Tuple[str, float, float]]:
+        """[(outbound, up rate, down rate)] of the busiest outbounds."""
+        with self._lock:
+            return self._top(self.outbound_rates, self.outbound_totals, count)
+
+    def top_hosts(self, count: int = 5) -> List[Tuple[str, float, float]]:
+        """[(host, up rate, down rate)] of the busiest destinations."""
+        with self._lock:
+            return self._top(self.host_rates, self.host_totals, count)
+
+    def group_rate(self, name: str) -> Tuple[float, float]:
+        """(up, down) bytes per second currently going through a selector or other group."""
+        return self.group_rates.get(name, (0.0, 0.0))
+
+
+def format_rate(rate: float) -> str:
+    """Human readable bytes per second."""
+    for unit in ('B/s', 'KB/s', 'MB/s'):
+        if rate < 1024:
+            return f'{rate:.0f} {unit}' if unit == 'B/s' else f'{rate:.1f} {unit}'
+        rate /= 1024
+    return f'{rate:.1f} GB/s'
@@ -0,0 +1,9 @@
+# conftest.py
+#
+# The modules under src/ import each other by plain name (the app is run as
+# `python src/main.py` and frozen by PyInstaller), so the tests do the same.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
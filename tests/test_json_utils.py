@@ -0,0 +1,87 @@
+# test_json_utils.py
+
+import json
+import time
+
+import pytest
+
+from json_utils import loads_jsonc, normalize_json
+
+
+def assert_fast(text: str, limit: float = 1.0) -> str:
+    started = time.perf_counter()
+    normalized = normalize_json(text)
+    assert time.perf_counter() - started < limit
+    return normalized
+
+
+def test_keeps_offsets():
+    text = '{\n  // comment\n  "a": [1, 2, /* x\n y */ ],\n}\n'
+    normalized = normalize_json(text)
+    assert len(normalized) == len(text)
+    assert [i for i, c in enumerate(normalized) if c == '\n'] == [i for i, c in enumerate(text) if c == '\n']
+    assert json.loads(normalized) == {'a': [1, 2]}
+
+
+def test_removes_trailing_commas():
+    assert loads_jsonc('[[1,],{"a":[],},]') == [[1], {'a': []}]
+    assert loads_jsonc('{"a": 1 , \n }') == {'a': 1}
+
+
+def test_trailing_comma_before_comments():
+    assert loads_jsonc('[1, // one\n /* two */ ]') == [1]
+    assert loads_jsonc('[1, /* a */ /* b */ 2, ]') == [1, 2]
+    assert loads_jsonc('{"a": 1, /* b */ "b": 2}') == {'a': 1, 'b': 2}
+
+
+def test_strings_are_untouched():
+    text = '{"url": "https://a//b", "list": "x,]", "c": "/* not */", "q": "\\" // still a string",}'
+    assert loads_jsonc(text) == {
+        'url': 'https://a//b', 'list': 'x,]', 'c': '/* not */', 'q': '" // still a string'}
+
+
+def test_block_comments_do_not_nest():
+    # Like C, the first "*/" closes the comment, whatever "/*" it contains
+    assert loads_jsonc('[1, /* outer /* inner */ 2]') == [1, 2]
+    assert loads_jsonc('/**/[/***/1/* / * */]/*/ */') == [1]
+    with pytest.raises(json.JSONDecodeError):
+        loads_jsonc('[1 /* outer /* inner */ still outer */]')
+
+
+def test_errors_point_at_the_original_position():
+    with pytest.raises(json.JSONDecodeError) as error:
+        loads_jsonc('{\n  // c\n  "a": /}')
+    assert (error.value.lineno, error.value.colno) == (3, 8)
+
+    with pytest.raises(json.JSONDecodeError) as error:
+        loads_jsonc('{"a": "x}')
+    assert error.value.msg == 'Unterminated string' and error.value.pos == 6
+
+    with pytest.raises(json.JSONDecodeError) as error:
+        loads_jsonc('[1 /* x ]')
+    assert error.value.msg == 'Unterminated block comment' and error.value.pos == 3
+
+
+@pytest.mark.parametrize('text', [
+    '/' * 50000,
+    '[1, ' + '/' * 50000,
+    '[1, ' + '/' * 50000 + '\n]',
+    '[1, ' + '/ ' * 50000 + ']',
+    '[1,' + '/*/' * 20000 + ']',
+    '/*' + '*' * 50000,
+    '"' + '\\\\' * 50000,
+    '[' + ', /' * 20000,
+    '[1,' + ' ' * 50000,
+])
+def test_linear_on_pathological_input(text):
+    started = time.perf_counter()
+    try:
+        assert len(normalize_json(text)) == len(text)
+    except json.JSONDecodeError:
+        pass
+    assert time.perf_counter() - started < 1.0
+
+
+def test_long_slash_runs_in_comments_and_strings():
+    text = '[1, // ' + '/' * 50000 + '\n "' + '/' * 50000 + '", ]'
+    assert json.loads(assert_fast(text)) == [1, '/' * 50000]
@@ -0,0 +1,59 @@
+# test_metrics.py
+
+import cProfile
+import pstats
+import threading
+
+import pytest
+
+from metrics import ProfileSession
+
+
+def busy(n: int) -> int:
+    return sum(range(n))
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = ProfileSession()
+    session.output_dir = str(tmp_path)
+    session.start(3600)
+    return session
+
+
+def test_calls_from_several_threads_end_up_in_one_profile(session):
+    barrier = threading.Barrier(4)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(session.call(busy, 100000))
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [busy(100000)] * 4
+    path = session.finish()
+    calls = {func[2]: stat[1] for func, stat in pstats.Stats(path).stats.items()}
+    # The shared profiler of 3.12+ keeps one call stack, overlapping threads can blur the counts
+    assert 0 < calls['busy'] <= 4
+
+
+def test_profiler_that_cannot_start_leaves_the_call_alone(session, monkeypatch, capsys):
+    class Taken(cProfile.Profile):
+        def enable(self, *args, **kwargs):
+            raise ValueError('Another profiling tool is already active')
+    monkeypatch.setattr(cProfile, 'Profile', Taken)
+
+    assert session.call(busy, 10) == busy(10)
+    assert session.call(busy, 10) == busy(10)
+    assert capsys.readouterr().out.count('Profiling unavailable') == 1
+    assert session.finish() is None
+
+
+def test_errors_of_the_call_are_not_swallowed(session):
+    with pytest.raises(ZeroDivisionError):
+        session.call(lambda: 1 / 0)
+    assert session.call(busy, 10) == busy(10)
@@ -0,0 +1,214 @@
+# test_proxy_backends.py
+
+import os
+import sys
+import textwrap
+
+import pytest
+
+from proxy_backends import (EnvFileProxyBackend, GnomeProxyBackend, KdeProxyBackend, ProxyState,
+                            parse_keyfile)
+
+ENABLED = ProxyState(True, '127.0.0.1', 2080)
+DISABLED = ProxyState(False)
+
+# A dconf stand-in keeping its database in a keyfile; every run is logged
+FAKE_DCONF = '''
+import os, sys
+sys.path.insert(0, {src!r})
+from proxy_backends import parse_keyfile
+
+db, log = os.environ['FAKE_DCONF_DB'], os.environ['FAKE_DCONF_LOG']
+with open(log, 'a') as f:
+    f.write(sys.argv[1] + '\\n')
+try:
+    with open(db) as f:
+        sections = parse_keyfile(f.read())
+except FileNotFoundError:
+    sections = {{}}
+if sys.argv[1] == 'load':
+    for name, values in parse_keyfile(sys.stdin.read()).items():
+        sections.setdefault(name, {{}}).update(values)
+    with open(db, 'w') as f:
+        for name, values in sections.items():
+            f.write('[' + name + ']\\n' + ''.join(k + '=' + v + '\\n' for k, v in values.items()) + '\\n')
+elif sys.argv[1] == 'dump':
+    for name, values in sections.items():
+        sys.stdout.write('[' + name + ']\\n' + ''.join(k + '=' + v + '\\n' for k, v in values.items()) + '\\n')
+'''
+
+FAKE_DBUS_SEND = '''
+import os, sys
+with open(os.environ['FAKE_DBUS_LOG'], 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\\n')
+'''
+
+
+def make_executable(path, source: str) -> str:
+    path.write_text(f'#!{sys.executable}\n' + source)
+    path.chmod(0o755)
+    return str(path)
+
+
+def read_log(path) -> list:
+    return path.read_text().splitlines() if path.exists() else []
+
+
+@pytest.fixture
+def gnome(tmp_path):
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+    dconf = make_executable(tmp_path / 'dconf', FAKE_DCONF.format(src=os.path.abspath(src)))
+    log = tmp_path / 'dconf.log'
+    backend = GnomeProxyBackend(dconf=dconf, env={'FAKE_DCONF_DB': str(tmp_path / 'db'),
+                                                  'FAKE_DCONF_LOG': str(log)})
+    return backend, log, tmp_path / 'db'
+
+
+@pytest.fixture
+def kde(tmp_path, monkeypatch):
+    log = tmp_path / 'dbus.log'
+    monkeypatch.setenv('FAKE_DBUS_LOG', str(log))
+    dbus_send = make_executable(tmp_path / 'dbus-send', FAKE_DBUS_SEND)
+    backend = KdeProxyBackend(home=str(tmp_path / 'home'), dbus_send=dbus_send)
+    return backend, log
+
+
+def test_gnome_round_trip(gnome):
+    backend, log, db = gnome
+    assert backend.read_state().satisfies(DISABLED)
+
+    assert backend.apply(ENABLED)
+    state = backend.read_state()
+    assert state.satisfies(ENABLED) and state.bypass == ENABLED.bypass
+    sections = parse_keyfile(db.read_text())
+    assert sections['/']['mode'] == "'manual'"
+    assert {sections[scheme]['port'] for scheme in ('http', 'https', 'socks')} == {'2080'}
+
+    assert backend.apply(DISABLED)
+    assert backend.read_state().satisfies(DISABLED)
+    assert read_log(log) == ['dump', 'dump', 'load', 'dump', 'dump', 'load', 'dump']
+
+
+def test_gnome_same_settings_twice_only_reads(gnome):
+    backend, log, _ = gnome
+    assert backend.apply(ENABLED)
+    assert read_log(log) == ['dump', 'load']
+    assert backend.apply(ENABLED)
+    assert read_log(log) == ['dump', 'load', 'dump']
+
+
+def test_gnome_other_port_is_rewritten(gnome):
+    backend, log, _ = gnome
+    backend.apply(ENABLED)
+    assert backend.apply(ProxyState(True, '127.0.0.1', 2081))
+    assert read_log(log)[-1] == 'load'
+    assert backend.read_state().port == 2081
+
+
+def test_gnome_failure_is_reported(tmp_path):
+    backend = GnomeProxyBackend(dconf=make_executable(tmp_path / 'dconf', 'import sys; sys.exit(3)'))
+    assert not backend.apply(ENABLED)
+
+
+def test_kde_round_trip(kde):
+    backend, log = kde
+    assert backend.read_state().satisfies(DISABLED)
+
+    assert backend.apply(ENABLED)
+    assert backend.read_state().satisfies(ENABLED)
+    with open(backend.path, encoding='utf-8') as f:
+        text = f.read()
+    assert '[Proxy Settings]\nProxyType=1\nhttpProxy=http://127.0.0.1 2080\n' in text
+
+    assert backend.apply(DISABLED)
+    assert backend.read_state().satisfies(DISABLED)
+    assert len(read_log(log)) == 2
+    assert 'org.kde.KIO.Scheduler.reparseSlaveConfiguration' in read_log(log)[0]
+
+
+def test_kde_same_settings_twice_writes_once(kde):
+    backend, log = kde
+    assert backend.apply(ENABLED)
+    inode = os.stat(backend.path).st_ino
+    assert backend.apply(ENABLED)
+    assert os.stat(backend.path).st_ino == inode
+    assert len(read_log(log)) == 1
+
+
+def test_kde_keeps_unrelated_keys(kde):
+    backend, _ = kde
+    original = textwrap.dedent('''\
+        [$Version]
+        update_info=kioslave.upd:change-proxy-key-to-bool
+
+        [Proxy Settings]
+        # managed by hand before
+        AuthMode=0
+        ReversedException=false
+        ProxyType=0
+
+        [Cache Settings]
+        MaxCacheSize=5120
+        ''')
+    os.makedirs(os.path.dirname(backend.path))
+    with open(backend.path, 'w', encoding='utf-8') as f:
+        f.write(original)
+
+    assert backend.apply(ENABLED)
+    with open(backend.path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    for line in original.splitlines():
+        if not line.startswith('ProxyType'):
+            assert line in lines
+    proxy_section = lines[lines.index('[Proxy Settings]') + 1:lines.index('[Cache Settings]')]
+    assert 'NoProxyFor=localhost,127.0.0.0/8,::1' in proxy_section
+    assert proxy_section[-1] == ''
+
+    assert backend.apply(DISABLED)
+    with open(backend.path, encoding='utf-8') as f:
+        text = f.read()
+    assert 'ProxyType=0' in text and 'MaxCacheSize=5120' in text and 'AuthMode=0' in text
+
+
+def test_kde_without_dbus_send(tmp_path):
+    backend = KdeProxyBackend(home=str(tmp_path), dbus_send=str(tmp_path / 'missing'))
+    assert backend.apply(ENABLED)
+    assert backend.read_state().satisfies(ENABLED)
+
+
+def test_env_file_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path / 'config'))
+    backend = EnvFileProxyBackend()
+    assert backend.path == str(tmp_path / 'config' / 'SingDrover' / 'proxy.env')
+    assert backend.read_state().satisfies(DISABLED)
+
+    assert backend.apply(ENABLED)
+    with open(backend.path, encoding='utf-8') as f:
+        text = f.read()
+    assert "export http_proxy='http://127.0.0.1:2080'\n" in text
+    assert "export ALL_PROXY='socks5://127.0.0.1:2080'\n" in text
+    assert backend.read_state().satisfies(ENABLED)
+
+    assert backend.apply(DISABLED)
+    with open(backend.path, encoding='utf-8') as f:
+        assert f.read().startswith('unset http_proxy HTTP_PROXY')
+    assert backend.read_state().satisfies(DISABLED)
+
+
+def test_env_file_same_settings_twice_writes_once(tmp_path):
+    backend = EnvFileProxyBackend(home=str(tmp_path))
+    assert backend.apply(ENABLED)
+    inode = os.stat(backend.path).st_ino
+    assert backend.apply(ENABLED)
+    assert os.stat(backend.path).st_ino == inode
+
+
+def test_env_file_edited_by_hand_is_rewritten(tmp_path):
+    backend = EnvFileProxyBackend(home=str(tmp_path))
+    backend.apply(ENABLED)
+    with open(backend.path, 'a', encoding='utf-8') as f:
+        f.write('export EXTRA=1\n')
+    assert backend.read_state() is None
+    assert backend.apply(ENABLED)
+    with open(backend.path, encoding='utf-8') as f:
+        assert f.read() == backend.render(ENABLED)
@@ -0,0 +1,122 @@
+# test_subscriptions.py
+
+import textwrap
+
+import pytest
+
+from json_utils import loads_jsonc
+from subscriptions import SubscriptionManager
+
+HAND_MADE = textwrap.dedent('''\
+    // my own exit, keep it formatted like this
+        {
+          "type":   "vless",   "tag": "hand-made",
+          /* the server */ "server": "a.example.com", "server_port": 443,
+          "uuid": "00000000-0000-0000-0000-000000000000", // trailing note
+        }''')
+
+CONFIG = '''{
+  // main config
+  "log": {"level": "info"},
+  "outbounds": [
+    ''' + HAND_MADE + ''',
+    {
+      "type": "selector",
+      "tag": "proxy",
+      // members
+      "outbounds": [
+        "hand-made",
+        "direct"
+      ],
+      "default": "hand-made"
+    },
+    {"type": "selector", "tag": "other", "outbounds": ["direct"], "default": "direct"}, // untouched group
+    {"type": "direct", "tag": "direct"},
+  ],
+  "route": {"final": "proxy"} /* after the outbounds */
+}
+'''
+
+
+def trojan(*names: str) -> str:
+    return ''.join(f'trojan://pw@{name}.example.com:443#{name}\n' for name in names)
+
+
+@pytest.fixture
+def setup(tmp_path):
+    config = tmp_path / 'config.json'
+    config.write_text(CONFIG, encoding='utf-8')
+    nodes = tmp_path / 'nodes.txt'
+
+    def manager(selectors=('proxy',)):
+        return SubscriptionManager([{'path': str(nodes), 'selectors': list(selectors)}],
+                                   str(config), str(tmp_path / 'state'))
+    return config, nodes, manager
+
+
+def outbounds(config) -> dict:
+    return {item['tag']: item for item in loads_jsonc(config.read_text(encoding='utf-8'))['outbounds']}
+
+
+def test_hand_formatted_outbounds_survive_byte_for_byte(setup):
+    config, nodes, manager = setup
+    nodes.write_text(trojan('node-1', 'node-2'), encoding='utf-8')
+    subscriptions = manager()
+    assert subscriptions.refresh()
+
+    text = config.read_text(encoding='utf-8')
+    assert HAND_MADE in text
+    assert '    {"type": "selector", "tag": "other", "outbounds": ["direct"], "default": "direct"}, // untouched group\n' in text
+    assert text.startswith(CONFIG[:CONFIG.index('"outbounds"')])
+    assert text.endswith('  ],\n  "route": {"final": "proxy"} /* after the outbounds */\n}\n')
+    # The group's member list is rewritten in the layout it had, its comment is kept
+    assert '      // members\n      "outbounds": [\n        "hand-made",\n        "direct",\n        "node-1",\n' in text
+    assert outbounds(config)['proxy']['outbounds'] == ['hand-made', 'direct', 'node-1', 'node-2']
+
+    # A second merge replaces the nodes in place and still copies the rest
+    nodes.write_text(trojan('node-3'), encoding='utf-8')
+    assert subscriptions.refresh()
+    text = config.read_text(encoding='utf-8')
+    assert HAND_MADE in text and 'node-1' not in text
+    assert list(outbounds(config)) == ['hand-made', 'proxy', 'other', 'direct', 'node-3']
+
+    # A fresh manager (no cached layout) sees the same config
+    nodes.write_text(trojan('node-3', 'node-4'), encoding='utf-8')
+    assert manager().refresh()
+    assert HAND_MADE in config.read_text(encoding='utf-8')
+    assert outbounds(config)['proxy']['outbounds'] == ['hand-made', 'direct', 'node-3', 'node-4']
+
+
+def test_unchanged_nodes_leave_the_config_alone(setup):
+    config, nodes, manager = setup
+    nodes.write_text(trojan('node-1'), encoding='utf-8')
+    subscriptions = manager()
+    subscriptions.refresh()
+    written = config.read_bytes()
+    nodes.write_text('# a comment\n' + trojan('node-1'), encoding='utf-8')
+    assert subscriptions.refresh() == []
+    assert config.read_bytes() == written
+
+
+def test_default_on_a_removed_node_is_dropped(setup):
+    config, nodes, manager = setup
+    nodes.write_text(trojan('node-1', 'node-2'), encoding='utf-8')
+    subscriptions = manager(selectors=('proxy', 'other'))
+    subscriptions.refresh()
+
+    # Point the groups' defaults at a node, the way a user would pick one
+    text = config.read_text(encoding='utf-8')
+    text = text.replace('"default": "hand-made"', '"default": "node-2"')
+    text = text.replace('"default": "direct"}', '"default": "node-2"}')
+    config.write_text(text, encoding='utf-8')
+
+    nodes.write_text(trojan('node-1'), encoding='utf-8')
+    assert subscriptions.refresh()
+    text = config.read_text(encoding='utf-8')
+    groups = outbounds(config)
+    assert 'default' not in groups['proxy'] and 'default' not in groups['other']
+    assert groups['other']['outbounds'] == ['direct', 'node-1']
+    # The member went with its line; the rest of the group is as written
+    assert '        "node-1"\n      ]\n    },\n' in text
+    assert '{"type": "selector", "tag": "other", "outbounds": ["direct", "node-1"]}, // untouched group' in text
+    assert HAND_MADE in text